@@ -0,0 +1,284 @@
+# language=rst
+"""
+Per-call latency of the hot paths in :mod:`pseudomat.common`: encoding,
+fingerprints, JWS parsing and verification, and every public function in
+:mod:`pseudomat.common.database`.
+
+Each database function is measured warm, as the server calls it, and cold,
+as the first call after :func:`~pseudomat.common.database.initialize_database`,
+with a new engine, empty statement caches and a new SQLite connection.
+
+Run with::
+
+    python benchmarks/bench_common.py [-k SUBSTRING] [--json FILE] [--compare FILE]
+
+``--json`` writes the results as JSON, and ``--compare`` compares them with
+the results in a file that an earlier ``--json`` wrote, and exits with status
+1 if any benchmark got slower by more than ``--tolerance``. Only compare
+results from the same machine. See also the ``bench-baseline`` and
+``bench-compare`` targets in the Makefile.
+"""
+
+import argparse
+import functools
+import itertools
+import json
+import pathlib
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import typing as T
+
+from pseudomat import common
+from pseudomat.cli.actions import invite, project
+from pseudomat.common import codec, database
+
+PROJECTS = 100
+MEMBERS = 200
+"""Members of the project that the member benchmarks read."""
+COLD_REPEAT = 20
+
+
+class Result(T.NamedTuple):
+    best: float
+    """Microseconds per call, in the fastest repeat."""
+    median: float
+    """Microseconds per call, in the median repeat."""
+    number: int
+    """Calls per repeat."""
+
+
+def measure(call: T.Callable[[], T.Any], number: int, repeat: int = 5,
+            setup: T.Optional[T.Callable[[], T.Any]] = None) -> Result:
+    # language=rst
+    """
+    Times *repeat* runs of *number* calls, each run after an untimed *setup*.
+    """
+    if setup is not None:
+        setup()
+    call()  # Warm up.
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            call()
+        times.append((time.perf_counter() - start) / number * 1e6)
+    return Result(min(times), statistics.median(times), number)
+
+
+def encoding_benchmarks(number: int) -> T.Iterator[T.Tuple[str, T.Callable[[], Result]]]:
+    data = bytes(range(256)) * 4
+    encoded = common.b64encode(data)
+    payload = common.SignedObject(project.generate_project('owner@example.com', 'Benchmark project')['jws']).payload
+    yield 'b64encode (1 KiB)', functools.partial(measure, lambda: common.b64encode(data), number)
+    yield 'b64decode (1 KiB)', functools.partial(measure, lambda: common.b64decode(encoded), number)
+    yield 'json_dumps (project)', functools.partial(measure, lambda: common.json_dumps(payload), number)
+    for name, dumps in sorted(codec.BACKENDS.items()):
+        yield 'codec %s (project)' % name, functools.partial(measure, lambda dumps=dumps: dumps(payload), number)
+    yield 'fingerprint (str)', functools.partial(measure, lambda: common.fingerprint('Benchmark project'), number)
+    yield 'fingerprint (dict)', functools.partial(measure, lambda: common.fingerprint(payload), number)
+
+
+def jws_benchmarks(number: int) -> T.Iterator[T.Tuple[str, T.Callable[[], Result]]]:
+    created = project.generate_project('owner@example.com', 'Benchmark project')
+    project_jws = created['jws']
+    invite_jws = invite.generate_invite(created['jti'], created['ssig'], 'Supplier')['pjws']
+    project_key = common.load_public_jwk(created['psig'])
+    decoder = common.SignedObject(project_jws)
+    yield 'SignedObject (parse)', functools.partial(measure, lambda: common.SignedObject(project_jws).payload, number)
+    yield 'SignedObject.validate', functools.partial(measure, lambda: decoder.validate(project_key), number)
+    yield 'validate_project_jws', functools.partial(measure, lambda: common.validate_project_jws(project_jws), number)
+    yield 'validate_invite_jws', functools.partial(
+        measure, lambda: common.validate_invite_jws(invite_jws, project_key), number
+    )
+
+
+def _populate() -> T.Tuple[str, T.List[str]]:
+    # language=rst
+    """
+    Returns:
+        the id of a project with :data:`MEMBERS` members, and the ids of those
+        members, in order.
+    """
+    for i in range(PROJECTS):
+        sub = 'Project %d' % i
+        database.create_project(
+            jti=common.fingerprint(sub), iss='owner@example.com', sub=sub, psig='{}', penc='{}', jws='jws %d' % i
+        )
+    project_id = common.fingerprint('Project 0')
+    members = []
+    with database.transaction() as c:
+        for i in range(MEMBERS):
+            jti = common.fingerprint([project_id, 'Member %d' % i])
+            database.create_invite(jti=jti, iss=project_id, sub='Member %d' % i, psig='{}', penc='{}',
+                                   jws='jws', conn=c)
+            members.append(jti)
+    return project_id, members
+
+
+def database_benchmarks(number: int, profile: str) -> T.Iterator[T.Tuple[str, T.Callable[[], Result]]]:
+    psig = project.generate_project('owner@example.com', 'Key project')['psig']
+    with tempfile.TemporaryDirectory() as tmp:
+        path = pathlib.Path(tmp) / 'bench.sqlite'
+        database.initialize_database(path, profile)
+        project_id, members = _populate()
+        database.set_config('benchmark', 'value')
+        database.create_project(jti='k' * 32, iss='owner@example.com', sub='Key project', psig=psig, penc='{}',
+                                jws='jws')
+        half = members[MEMBERS // 2]
+        counter = itertools.count()
+
+        reads = [
+            ('get_project', lambda: database.get_project(project_id)),
+            ('get_project_key', lambda: database.get_project_key('k' * 32)),
+            ('get_projects', lambda: database.get_projects()),
+            ('get_member_chain_tail', lambda: database.get_member_chain_tail(project_id)),
+            ('iter_members (page of 100)', lambda: list(database.iter_members(project_id, 100, half))),
+            ('iter_member_chain', lambda: list(database.iter_member_chain(project_id))),
+            ('count_members', lambda: database.count_members(project_id)),
+            ('get_member_jws', lambda: database.get_member_jws(half)),
+            ('get_config', lambda: database.get_config('benchmark')),
+            ('count_key_pairs', lambda: database.count_key_pairs()),
+        ]
+        for name, f in reads:
+            yield '%s (warm)' % name, functools.partial(measure, f, number)
+
+        def create_project() -> str:
+            sub = 'Benchmark project %d' % next(counter)
+            jti = common.fingerprint(sub)
+            database.create_project(jti=jti, iss='owner@example.com', sub=sub, psig='{}', penc='{}', jws='jws')
+            return jti
+
+        def create_invite() -> str:
+            sub = 'Benchmark member %d' % next(counter)
+            jti = common.fingerprint([project_id, sub])
+            database.create_invite(jti=jti, iss=project_id, sub=sub, psig='{}', penc='{}', jws='jws')
+            return jti
+
+        # Writes commit, so they’re orders of magnitude slower than reads:
+        writes = max(number // 100, 10)
+        yield 'create_project', functools.partial(measure, create_project, writes)
+        yield 'create_invite', functools.partial(measure, create_invite, writes)
+        yield 'set_config', functools.partial(
+            measure, lambda: database.set_config('benchmark', str(next(counter))), writes
+        )
+        yield 'add_key_pairs (1)', functools.partial(
+            measure, lambda: database.add_key_pairs([('ssig', 'senc')]), writes
+        )
+        yield 'take_key_pairs (1)', functools.partial(
+            measure, lambda: database.take_key_pairs(1), writes,
+            setup=lambda: database.add_key_pairs([('ssig', 'senc')] * (writes + 1))
+        )
+
+        # The ids of the projects or invites that the last setup created, for
+        # the calls to delete:
+        created = []
+
+        def create_projects():
+            created[:] = [create_project() for _ in range(writes + 1)]
+
+        def create_invites():
+            created[:] = [create_invite() for _ in range(writes + 1)]
+
+        yield 'delete_project', functools.partial(
+            measure, lambda: database.delete_project(created.pop()), writes, setup=create_projects
+        )
+        yield 'delete_invite', functools.partial(
+            measure, lambda: database.delete_invite(created.pop()), writes, setup=create_invites
+        )
+
+        def cold():
+            database.initialize_database(path, profile)
+            common.public_keys.clear()
+
+        for name, f in reads:
+            yield '%s (cold)' % name, functools.partial(measure, f, 1, repeat=COLD_REPEAT, setup=cold)
+        database.teardown_database()
+
+
+def run(number: int, profile: str, keyword: str = '') -> T.Dict[str, Result]:
+    results = {}
+    for name, benchmark in itertools.chain(
+        encoding_benchmarks(number), jws_benchmarks(number // 10), database_benchmarks(number // 10, profile)
+    ):
+        if keyword.lower() not in name.lower():
+            continue
+        results[name] = result = benchmark()
+        print('%-36s %10.1f µs/call (median %.1f)' % (name, result.best, result.median), file=sys.stderr)
+    return results
+
+
+def metadata(profile: str) -> dict:
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.node(),
+        'sqlite': sqlite3.sqlite_version,
+        'profile': profile,
+    }
+
+
+def compare(results: T.Dict[str, dict], baseline: T.Dict[str, dict], tolerance: float) -> T.List[str]:
+    # language=rst
+    """
+    Compares the best times of the benchmarks in both *results* and
+    *baseline*, and prints a table.
+
+    Returns:
+        the names of the benchmarks that are more than *tolerance* slower.
+    """
+    regressions = []
+    print('%-36s %10s %10s %8s' % ('benchmark', 'baseline', 'current', 'change'))
+    for name in sorted(results.keys() & baseline.keys()):
+        before, after = baseline[name]['best'], results[name]['best']
+        change = after / before - 1
+        flag = ''
+        if change > tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print('%-36s %10.1f %10.1f %+7.0f%%%s' % (name, before, after, change * 100, flag))
+    missing = len(baseline.keys() - results.keys())
+    if missing:
+        print("%d benchmark(s) in the baseline weren’t run." % missing)
+    return regressions
+
+
+def main(argv: T.Optional[T.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-k', dest='keyword', default='', help="Only run benchmarks whose name contains this.")
+    parser.add_argument('-n', '--number', type=int, default=10000,
+                        help="Calls per repeat of the fastest benchmarks. Defaults to %(default)s.")
+    parser.add_argument('--profile', default='default', choices=sorted(database.STORAGE_PROFILES),
+                        help="Storage profile of the database. Defaults to %(default)s.")
+    parser.add_argument('--json', dest='output', metavar='FILE', help="Write the results to FILE as JSON.")
+    parser.add_argument('--compare', dest='baseline', metavar='FILE', help="Compare the results with FILE.")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Slowdown that counts as a regression. Defaults to %(default)s.")
+    args = parser.parse_args(argv)
+
+    results = {name: result._asdict() for name, result in run(args.number, args.profile, args.keyword).items()}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'metadata': metadata(args.profile), 'results': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['metadata'].get('machine') != platform.node():
+            print("Warning: the baseline is from another machine (%s)." % baseline['metadata'].get('machine'),
+                  file=sys.stderr)
+        regressions = compare(results, baseline['results'], args.tolerance)
+        if regressions:
+            print("%d regression(s): %s" % (len(regressions), ', '.join(regressions)), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
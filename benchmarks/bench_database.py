@@ -0,0 +1,62 @@
+# language=rst
+"""
+Per-call latency of the hot database functions, with statements that are
+built and compiled once (see :func:`pseudomat.common.database.statements`),
+versus building a new statement on every call, as they used to.
+
+Run with::
+
+    python benchmarks/bench_database.py
+"""
+
+import pathlib
+import tempfile
+import timeit
+
+import sqlalchemy as sa
+
+from pseudomat.common import database, fingerprint
+
+PROJECT_ID = fingerprint('Benchmark project')
+
+
+def get_project_uncached(project_id: str):
+    project = database.metadata().tables['project']
+    result = database._engine.execute(
+        sa.select([project]).select_from(project).where(project.c.jti == project_id)
+    ).first()
+    return None if result is None else dict(result.items())
+
+
+def get_config_uncached(key: str):
+    config = database.metadata().tables['config']
+    row = database._engine.execute(sa.select([config.c.value]).where(config.c.key == key)).first()
+    return None if row is None else row[0]
+
+
+def main(number: int = 2000):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        database.initialize_database(pathlib.Path(tmp) / 'bench.sqlite', 'concurrent')
+        database.create_project(
+            jti=PROJECT_ID, iss='owner@example.com', sub='Benchmark project',
+            psig='psig', penc='penc', jws='jws'
+        )
+        for name, f, arg in [
+            ('get_project', database.get_project, PROJECT_ID),
+            ('get_project (uncached)', get_project_uncached, PROJECT_ID),
+            ('get_config', database.get_config, 'schema'),
+            ('get_config (uncached)', get_config_uncached, 'schema'),
+        ]:
+            f(arg)  # Warm up.
+            seconds = min(timeit.repeat(lambda: f(arg), number=number, repeat=5))
+            results[name] = seconds / number * 1e6
+            print('%-24s %8.1f µs/call' % (name, results[name]))
+        database.teardown_database()
+    for name in ('get_project', 'get_config'):
+        print('%-24s %8.2fx' % (name + ' speedup', results[name + ' (uncached)'] / results[name]))
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# language=rst
+"""
+Per-request cost of verifying a project JWS: jwcrypto versus the native
+:class:`pseudomat.common.SignedObject` path that the server uses.
+
+Run with::
+
+    python benchmarks/bench_jws.py
+"""
+
+import time
+import timeit
+
+from jwcrypto import jwk, jws, jwt
+
+from pseudomat import common
+
+
+def project_jws():
+    sigkey = jwk.JWK.generate(kty='OKP', crv='Ed448', use='sig')
+    enckey = jwk.JWK.generate(kty='OKP', crv='X448', use='enc')
+    sub = 'Benchmark project'
+    t = jwt.JWT(
+        claims={
+            'psig': common.json_loads(sigkey.export_public()),
+            'penc': common.json_loads(enckey.export_public()),
+            'jti': common.fingerprint(sub),
+            'iss': 'owner@example.com',
+            'sub': sub,
+            'iat': int(time.time()),
+        },
+        header={'alg': 'EdDSA', 'typ': 'project'}
+    )
+    t.make_signed_token(sigkey)
+    return t.serialize()
+
+
+def verify_jwcrypto(token: str):
+    # What validate_project_jws() used to do, minus the schema validation:
+    decoder = jws.JWS()
+    decoder.deserialize(token)
+    payload = common.json_loads(decoder.objects['payload'])
+    keys = [jwk.JWK.from_json(common.json_dumps(payload[claim])) for claim in ('psig', 'penc')]
+    decoder.verify(keys[0], alg='EdDSA')
+
+
+def verify_native(token: str):
+    decoder = common.SignedObject(token)
+    keys = [common.load_public_jwk(decoder.payload[claim]) for claim in ('psig', 'penc')]
+    decoder.validate(keys[0])
+
+
+def main(number: int = 500):
+    token = project_jws()
+    results = {}
+    for name, f in [('jwcrypto', verify_jwcrypto), ('native', verify_native)]:
+        f(token)  # Warm up.
+        seconds = min(timeit.repeat(lambda: f(token), number=number, repeat=5))
+        results[name] = seconds / number * 1e6
+        print('%-10s %8.1f µs/request' % (name, results[name]))
+    print('speedup    %8.2fx' % (results['jwcrypto'] / results['native']))
+    return results
+
+
+if __name__ == '__main__':
+    main()
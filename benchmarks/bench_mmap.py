@@ -0,0 +1,89 @@
+# language=rst
+"""
+The memory-mapped CSV reader versus the buffered one, on a generated file of
+5 GB by default.
+
+Run with::
+
+    python benchmarks/bench_mmap.py [gigabytes]
+
+Every reader runs in a fresh process, which reports its wall time and peak
+resident set size. Pages of the mapped file count towards the RSS of the
+memory-mapped reader, until it releases them after each block.
+"""
+
+import hashlib
+import json
+import pathlib
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from pseudomat.cli.actions import pseudonymize
+
+KEY = bytes(32)
+COLUMNS = ['customer_id', 'bsn']
+READERS = ('buffered', 'mmap')
+
+
+def generate(path: pathlib.Path, size: int, cardinality: int = 100000) -> int:
+    rnd = random.Random(42)
+    rows = 0
+    with path.open('w', encoding='utf-8', newline='') as f:
+        f.write('row,customer_id,bsn,amount\n')
+        while f.tell() < size:
+            f.write(''.join(
+                '%d,C%08d,%09d,%.2f\n' % (
+                    rows + i, rnd.randrange(cardinality), rnd.randrange(10 ** 9), rnd.random() * 1000
+                )
+                for i in range(10000)
+            ))
+            rows += 10000
+    return rows
+
+
+def run(reader: str, source: str, target: str) -> None:
+    start = time.perf_counter()
+    pseudonymize.pseudonymize_file(source, target, COLUMNS, KEY, use_mmap=reader == 'mmap')
+    json.dump({
+        'seconds': time.perf_counter() - start,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }, sys.stdout)
+
+
+def main(gigabytes: float = 5):
+    with tempfile.TemporaryDirectory() as tmp:
+        source = pathlib.Path(tmp) / 'input.csv'
+        target = pathlib.Path(tmp) / 'output.csv'
+        rows = generate(source, int(gigabytes * 1e9))
+        print('%d rows, %.2f GB' % (rows, source.stat().st_size / 1e9))
+        results = {}
+        reference = None
+        for reader in READERS:
+            output = subprocess.run(
+                [sys.executable, __file__, '--run', reader, str(source), str(target)],
+                check=True, stdout=subprocess.PIPE
+            ).stdout
+            results[reader] = json.loads(output)
+            with target.open('rb') as f:
+                digest = hashlib.file_digest(f, 'sha256').hexdigest()
+            if reference is None:
+                reference = digest
+            assert digest == reference, "Output differs from the buffered reader’s output."
+            target.unlink()
+            print('%-9s %8.2f s %10.0f rows/s  peak RSS %8.1f MB' % (
+                reader, results[reader]['seconds'], rows / results[reader]['seconds'],
+                results[reader]['max_rss_kb'] / 1024
+            ))
+        print('speedup   %8.2fx' % (results['buffered']['seconds'] / results['mmap']['seconds']))
+    return results
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--run']:
+        run(*sys.argv[2:])
+    else:
+        main(*[float(a) for a in sys.argv[1:]])
@@ -0,0 +1,68 @@
+# language=rst
+"""
+Scaling of ``pseudomat pseudonymize --jobs N`` on a generated CSV file.
+
+Run with::
+
+    python benchmarks/bench_pseudonymize.py [rows]
+
+The output of every run is compared with the single-process output.
+"""
+
+import hashlib
+import os
+import pathlib
+import random
+import sys
+import tempfile
+import time
+
+from pseudomat.cli.actions import pseudonymize
+
+KEY = bytes(32)
+COLUMNS = ['customer_id', 'bsn']
+
+
+def generate(path: pathlib.Path, rows: int, cardinality: int = 100000) -> None:
+    rnd = random.Random(42)
+    with path.open('w', encoding='utf-8', newline='') as f:
+        f.write('row,customer_id,bsn,amount\n')
+        for i in range(rows):
+            f.write('%d,C%08d,%09d,%.2f\n' % (
+                i, rnd.randrange(cardinality), rnd.randrange(10 ** 9), rnd.random() * 1000
+            ))
+
+
+def jobs_to_try():
+    n, cpus = 1, os.cpu_count() or 1
+    while n < cpus:
+        yield n
+        n *= 2
+    yield cpus
+
+
+def main(rows: int = 1000000):
+    with tempfile.TemporaryDirectory() as tmp:
+        source = pathlib.Path(tmp) / 'input.csv'
+        target = pathlib.Path(tmp) / 'output.csv'
+        generate(source, rows)
+        print('%d rows, %.1f MB' % (rows, source.stat().st_size / 1e6))
+        baseline = reference = None
+        results = {}
+        for jobs in jobs_to_try():
+            start = time.perf_counter()
+            pseudonymize.pseudonymize_file(str(source), str(target), COLUMNS, KEY, jobs=jobs)
+            seconds = time.perf_counter() - start
+            digest = hashlib.sha256(target.read_bytes()).hexdigest()
+            if reference is None:
+                baseline, reference = seconds, digest
+            assert digest == reference, "Output differs from the single-process output."
+            results[jobs] = seconds
+            print('jobs=%-3d %7.2f s %10.0f rows/s  speedup %5.2fx' % (
+                jobs, seconds, rows / seconds, baseline / seconds
+            ))
+    return results
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,87 @@
+# language=rst
+"""
+Read and write throughput of the SQLite storage profiles in
+:data:`pseudomat.common.database.STORAGE_PROFILES`, with N threads that each
+mix project lookups with project creation.
+
+Run with::
+
+    python benchmarks/bench_sqlite.py [seconds [threads ...]]
+
+Failed operations, typically “database is locked”, are counted as errors.
+"""
+
+import itertools
+import pathlib
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+
+from pseudomat.common import database, fingerprint
+
+PROFILES = ('default', 'concurrent')
+WRITE_RATIO = 0.1
+PROJECTS = 1000
+
+
+def _create(i: int) -> bool:
+    sub = 'Project %d' % i
+    return database.create_project(
+        jti=fingerprint(sub), iss='owner@example.com', sub=sub,
+        psig='psig %d' % i, penc='penc %d' % i, jws='jws %d' % i
+    )
+
+
+def run(profile: str, threads: int, seconds: float) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        database.initialize_database(pathlib.Path(tmp) / 'bench.sqlite', profile)
+        for i in range(PROJECTS):
+            _create(i)
+        counter = itertools.count(PROJECTS)
+        counts = {'reads': 0, 'writes': 0, 'errors': 0}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + seconds
+
+        def work(seed: int):
+            rnd = random.Random(seed)
+            mine = {'reads': 0, 'writes': 0, 'errors': 0}
+            while time.perf_counter() < deadline:
+                try:
+                    if rnd.random() < WRITE_RATIO:
+                        _create(next(counter))
+                        mine['writes'] += 1
+                    else:
+                        database.get_project(fingerprint('Project %d' % rnd.randrange(PROJECTS)))
+                        mine['reads'] += 1
+                except OperationalError:
+                    mine['errors'] += 1
+            with lock:
+                for k, v in mine.items():
+                    counts[k] += v
+
+        workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        database.teardown_database()
+    return {k: v / seconds for k, v in counts.items()}
+
+
+def main(seconds: float = 3, *threads: int):
+    results = {}
+    for profile in PROFILES:
+        for n in threads or (1, 4, 16):
+            r = results[(profile, n)] = run(profile, n, seconds)
+            print('%-10s threads=%-3d %9.0f reads/s %8.0f writes/s %8.0f errors/s' % (
+                profile, n, r['reads'], r['writes'], r['errors']
+            ))
+    return results
+
+
+if __name__ == '__main__':
+    main(*[float(a) if i == 0 else int(a) for i, a in enumerate(sys.argv[1:])])
@@ -0,0 +1,259 @@
+# language=rst
+"""
+End-to-end load test of the HTTP API, on one machine.
+
+Pre-creates N projects with their invites and delete tokens, signed the same
+way as the command line tool signs them (see
+:func:`pseudomat.cli.actions.project.generate_project` and
+:func:`pseudomat.cli.actions.invite.generate_invite`). It then starts a
+server on a fresh database, and drives it at a fixed concurrency, one
+endpoint at a time:
+
+1.  ``POST /`` for every project;
+2.  ``GET /<project_id>``, ``--gets`` times per project;
+3.  ``PUT /<project_id>/invites/<invite_id>`` for every invite;
+4.  ``DELETE /<project_id>`` for every project.
+
+For each endpoint, it reports the throughput, the latency percentiles and
+any responses with an unexpected status. Run with::
+
+    python benchmarks/loadtest.py [-n PROJECTS] [-c CONCURRENCY] [--server flask|aiohttp]
+                                  [--storage-profile PROFILE] [--database PATH_OR_URL] [--json FILE]
+
+With ``--url``, the load test uses a server that is already running instead,
+such as one under gunicorn, and doesn’t delete its database. The client is a
+single process, so at high throughput it may saturate before the server does;
+check its CPU usage.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import json
+import os
+import pathlib
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import typing as T
+import uuid
+
+import requests
+import requests.adapters
+
+from pseudomat.cli.actions import invite, project
+from pseudomat.common import database
+
+SERVERS = {
+    'flask': """
+import sys
+from pseudomat.srv import create_app
+create_app({
+    'DATABASE': sys.argv[2], 'STORAGE_PROFILE': sys.argv[3] or None, 'BATCH_WORKERS': 0
+}).run(port=int(sys.argv[1]), threaded=True)
+""",
+    'aiohttp': """
+import sys
+from aiohttp import web
+from pseudomat.srv import aio
+web.run_app(aio.create_app({
+    'DATABASE': sys.argv[2], 'STORAGE_PROFILE': sys.argv[3] or None, 'VERIFY_WORKERS': 0
+}), port=int(sys.argv[1]), print=None)
+""",
+}
+
+
+class Request(T.NamedTuple):
+    method: str
+    path: str
+    headers: T.Dict[str, str]
+    data: T.Optional[str]
+    expected: int
+
+
+def generate(run_id: str, i: int, invites: int) -> dict:
+    # language=rst
+    """
+    Returns:
+        the project JWS, the invite JWSs and the delete token of project *i*.
+    """
+    created = project.generate_project('loadtest@example.com', 'Load test %s %d' % (run_id, i))
+    return {
+        'jti': created['jti'],
+        'jws': created['jws'],
+        'invites': [
+            (generated['jti'], generated['pjws'])
+            for generated in (
+                invite.generate_invite(created['jti'], created['ssig'], 'Invitee %d' % j) for j in range(invites)
+            )
+        ],
+        'delete_token': project.delete_token(created),
+    }
+
+
+def phases(projects: T.List[dict], gets: int) -> T.Iterator[T.Tuple[str, T.List[Request]]]:
+    jose = {'Content-Type': 'application/jose'}
+    yield 'POST /', [Request('POST', '/', jose, p['jws'], 201) for p in projects]
+    yield 'GET /<project_id>', [
+        Request('GET', '/' + p['jti'], {}, None, 200) for _ in range(gets) for p in projects
+    ]
+    yield 'PUT /<project_id>/invites/<invite_id>', [
+        Request('PUT', '/%s/invites/%s' % (p['jti'], jti), jose, pjws, 201)
+        for p in projects for jti, pjws in p['invites']
+    ]
+    yield 'DELETE /<project_id>', [
+        Request('DELETE', '/' + p['jti'], {'Authorization': 'Bearer ' + p['delete_token']}, None, 204)
+        for p in projects
+    ]
+
+
+def percentile(ordered: T.List[float], p: float) -> float:
+    # Nearest rank:
+    return ordered[max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))]
+
+
+def drive(url: str, requests_: T.List[Request], concurrency: int) -> dict:
+    # language=rst
+    """
+    Sends *requests_* with *concurrency* threads, each with its own
+    keep-alive connection.
+
+    Returns:
+        the throughput in requests per second, latency percentiles in
+        milliseconds, and the number of responses with another status than
+        expected, by status; ``0`` stands for a connection error.
+    """
+    local = threading.local()
+    errors: T.Dict[int, int] = {}
+    lock = threading.Lock()
+
+    def send(r: Request) -> float:
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+            session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        start = time.perf_counter()
+        try:
+            status = session.request(r.method, url + r.path, headers=r.headers, data=r.data).status_code
+        except requests.ConnectionError:
+            status = 0
+        retval = time.perf_counter() - start
+        if status != r.expected:
+            with lock:
+                errors[status] = errors.get(status, 0) + 1
+        return retval
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        latencies = sorted(executor.map(send, requests_))
+    seconds = time.perf_counter() - start
+    return {
+        'requests': len(requests_),
+        'seconds': seconds,
+        'throughput': len(requests_) / seconds,
+        'latency_ms': {
+            'p50': percentile(latencies, 50) * 1000,
+            'p90': percentile(latencies, 90) * 1000,
+            'p99': percentile(latencies, 99) * 1000,
+            'max': latencies[-1] * 1000,
+        },
+        'errors': {str(status): count for status, count in sorted(errors.items())},
+    }
+
+
+def start_server(server: str, database_: str, storage_profile: T.Optional[str]) -> T.Tuple[subprocess.Popen, str]:
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen(
+        [sys.executable, '-c', SERVERS[server], str(port), database_, storage_profile or ''],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = 'http://localhost:%d' % port
+    for _ in range(100):
+        try:
+            requests.get(url + '/')
+            return process, url
+        except requests.ConnectionError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+    process.terminate()
+    sys.exit("The %s server didn’t start." % server)
+
+
+def report(results: T.Dict[str, dict]) -> None:
+    print('%-40s %8s %9s %8s %8s %8s %8s  %s' % (
+        'endpoint', 'requests', 'req/s', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'errors'
+    ))
+    for endpoint, r in results.items():
+        latency = r['latency_ms']
+        print('%-40s %8d %9.1f %8.2f %8.2f %8.2f %8.2f  %s' % (
+            endpoint, r['requests'], r['throughput'], latency['p50'], latency['p90'], latency['p99'],
+            latency['max'], ', '.join('%s: %d' % item for item in r['errors'].items()) or '-'
+        ))
+
+
+def main(argv: T.Optional[T.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-n', '--projects', type=int, default=200,
+                        help="Number of projects. Defaults to %(default)s.")
+    parser.add_argument('--invites', type=int, default=5,
+                        help="Number of invites per project. Defaults to %(default)s.")
+    parser.add_argument('--gets', type=int, default=10,
+                        help="Number of GET requests per project. Defaults to %(default)s.")
+    parser.add_argument('-c', '--concurrency', type=int, default=8,
+                        help="Number of concurrent requests. Defaults to %(default)s.")
+    parser.add_argument('--server', choices=sorted(SERVERS), default='flask',
+                        help="Server to start. Defaults to %(default)s.")
+    parser.add_argument('--storage-profile', choices=sorted(database.STORAGE_PROFILES),
+                        help="Storage profile of the server. Defaults to that of the database.")
+    parser.add_argument('--database', metavar='PATH_OR_URL',
+                        help="Database of the server. Defaults to a new SQLite file, which is removed afterwards.")
+    parser.add_argument('--url', help="URL of a running server to use instead of starting one.")
+    parser.add_argument('--json', dest='output', metavar='FILE', help="Write the results to FILE as JSON.")
+    args = parser.parse_args(argv)
+
+    run_id = uuid.uuid4().hex[:8]
+    start = time.perf_counter()
+    with ProcessPoolExecutor() as executor:
+        projects = list(executor.map(
+            generate, [run_id] * args.projects, range(args.projects), [args.invites] * args.projects, chunksize=16
+        ))
+    print("Generated %d projects and %d invites in %.1f s." % (
+        len(projects), len(projects) * args.invites, time.perf_counter() - start
+    ), file=sys.stderr)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        process = None
+        if args.url is None:
+            process, url = start_server(
+                args.server, args.database or str(pathlib.Path(tmp) / 'pseudomatd.sqlite'), args.storage_profile
+            )
+        else:
+            url = args.url.rstrip('/')
+        try:
+            results = {}
+            for endpoint, requests_ in phases(projects, args.gets):
+                results[endpoint] = drive(url, requests_, args.concurrency)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    report(results)
+    if args.output:
+        config = dict(vars(args), python=platform.python_version(), platform=platform.platform(),
+                      machine=platform.node(), cpus=os.cpu_count(),
+                      time=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()))
+        with open(args.output, 'w') as f:
+            json.dump({'config': config, 'results': results}, f, indent=2)
+            f.write('\n')
+    return 1 if any(r['errors'] for r in results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -38,13 +38,55 @@ def initialize_database():
     database.initialize_database(globals.config_dir() / 'pseudomat.sqlite')
 
 
+def initialize_client(args):
+    from . import client
+    client.configure(
+        timeout=(min(args.timeout, client.DEFAULT_TIMEOUT[0]), args.timeout),
+        retries=args.retries,
+        gzip=args.gzip
+    )
+
+
+def run_profiled(command, args):
+    # language=rst
+    """
+    Runs *command* under the profiler, and writes the profile to the file
+    given with ``--profile-file``, or to the rotating ``profiles`` directory.
+    """
+    from ..common import profiling
+    profile = profiling.start()
+    try:
+        return command(args)
+    finally:
+        if profile is not None:
+            profile.disable()
+            if args.profile_file is not None:
+                profile.dump_stats(args.profile_file)
+                path = args.profile_file
+            else:
+                from . import globals
+                tags = [args.command] + ([args.subcommand] if getattr(args, 'subcommand', None) else [])
+                path = profiling.dump(profile, globals.config_dir() / 'profiles', tags)
+            print("Profile written to %s" % path, file=sys.stderr)
+            if args.debug:
+                import pstats
+                pstats.Stats(profile, stream=sys.stderr).sort_stats('cumulative').print_stats(25)
+
+
 def main():
     args = argparse.main()
     initialize_logging(args.debug)
-    initialize_database()
     from . import commands
-    command = getattr(commands, f'{args.command}_{args.subcommand}')
+    if getattr(args, 'subcommand', None) is None:
+        command = getattr(commands, args.command)
+    else:
+        command = getattr(commands, f'{args.command}_{args.subcommand}')
+    if commands.uses_database(command):
+        initialize_database()
+    initialize_client(args)
     try:
+        if args.profile or args.profile_file is not None:
+            return run_profiled(command, args)
         return command(args)
     except AssertionError as e:
         sys.exit(str(e))
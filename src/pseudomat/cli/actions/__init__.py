@@ -1,2 +1,15 @@
-# from . import invite
-from . import project
+# language=rst
+"""
+The submodules are imported on first access, as in ``actions.project``, so
+that a command only imports the actions it uses.
+"""
+
+import importlib
+
+__all__ = ['invite', 'keys', 'project', 'pseudonymize']
+
+
+def __getattr__(name: str):
+    if name in __all__:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
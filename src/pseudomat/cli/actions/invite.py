@@ -0,0 +1,277 @@
+import collections
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+import functools
+import logging
+import os
+import sys
+import time
+import typing as T
+
+from jwcrypto import jwk, jwt
+import requests
+
+from ... import common
+from ...common import database
+from .. import client
+from . import keys
+
+_logger = logging.getLogger(__name__)
+
+INVITE_TOKEN = 'invite_token:'
+"""Prefix of the config keys under which invitation tokens are stored."""
+DEFAULT_CONNECTIONS = client.DEFAULT_POOL_SIZE
+"""Number of invites that are uploaded concurrently by :func:`create_invites`."""
+
+
+def generate_invite(project_id: str, project_ssig: str, sub: str, iat: T.Optional[int] = None,
+                    key_pair: T.Optional[T.Tuple[str, str]] = None) -> dict:
+    # language=rst
+    """
+    Generates the keys of an invitee, unless *key_pair* is given, and the
+    invite and the invitation token, both signed by the project. Doesn’t touch
+    the database, so that it can run in a worker process.
+
+    Args:
+        project_ssig: the secret signing key of the project, as a JWK.
+        key_pair: the secret keys of the invitee, as from
+            :func:`pseudomat.cli.actions.keys.take_key_pair`.
+
+    Returns:
+        The invite, with the public ``pjws`` for the server and the secret
+        ``sjws`` for the invitee.
+    """
+    sub = sub.strip(' ')
+    if iat is None:
+        iat = int(time.time())
+    jti = common.fingerprint([project_id, sub])
+    project_key = jwk.JWK.from_json(project_ssig)
+
+    ssig, senc = key_pair or keys.generate_key_pair()
+    sigkey = jwk.JWK.from_json(ssig)
+    enckey = jwk.JWK.from_json(senc)
+    psig = common.json_loads(sigkey.export_public())
+    penc = common.json_loads(enckey.export_public())
+
+    claims = {
+        'jti': jti,
+        'iss': project_id,
+        'sub': sub,
+        'iat': iat,
+        'psig': psig,
+        'penc': penc
+    }
+
+    pjws = jwt.JWT(claims=claims, header={'alg': 'EdDSA', 'typ': 'pinvite'})
+    pjws.make_signed_token(project_key)
+
+    sclaims = dict(
+        claims,
+        ssig=common.json_loads(sigkey.export()),
+        senc=common.json_loads(enckey.export())
+    )
+    sjws = jwt.JWT(claims=sclaims, header={'alg': 'EdDSA', 'typ': 'sinvite'})
+    sjws.make_signed_token(project_key)
+
+    return {
+        'jti': jti,
+        'iss': project_id,
+        'sub': sub,
+        'psig': common.json_dumps(psig),
+        'penc': common.json_dumps(penc),
+        'pjws': pjws.serialize(),
+        'sjws': sjws.serialize()
+    }
+
+
+def get_local_invite(project: dict, sub: str) -> T.Optional[dict]:
+    # language=rst
+    """
+    Returns:
+        The stored invite, with only its ``jti``, ``iss``, ``sub``, ``pjws``
+        and ``sjws``, or ``None``.
+    """
+    sub = sub.strip(' ')
+    jti = common.fingerprint([project['jti'], sub])
+    sjws = database.get_config(INVITE_TOKEN + jti)
+    if sjws is None:
+        return None
+    return {'jti': jti, 'iss': project['jti'], 'sub': sub, 'pjws': database.get_member_jws(jti), 'sjws': sjws}
+
+
+def store_local_invite(invite: dict, conn=None) -> bool:
+    # language=rst
+    """
+    Stores the invite in the member chain of the project, and its token in
+    the config table.
+
+    Returns:
+        ``False`` if a different invite with the same name already exists.
+    """
+    with database.transaction(conn) as c:
+        created = database.create_invite(
+            jti=invite['jti'],
+            iss=invite['iss'],
+            sub=invite['sub'],
+            psig=invite['psig'],
+            penc=invite['penc'],
+            jws=invite['pjws'],
+            conn=c
+        )
+        if created:
+            database.set_config(INVITE_TOKEN + invite['jti'], invite['sjws'], conn=c)
+    return created
+
+
+def create_local_invite(project: dict, sub: str) -> dict:
+    # language=rst
+    """
+    Returns:
+        The stored invite, which is only generated if it wasn’t stored before.
+    """
+    invite = get_local_invite(project, sub)
+    if invite is not None:
+        return invite
+    assert project['ssig'] is not None, "You’re not the owner of project '%s'." % project['sub']
+    with database.transaction() as c:
+        invite = generate_invite(project['jti'], project['ssig'], sub, key_pair=keys.take_key_pair(conn=c))
+        if not store_local_invite(invite, conn=c):
+            sys.exit("An invite with that name already exists.")
+    keys.refill_in_background()
+    return invite
+
+
+def _response_error(r: requests.Response) -> T.Optional[str]:
+    if r.status_code in range(400, 500):
+        return "%s: %s" % (r.reason, r.text)
+    if r.status_code in range(500, 600):
+        return "Server side error:\n%s: %s" % (r.reason, r.text)
+    if r.status_code not in range(200, 300):
+        return "Server returned unexpected response:\n%s: %s" % (r.reason, r.text)
+    if r.status_code != 201:
+        _logger.info("%s: %s" % (r.reason, r.text))
+    return None
+
+
+def put_remote_invite(invite: dict) -> T.Optional[str]:
+    # language=rst
+    """
+    Uploads the invite, which is idempotent.
+
+    Returns:
+        An error message, or ``None`` on success.
+    """
+    http = client.get_client()
+    r = http.put(
+        http.url(invite['iss'], 'invites', invite['jti']),
+        headers={'Content-Type': 'application/jose'},
+        data=invite['pjws']
+    )
+    return _response_error(r)
+
+
+def create_remote_invite(invite: dict):
+    # The next line is deliberately not in a try-except block. It’s no problem
+    # to propagate this error all the way up.
+    error = put_remote_invite(invite)
+    if error is not None:
+        sys.exit(error)
+
+
+def delete_invite(invite: dict):
+    with database.transaction() as c:
+        database.delete_invite(invite['jti'], conn=c)
+        database.set_config(INVITE_TOKEN + invite['jti'], None, conn=c)
+
+
+def read_invitees(path: str) -> T.List[str]:
+    # language=rst
+    """
+    Returns:
+        The names in the file, one per line, without blank lines. ``'-'``
+        reads standard input.
+    """
+    f = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    with f:
+        names = (line.strip(' \t\r\n') for line in f)
+        return [name for name in names if name]
+
+
+def _upload(invite: dict) -> T.Optional[str]:
+    try:
+        return put_remote_invite(invite)
+    except requests.RequestException as e:
+        return str(e)
+
+
+def _generate_invite(project_id: str, project_ssig: str, iat: int, sub: str,
+                     key_pair: T.Optional[T.Tuple[str, str]]) -> dict:
+    return generate_invite(project_id, project_ssig, sub, iat, key_pair)
+
+
+def create_invites(
+    project: dict,
+    names: T.Iterable[str],
+    jobs: T.Optional[int] = None,
+    connections: int = DEFAULT_CONNECTIONS
+) -> T.Iterator[T.Tuple[str, T.Optional[str], T.Optional[str]]]:
+    # language=rst
+    """
+    Creates many invites at once. Keys are taken from the key pool, and the
+    missing ones are generated by *jobs* worker processes, which also sign the
+    invites. Each invite is stored locally as soon as it’s generated, and then
+    uploaded by one of *connections* threads, over the keep-alive connections
+    of the shared client, while the rest is still being generated.
+
+    Invites that are already stored locally aren’t generated again, only
+    uploaded again, so an interrupted run can simply be repeated.
+
+    Yields:
+        ``(name, token, error)`` for every name, in order, with either the
+        invitation token or an error message.
+    """
+    assert project['ssig'] is not None, "You’re not the owner of project '%s'." % project['sub']
+    names = list(dict.fromkeys(name.strip(' ') for name in names))
+    invites = {}
+    for name in names:
+        invite = get_local_invite(project, name)
+        if invite is not None:
+            invites[name] = invite
+    missing = [name for name in names if name not in invites]
+    _logger.info("%d invites are stored already, %d are generated.", len(invites), len(missing))
+
+    if connections > client.get_client().pool_size:
+        client.configure(pool_size=connections)
+    with ProcessPoolExecutor(jobs) as keygen, ThreadPoolExecutor(connections) as uploader:
+        window = collections.deque()
+
+        def completed(block: bool = False):
+            # Results are yielded in order, and the window is bounded, so that
+            # uploads can’t fall arbitrarily far behind key generation:
+            while window and (block or window[0][2].done() or len(window) > 4 * connections):
+                name, token, upload = window.popleft()
+                error = upload.result()
+                yield (name, None, error) if error else (name, token, None)
+
+        workers = jobs or os.cpu_count() or 1
+        # Pooled keys, and None for the invites whose keys must be generated:
+        key_pairs = keys.take_key_pairs(len(missing))
+        key_pairs += [None] * (len(missing) - len(key_pairs))
+        generated = zip(missing, keygen.map(
+            functools.partial(_generate_invite, project['jti'], project['ssig'], int(time.time())),
+            missing,
+            key_pairs,
+            chunksize=max(1, len(missing) // (4 * workers))
+        ))
+        for name in names:
+            if name in invites:
+                invite = invites[name]
+            else:
+                _name, invite = next(generated)
+                if not store_local_invite(invite):
+                    failed = Future()
+                    failed.set_result("An invite with that name already exists.")
+                    window.append((name, None, failed))
+                    continue
+            window.append((name, invite['sjws'], uploader.submit(_upload, invite)))
+            yield from completed()
+        yield from completed(block=True)
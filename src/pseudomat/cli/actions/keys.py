@@ -0,0 +1,133 @@
+# language=rst
+"""
+A pool of pre-generated key pairs in the local database, so that creating a
+project or an invite doesn’t have to wait for key generation.
+
+Each pair is an Ed448 signing key and an X448 encryption key, as secret JWKs.
+When the pool is empty, keys are generated on the spot. A single project or
+invite takes its pair in the transaction that stores it, so a pair is never
+handed out twice, and it goes back to the pool if storing fails. Bulk invites
+take all their pairs up front, in a transaction of their own, and don’t return
+them.
+"""
+
+import logging
+import subprocess
+import sys
+import time
+import typing as T
+
+from ...common import database
+
+_logger = logging.getLogger(__name__)
+
+KEY_POOL_TARGET = 'key_pool_target'
+"""Config key of the pool size that is kept up in the background, if any."""
+KEY_POOL_REFILL = 'key_pool_refill'
+"""Config key of the time at which a background refill started, while it runs."""
+REFILL_TIMEOUT = 10 * 60
+"""Seconds after which a background refill is presumed dead, and another one
+may start."""
+BATCH_SIZE = 100
+"""Number of key pairs that are stored per transaction."""
+
+
+def generate_key_pair() -> T.Tuple[str, str]:
+    # language=rst
+    """
+    Returns:
+        a new ``(ssig, senc)`` pair of secret JWKs.
+    """
+    from jwcrypto import jwk
+    sigkey = jwk.JWK.generate(kty='OKP', crv='Ed448', use='sig')
+    enckey = jwk.JWK.generate(kty='OKP', crv='X448', use='enc')
+    return sigkey.export(), enckey.export()
+
+
+def pool_size() -> int:
+    return database.count_key_pairs()
+
+
+def prefill(size: int) -> int:
+    # language=rst
+    """
+    Generates key pairs until the pool holds *size* pairs.
+
+    Returns:
+        the number of pairs that were added.
+    """
+    added = 0
+    missing = size - pool_size()
+    while added < missing:
+        batch = min(BATCH_SIZE, missing - added)
+        added += database.add_key_pairs(generate_key_pair() for _ in range(batch))
+    # The pool is full, so a background refill may start again:
+    database.set_config(KEY_POOL_REFILL, None)
+    return added
+
+
+def set_background_size(size: T.Optional[int]) -> None:
+    # language=rst
+    """
+    Keeps the pool at *size* pairs from now on, or stops doing so if *size* is
+    ``None``. See :func:`refill_in_background`.
+    """
+    database.set_config(KEY_POOL_TARGET, None if size is None else str(size))
+
+
+def refill_in_background() -> None:
+    # language=rst
+    """
+    Starts ``pseudomat keys prefill`` in a detached process if the pool has
+    dropped below half of the size set with :func:`set_background_size`, and
+    no other refill has started in the last :data:`REFILL_TIMEOUT` seconds.
+    """
+    target = database.get_config(KEY_POOL_TARGET)
+    if target is None or pool_size() >= int(target) // 2:
+        return
+    now = '%f' % time.time()
+    if not database.compare_and_set_config(KEY_POOL_REFILL, None, now):
+        started = database.get_config(KEY_POOL_REFILL)
+        if started is not None and time.time() - float(started) < REFILL_TIMEOUT:
+            return
+        # Take over from a refill that died, unless another process just did:
+        if not database.compare_and_set_config(KEY_POOL_REFILL, started, now):
+            return
+    _logger.debug("Refilling the key pool to %s in the background.", target)
+    try:
+        subprocess.Popen(
+            [sys.executable, '-m', 'pseudomat.cli', 'keys', 'prefill', target],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            start_new_session=True
+        )
+    except OSError:
+        database.set_config(KEY_POOL_REFILL, None)
+        raise
+
+
+def take_key_pairs(n: int, conn=None) -> T.List[T.Tuple[str, str]]:
+    # language=rst
+    """
+    Args:
+        conn: the connection of the transaction that stores what the keys
+            are used for; see :func:`pseudomat.common.database.transaction`.
+            That transaction holds the write lock of an SQLite database, so
+            the caller must call :func:`refill_in_background` after it ends.
+
+    Returns:
+        up to *n* pairs from the pool, which may be fewer than *n*.
+    """
+    retval = database.take_key_pairs(n, conn=conn) if n > 0 else []
+    if conn is None:
+        refill_in_background()
+    return retval
+
+
+def take_key_pair(conn=None) -> T.Tuple[str, str]:
+    # language=rst
+    """
+    Returns:
+        a pair from the pool, or a new one if the pool is empty.
+    """
+    pairs = take_key_pairs(1, conn=conn)
+    return pairs[0] if pairs else generate_key_pair()
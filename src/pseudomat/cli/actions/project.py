@@ -3,44 +3,37 @@ import sys
 import time
 import typing as T
 
-from jwcrypto import jwk, jws, jwt
-import requests
-
 from ... import common
 from ...common import database
-from .. import globals
+from . import keys
 
 _logger = logging.getLogger(__name__)
 
 DEFAULT_PROJECT = 'default_project'
 
 
-def create_local_project(iss: str, sub: str) -> dict:
+def generate_project(iss: str, sub: str, iat: T.Optional[int] = None,
+                     key_pair: T.Optional[T.Tuple[str, str]] = None) -> dict:
+    # language=rst
     """
+    Generates the keys of a project, unless *key_pair* is given, and the
+    project JWS, signed with the project’s own key. Doesn’t touch the
+    database.
+
     Returns:
-        A stored invite object.
+        A project object, as stored by :func:`create_local_project`.
     """
+    from jwcrypto import jwk, jwt
     sub = sub.strip(' ')
     project_id = common.fingerprint(sub)
 
-    iat = int(time.time())
+    if iat is None:
+        iat = int(time.time())
 
-    sigkey = jwk.JWK.generate(
-        kty='OKP',
-        crv='Ed448',
-        use='sig'
-    )
+    ssig, senc = key_pair or keys.generate_key_pair()
+    sigkey = jwk.JWK.from_json(ssig)
     psig = sigkey.export_public()
-    ssig = sigkey.export()
-
-    enckey = jwk.JWK.generate(
-        kty='OKP',
-        crv='X448',
-        use='enc'
-
-    )
-    penc = enckey.export_public()
-    senc = enckey.export()
+    penc = jwk.JWK.from_json(senc).export_public()
 
     claims = {
         'psig': common.json_loads(psig),
@@ -63,7 +56,7 @@ def create_local_project(iss: str, sub: str) -> dict:
     t.make_signed_token(sigkey)
     t = t.serialize()
 
-    project = {
+    return {
         "jti": project_id,
         "sub": sub,
         "iss": iss,
@@ -73,21 +66,33 @@ def create_local_project(iss: str, sub: str) -> dict:
         "senc": senc,
         "jws": t
     }
-    created = database.create_project(**project)
-    if not created:
-        sys.exit("A project with that name already exists.")
+
+
+def create_local_project(iss: str, sub: str) -> dict:
+    """
+    Returns:
+        A stored invite object.
+    """
+    # In one transaction, so that the keys return to the pool on failure:
+    with database.transaction() as c:
+        project = generate_project(iss, sub, key_pair=keys.take_key_pair(conn=c))
+        created = database.create_project(**project, conn=c)
+        if not created:
+            sys.exit("A project with that name already exists.")
+    keys.refill_in_background()
 
     return project
 
 
 def create_remote_project(project: dict):
+    from ..client import get_client
     # The next line is deliberately not in a try-except block. It’s no problem
     # to propagate this error all the way up.
-    r = requests.post(
-        url=globals.SERVER_URL,
+    http = get_client()
+    r = http.post(
+        http.url(),
         headers={'Content-Type': 'application/jose'},
-        data=project['jws'],
-        allow_redirects=False
+        data=project['jws']
     )
     if r.status_code in range(400, 500):
         sys.exit("%s: %s" % (r.reason, r.text))
@@ -137,22 +142,33 @@ def delete_local_project(project: dict) -> bool:
     return database.delete_project(project['jti'])
 
 
-def delete_remote_project(project: dict):
+def delete_token(project: dict) -> str:
+    # language=rst
+    """
+    Returns:
+        The Bearer token for ``DELETE /<project_id>``, signed by the project.
+    """
+    from jwcrypto import jwk, jws
     payload = common.fingerprint({
         'method': 'DELETE',
         'path': '/' + project['jti']
     })
-    assert project['ssig'] is not None, "You’re not the owner of project '%s'." % project['sub']
     sigkey = jwk.JWK.from_json(project['ssig'])
     token = jws.JWS(payload=payload)
     token.add_signature(sigkey, protected={'alg': 'EdDSA'})
-    token = token.serialize(compact=True)
+    return token.serialize(compact=True)
+
+
+def delete_remote_project(project: dict):
+    from ..client import get_client
+    assert project['ssig'] is not None, "You’re not the owner of project '%s'." % project['sub']
+    token = delete_token(project)
     # The next line is deliberately not in a try-except block. It’s no problem
     # to propagate this error all the way up.
-    r = requests.delete(
-        url=globals.SERVER_URL / project['jti'],
-        headers={'Authorization': 'Bearer ' + token},
-        allow_redirects=False
+    http = get_client()
+    r = http.delete(
+        http.url(project['jti']),
+        headers={'Authorization': 'Bearer ' + token}
     )
     if r.status_code == 404:
         return
@@ -0,0 +1,601 @@
+import collections
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import csv
+import functools
+import io
+import itertools
+import logging
+import mmap
+import os
+import sys
+import typing as T
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from ... import common
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 10000
+"""Number of rows that are read, pseudonymized and written at a time."""
+DEFAULT_CACHE_SIZE = 1 << 16
+"""Number of distinct values per column whose pseudonyms are memoized."""
+DEFAULT_RANGE_SIZE = 8 << 20
+"""Number of bytes per task when pseudonymizing in parallel."""
+BUFFER_SIZE = 1 << 20
+FORMATS = ('csv', 'parquet', 'arrow')
+_EXTENSIONS = {
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+}
+WHITESPACE = ' \t'
+_WHITESPACE_BYTES = WHITESPACE.encode('ascii')
+
+
+def project_key(project: dict) -> bytes:
+    # language=rst
+    """
+    Derives the pseudonymization key from the secret keys of *project*.
+
+    Raises:
+        AssertionError: if we don’t have the project’s secret keys.
+    """
+    assert project['ssig'] is not None and project['senc'] is not None, \
+        "You don’t have the secret keys of project '%s'." % project['sub']
+    material = b''.join(
+        common.b64decode(common.json_loads(project[claim])['d'])
+        for claim in ('ssig', 'senc')
+    )
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=project['jti'].encode('ascii'),
+        info=b'pseudomat pseudonymization'
+    ).derive(material)
+
+
+def pseudonymize_value(key: bytes, value: str) -> str:
+    # language=rst
+    """
+    Surrounding whitespace is ignored. Empty values stay empty, so that missing
+    data doesn’t link records.
+    """
+    value = value.strip(WHITESPACE)
+    if value == '':
+        return value
+    return common.keyed_fingerprint(key, value)
+
+
+class ColumnPseudonymizer(object):
+    # language=rst
+    """
+    Same as :func:`pseudonymize_value`, but memoizes the pseudonyms of up to
+    *cache_size* distinct (normalized) values in an LRU cache. Identifiers tend
+    to repeat a lot, so most values needn’t be hashed again.
+    """
+
+    def __init__(self, key: bytes, cache_size: int = DEFAULT_CACHE_SIZE):
+        self._hash = functools.partial(common.keyed_fingerprint, key)
+        self._hash_bytes = functools.partial(common.keyed_fingerprint, key, rtype=bytes)
+        self._caching = cache_size > 0
+        if self._caching:
+            self._hash = functools.lru_cache(maxsize=cache_size)(self._hash)
+            self._hash_bytes = functools.lru_cache(maxsize=cache_size)(self._hash_bytes)
+
+    def __call__(self, value: str) -> str:
+        value = value.strip(WHITESPACE)
+        if value == '':
+            return value
+        return self._hash(value)
+
+    def pseudonymize_bytes(self, value: bytes) -> bytes:
+        # language=rst
+        """
+        Same as calling this object, but for a UTF-8 encoded value, which
+        needn’t be decoded to be hashed.
+        """
+        value = value.strip(_WHITESPACE_BYTES)
+        if value == b'':
+            return value
+        return self._hash_bytes(value)
+
+    def cache_stats(self) -> collections.Counter:
+        retval = collections.Counter()
+        if self._caching:
+            for info in (self._hash.cache_info(), self._hash_bytes.cache_info()):
+                retval.update(hits=info.hits, misses=info.misses)
+        return retval
+
+
+class Summary(T.NamedTuple):
+    rows: int
+    """Number of data rows processed."""
+    cache_stats: T.Dict[str, collections.Counter]
+    """Memo cache hits and misses per column."""
+
+
+def log_summary(summary: Summary) -> None:
+    _logger.info("Pseudonymized %d rows.", summary.rows)
+    for column, stats in summary.cache_stats.items():
+        lookups = stats['hits'] + stats['misses']
+        _logger.info(
+            "Column '%s': %d cache hits, %d misses (%.1f%% hit rate).",
+            column, stats['hits'], stats['misses'],
+            100.0 * stats['hits'] / lookups if lookups else 0.0
+        )
+
+
+@contextlib.contextmanager
+def open_input(path: str) -> T.Iterator[T.TextIO]:
+    if path == '-':
+        yield sys.stdin
+        return
+    with open(path, 'r', encoding='utf-8', newline='', buffering=BUFFER_SIZE) as f:
+        yield f
+
+
+@contextlib.contextmanager
+def open_output(path: str) -> T.Iterator[T.TextIO]:
+    if path == '-':
+        yield sys.stdout
+        sys.stdout.flush()
+        return
+    with open(path, 'w', encoding='utf-8', newline='', buffering=BUFFER_SIZE) as f:
+        yield f
+
+
+def column_indices(header: T.Sequence[str], columns: T.Iterable[str]) -> T.List[int]:
+    # language=rst
+    """
+    Raises:
+        AssertionError: if one of the columns isn’t in the header.
+    """
+    retval = []
+    for column in columns:
+        assert column in header, "Column '%s' not found in the input." % column
+        retval.append(header.index(column))
+    return retval
+
+
+def _pseudonymize_rows(rows: T.List[T.List[str]], pseudonymizers: T.Dict[int, ColumnPseudonymizer]) -> None:
+    for row in rows:
+        for i, pseudonymizer in pseudonymizers.items():
+            if i < len(row):
+                row[i] = pseudonymizer(row[i])
+
+
+def pseudonymize_csv(
+    infile: T.TextIO,
+    outfile: T.TextIO,
+    columns: T.Iterable[str],
+    key: bytes,
+    delimiter: str = ',',
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    cache_size: int = DEFAULT_CACHE_SIZE
+) -> Summary:
+    # language=rst
+    """
+    Copies CSV data from *infile* to *outfile*, replacing the values in
+    *columns* by their pseudonyms. The first row must be a header row. At most
+    *chunk_size* rows are kept in memory at any time.
+    """
+    reader = csv.reader(infile, delimiter=delimiter)
+    writer = csv.writer(outfile, delimiter=delimiter, lineterminator='\n')
+    header = next(reader, None)
+    if header is None:
+        return Summary(0, {})
+    indices = column_indices(header, columns)
+    pseudonymizers = {i: ColumnPseudonymizer(key, cache_size) for i in indices}
+    writer.writerow(header)
+    rows = 0
+    while True:
+        chunk = list(itertools.islice(reader, chunk_size))
+        if not chunk:
+            break
+        _pseudonymize_rows(chunk, pseudonymizers)
+        writer.writerows(chunk)
+        rows += len(chunk)
+    return Summary(rows, {header[i]: p.cache_stats() for i, p in pseudonymizers.items()})
+
+
+def byte_ranges(f: T.BinaryIO, start: int, range_size: int) -> T.List[T.Tuple[int, int]]:
+    # language=rst
+    """
+    Splits the contents of *f* from offset *start* into ranges of roughly
+    *range_size* bytes, each of which ends just after a newline or at the end
+    of the file.
+    """
+    size = f.seek(0, io.SEEK_END)
+    retval = []
+    while start < size:
+        f.seek(min(start + range_size, size))
+        f.readline()
+        end = f.tell()
+        retval.append((start, end))
+        start = end
+    return retval
+
+
+# Memo caches live as long as the worker process, so that they’re shared
+# between all the ranges that a worker processes:
+_worker_pseudonymizers: T.Dict[T.Tuple[bytes, int, int], ColumnPseudonymizer] = {}
+
+
+def _pseudonymize_range(
+    path: str, start: int, end: int, indices: T.Sequence[int], key: bytes, delimiter: str,
+    cache_size: int
+) -> T.Tuple[int, bytes, T.Dict[int, collections.Counter]]:
+    # language=rst
+    """
+    Runs in a worker process.
+
+    Returns:
+        The number of rows, the output, and the memo cache hits and misses per
+        column during this call.
+
+    Raises:
+        AssertionError: if a field contains a newline. A quoted newline means
+            that the record may have been split across two ranges.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    rows = list(csv.reader(io.StringIO(data.decode('utf-8'), newline=''), delimiter=delimiter))
+    for row in rows:
+        for field in row:
+            assert '\n' not in field and '\r' not in field, \
+                "Fields with newlines can’t be processed in parallel. Use --jobs 1."
+    pseudonymizers = {}
+    for i in indices:
+        pseudonymizer = _worker_pseudonymizers.get((key, i, cache_size))
+        if pseudonymizer is None:
+            pseudonymizer = ColumnPseudonymizer(key, cache_size)
+            _worker_pseudonymizers[(key, i, cache_size)] = pseudonymizer
+        pseudonymizers[i] = pseudonymizer
+    stats_before = {i: p.cache_stats() for i, p in pseudonymizers.items()}
+    _pseudonymize_rows(rows, pseudonymizers)
+    outfile = io.StringIO(newline='')
+    csv.writer(outfile, delimiter=delimiter, lineterminator='\n').writerows(rows)
+    return len(rows), outfile.getvalue().encode('utf-8'), {
+        i: p.cache_stats() - stats_before[i] for i, p in pseudonymizers.items()
+    }
+
+
+def pseudonymize_parallel(
+    path: str,
+    outfile: T.BinaryIO,
+    columns: T.Iterable[str],
+    key: bytes,
+    delimiter: str = ',',
+    jobs: T.Optional[int] = None,
+    range_size: int = DEFAULT_RANGE_SIZE,
+    cache_size: int = DEFAULT_CACHE_SIZE
+) -> Summary:
+    # language=rst
+    """
+    Like :func:`pseudonymize_csv`, but splits the file at *path* into
+    newline-aligned byte ranges that are processed by *jobs* worker processes.
+    The output is identical to that of :func:`pseudonymize_csv`. Only a few
+    ranges per worker are in flight at any time, so memory use is bounded.
+    """
+    with open(path, 'rb') as f:
+        header_line = f.readline()
+        ranges = byte_ranges(f, f.tell(), range_size)
+    header = next(csv.reader([header_line.decode('utf-8')], delimiter=delimiter), None)
+    if header is None:
+        return Summary(0, {})
+    indices = column_indices(header, columns)
+    header_out = io.StringIO(newline='')
+    csv.writer(header_out, delimiter=delimiter, lineterminator='\n').writerow(header)
+    outfile.write(header_out.getvalue().encode('utf-8'))
+
+    rows = 0
+    cache_stats = {i: collections.Counter() for i in indices}
+    with ProcessPoolExecutor(jobs) as executor:
+        window = collections.deque()
+        ranges = iter(ranges)
+        max_in_flight = 2 * (jobs or os.cpu_count() or 1)
+        while True:
+            for start, end in itertools.islice(ranges, max_in_flight - len(window)):
+                window.append(executor.submit(
+                    _pseudonymize_range, path, start, end, indices, key, delimiter, cache_size
+                ))
+            if not window:
+                break
+            range_rows, data, range_stats = window.popleft().result()
+            outfile.write(data)
+            rows += range_rows
+            for i, stats in range_stats.items():
+                cache_stats[i].update(stats)
+    return Summary(rows, {header[i]: stats for i, stats in cache_stats.items()})
+
+
+def _mapped_lines(mm: mmap.mmap, pos: int, position: T.List[int]) -> T.Iterator[str]:
+    # language=rst
+    """
+    Yields the decoded lines of *mm* from offset *pos*, with their line
+    endings, split like a text file opened with ``newline=''`` would be.
+    ``position[0]`` is set to the offset just after the last yielded line.
+    """
+    size = len(mm)
+    while pos < size:
+        nl = mm.find(b'\n', pos)
+        end = size if nl < 0 else nl + 1
+        cr = mm.find(b'\r', pos, end)
+        if cr >= 0 and cr != nl - 1:
+            end = cr + 1
+        position[0] = end
+        yield mm[pos:end].decode('utf-8')
+        pos = end
+
+
+def pseudonymize_mmap(
+    path: str,
+    outfile: T.BinaryIO,
+    columns: T.Iterable[str],
+    key: bytes,
+    delimiter: str = ',',
+    cache_size: int = DEFAULT_CACHE_SIZE,
+    block_size: int = BUFFER_SIZE
+) -> Summary:
+    # language=rst
+    """
+    Like :func:`pseudonymize_csv`, but maps the file at *path* into memory and
+    splits records and fields in the undecoded bytes, which are also what is
+    hashed. Blocks of about *block_size* bytes without quotes or bare carriage
+    returns, which is most data, are split in one go. Records in other blocks
+    are parsed by the :mod:`csv` module, so the output is identical to that of
+    :func:`pseudonymize_csv`.
+
+    Each block is copied out of the map and split with :meth:`bytes.split`,
+    rather than hashing :class:`memoryview` slices at field offsets found in
+    the map. Copying a block and its fields is cheap, while finding the
+    offsets of each field takes a Python loop, which made that reader slower
+    than the buffered one (see ``benchmarks/bench_mmap.py``). The memo cache
+    also needs keys that outlive the map.
+    """
+    if os.path.getsize(path) == 0:
+        return Summary(0, {})
+    delim = delimiter.encode('utf-8')
+    writer_buffer = io.StringIO(newline='')
+    writer = csv.writer(writer_buffer, delimiter=delimiter, lineterminator='\n')
+
+    def parse(pos: int) -> T.Tuple[T.List[str], int]:
+        position = [pos]
+        row = next(csv.reader(_mapped_lines(mm, pos, position), delimiter=delimiter))
+        return row, position[0]
+
+    def unparse(row: T.List[str]) -> bytes:
+        writer_buffer.seek(0)
+        writer_buffer.truncate()
+        writer.writerow(row)
+        return writer_buffer.getvalue().encode('utf-8')
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        header, pos = parse(0)
+        indices = column_indices(header, columns)
+        pseudonymizers = {i: ColumnPseudonymizer(key, cache_size) for i in indices}
+        outfile.write(unparse(header))
+        if hasattr(mmap, 'MADV_SEQUENTIAL'):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        rows = 0
+        released = 0
+        while pos < size:
+            done = pos - pos % mmap.PAGESIZE
+            if hasattr(mmap, 'MADV_DONTNEED') and done - released >= block_size:
+                # Pages that we’re done with would otherwise count towards our
+                # resident set size until the kernel needs the memory:
+                mm.madvise(mmap.MADV_DONTNEED, released, done - released)
+                released = done
+            end = mm.find(b'\n', min(pos + block_size, size))
+            end = size if end < 0 else end + 1
+            block = mm[pos:end]
+            if b'\r' in block and block.count(b'\r') == block.count(b'\r\n'):
+                block = block.replace(b'\r\n', b'\n')
+            if b'"' in block or b'\r' in block:
+                parts = []
+                while pos < end:
+                    row, pos = parse(pos)
+                    _pseudonymize_rows([row], pseudonymizers)
+                    parts.append(unparse(row))
+                outfile.write(b''.join(parts))
+                rows += len(parts)
+                continue
+            records = block.split(b'\n')
+            if records[-1] == b'':
+                records.pop()
+            for n, record in enumerate(records):
+                if record == b'':
+                    continue
+                fields = record.split(delim)
+                for i, pseudonymizer in pseudonymizers.items():
+                    if i < len(fields):
+                        fields[i] = pseudonymizer.pseudonymize_bytes(fields[i])
+                if len(fields) == 1 and fields[0] == b'':
+                    # The csv module quotes a lone empty field:
+                    fields[0] = b'""'
+                records[n] = delim.join(fields)
+            records.append(b'')
+            outfile.write(b'\n'.join(records))
+            rows += len(records) - 1
+            pos = end
+    return Summary(rows, {header[i]: p.cache_stats() for i, p in pseudonymizers.items()})
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise AssertionError(
+            "Install pyarrow to process Parquet and Arrow files: pip install pseudomat[parquet]"
+        ) from None
+    return pyarrow
+
+
+def file_format(path: str, fmt: T.Optional[str] = None) -> str:
+    # language=rst
+    """
+    Returns:
+        One of :data:`FORMATS`: *fmt* if given, or else the format that
+        corresponds with the extension of *path*. Defaults to ``'csv'``.
+    """
+    if fmt is not None:
+        return fmt
+    return _EXTENSIONS.get(os.path.splitext(path)[1].lower(), 'csv')
+
+
+def _pseudonymize_array(array, pseudonymizer: ColumnPseudonymizer):
+    # language=rst
+    """
+    Pseudonymizes a whole column of a record batch. The column is dictionary
+    encoded first, if it isn’t already, so that each distinct value is
+    pseudonymized only once per batch. Non-string values are pseudonymized by
+    their string representation, as they would be in a CSV file.
+
+    Returns:
+        pyarrow.DictionaryArray: with ``int32`` indices and ``string`` values.
+    """
+    pa = _import_pyarrow()
+    if not pa.types.is_dictionary(array.type):
+        array = pa.compute.dictionary_encode(array)
+    dictionary = array.dictionary
+    if not pa.types.is_string(dictionary.type):
+        dictionary = pa.compute.cast(dictionary, pa.string())
+    pseudonyms = pa.array(
+        [None if value is None else pseudonymizer(value) for value in dictionary.to_pylist()],
+        type=pa.string()
+    )
+    return pa.DictionaryArray.from_arrays(array.indices.cast(pa.int32()), pseudonyms)
+
+
+def _record_batches(path: str, fmt: str, columns: T.Sequence[str], batch_size: int):
+    # language=rst
+    """
+    Returns:
+        A tuple ``(schema, batches)``, where *batches* is an iterator of record
+        batches of at most *batch_size* rows.
+    """
+    pa = _import_pyarrow()
+    if fmt == 'parquet':
+        schema = pa.parquet.read_schema(path)
+        # Let the Parquet reader produce dictionary arrays for the string
+        # columns, instead of decoding every value:
+        read_dictionary = [
+            c for c in columns
+            if c in schema.names and (pa.types.is_string(schema.field(c).type) or
+                                      pa.types.is_binary(schema.field(c).type))
+        ]
+        parquet_file = pa.parquet.ParquetFile(path, read_dictionary=read_dictionary)
+        return parquet_file.schema_arrow, parquet_file.iter_batches(batch_size=batch_size)
+    try:
+        reader = pa.ipc.open_file(path)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    except pa.ArrowInvalid:
+        reader = pa.ipc.open_stream(path)
+        batches = iter(reader)
+
+    def sliced():
+        for batch in batches:
+            for offset in range(0, batch.num_rows, batch_size):
+                yield batch.slice(offset, batch_size)
+    return reader.schema, sliced()
+
+
+def pseudonymize_columnar(
+    input_path: str,
+    output_path: str,
+    columns: T.Iterable[str],
+    key: bytes,
+    fmt: str,
+    batch_size: int = DEFAULT_CHUNK_SIZE,
+    cache_size: int = DEFAULT_CACHE_SIZE
+) -> Summary:
+    # language=rst
+    """
+    Pseudonymizes a Parquet or Arrow IPC file, one record batch at a time.
+    Pseudonymized columns are written dictionary-encoded, and their pseudonyms
+    are the same as for the same values in a CSV file.
+
+    Arrow input may be in the IPC file or stream format. Arrow output is always
+    in the stream format, because the file format doesn’t allow a different
+    dictionary per batch.
+    """
+    pa = _import_pyarrow()
+    assert input_path != '-' and output_path != '-', \
+        "Parquet and Arrow files can’t be read from or written to a pipe."
+    columns = list(columns)
+    schema, batches = _record_batches(input_path, fmt, columns, batch_size)
+    indices = column_indices(schema.names, columns)
+    pseudonymizers = {i: ColumnPseudonymizer(key, cache_size) for i in indices}
+    for i in indices:
+        schema = schema.set(i, pa.field(schema.names[i], pa.dictionary(pa.int32(), pa.string())))
+    # Metadata, such as a pandas schema, may refer to the original types:
+    schema = schema.remove_metadata()
+    if fmt == 'parquet':
+        writer = pa.parquet.ParquetWriter(output_path, schema, use_dictionary=True)
+    else:
+        writer = pa.ipc.new_stream(output_path, schema)
+    rows = 0
+    with writer:
+        for batch in batches:
+            arrays = batch.columns
+            for i, pseudonymizer in pseudonymizers.items():
+                arrays[i] = _pseudonymize_array(arrays[i], pseudonymizer)
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            rows += batch.num_rows
+    return Summary(rows, {schema.names[i]: p.cache_stats() for i, p in pseudonymizers.items()})
+
+
+def pseudonymize_file(
+    input_path: str,
+    output_path: str,
+    columns: T.Iterable[str],
+    key: bytes,
+    delimiter: str = ',',
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    jobs: int = 1,
+    cache_size: int = DEFAULT_CACHE_SIZE,
+    fmt: T.Optional[str] = None,
+    use_mmap: bool = False
+) -> Summary:
+    # language=rst
+    """
+    Pseudonymizes *input_path* into *output_path*, in the same format. For CSV,
+    either may be ``'-'`` for standard input or output, and with more than one
+    job or with *use_mmap* the input must be a regular file.
+    """
+    fmt = file_format(input_path, fmt)
+    if fmt != 'csv':
+        if jobs != 1:
+            _logger.warning("Only CSV files can be processed in parallel. Using a single process.")
+        return pseudonymize_columnar(input_path, output_path, columns, key, fmt, chunk_size, cache_size)
+    if jobs != 1 and input_path == '-':
+        _logger.warning("Can’t process standard input in parallel. Using a single process.")
+        jobs = 1
+    if use_mmap and input_path == '-':
+        _logger.warning("Can’t map standard input into memory. Using the buffered reader.")
+        use_mmap = False
+    if use_mmap and jobs != 1:
+        _logger.warning("The memory-mapped reader uses a single process. Ignoring --mmap.")
+        use_mmap = False
+    if use_mmap:
+        with open_output(output_path) as outfile:
+            outfile.flush()
+            return pseudonymize_mmap(input_path, outfile.buffer, columns, key, delimiter, cache_size)
+    if jobs == 1:
+        with open_input(input_path) as infile, open_output(output_path) as outfile:
+            return pseudonymize_csv(infile, outfile, columns, key, delimiter, chunk_size, cache_size)
+    with open_output(output_path) as outfile:
+        outfile.flush()
+        return pseudonymize_parallel(
+            input_path, outfile.buffer, columns, key, delimiter, jobs or None,
+            cache_size=cache_size
+        )
@@ -16,11 +16,53 @@ def main():
         formatter_class=argparse.RawDescriptionHelpFormatter
     )
     parser.add_argument('-d', '--debug', action='store_true', dest='debug')
+    parser.add_argument(
+        '--timeout',
+        help="Seconds to wait for the Pseudomat service to respond. Defaults to %(default)s.",
+        action='store',
+        type=float,
+        default=30.0,
+        dest='timeout',
+        metavar='seconds'
+    )
+    parser.add_argument(
+        '--retries',
+        help="Number of times to retry a request after a connection error or a server "
+             "error, with exponential backoff. Defaults to %(default)s.",
+        action='store',
+        type=int,
+        default=3,
+        dest='retries',
+        metavar='N'
+    )
+    parser.add_argument(
+        '--profile',
+        help="Profile the command, and write the profile to the profiles directory in "
+             "the configuration directory. With --debug, also print the functions that "
+             "took the most time.",
+        action='store_true',
+        dest='profile'
+    )
+    parser.add_argument(
+        '--profile-file',
+        help="Profile the command, and write the profile to FILE instead.",
+        action='store',
+        dest='profile_file',
+        metavar='FILE'
+    )
+    parser.add_argument(
+        '--gzip',
+        help="Compress request bodies.",
+        action='store_true',
+        dest='gzip'
+    )
     subparsers = parser.add_subparsers(
         title='Available commands',
         description=textwrap.dedent("""\
             invite
+            keys
             project
+            pseudonymize
         """),
         dest='command',
         help="Run `%(prog)s COMMAND --help` for details.",
@@ -28,13 +70,15 @@ def main():
     )
 
     add_invite(subparsers)
+    add_keys(subparsers)
     add_project(subparsers)
+    add_pseudonymize(subparsers)
 
     retval = parser.parse_args()
     if retval.command is None:
         parser.print_help()
         parser.exit()
-    if retval.subcommand is None:
+    if getattr(retval, 'subcommand', '') is None:
         subparser = subparsers.choices[retval.command]
         subparser.print_help()
         subparser.exit()
@@ -66,14 +110,46 @@ Create a new invite, and register the invite with the Pseudomat service. This
 command is idempotent.
 
 Output: the invitation token you can send to the intended project member.
+
+With --from-file, invites everyone in the file, one name per line, and outputs
+one token per line. Keys are generated in parallel, and invites are uploaded
+over concurrent connections. Invites that were created before are reused, so
+an interrupted run can be repeated.
         """)
     )
     invite_create.add_argument(
         'name',
         help='The name of the party you wish to invite. This name will be visible to all project members.',
         action='store',
+        nargs='?',
         metavar='invitee_name'
     )
+    invite_create.add_argument(
+        '--from-file',
+        help="A file with the names of the parties you wish to invite, one per line, or '-' for standard input.",
+        action='store',
+        dest='from_file',
+        metavar='file'
+    )
+    invite_create.add_argument(
+        '-j', '--jobs',
+        help="Number of worker processes that generate keys with --from-file, or 0 for one per CPU. "
+             "Defaults to %(default)s.",
+        action='store',
+        type=int,
+        default=0,
+        dest='jobs',
+        metavar='N'
+    )
+    invite_create.add_argument(
+        '--connections',
+        help="Number of concurrent uploads with --from-file. Defaults to %(default)s.",
+        action='store',
+        type=int,
+        default=8,
+        dest='connections',
+        metavar='N'
+    )
     invite_create.add_argument(
         '-p', '--project',
         help="Name of the project to use, instead of the default project.",
@@ -83,6 +159,51 @@ Output: the invitation token you can send to the intended project member.
     )
 
 
+def add_keys(subparsers):
+    keys = subparsers.add_parser(
+        'keys',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    keys_subparsers = keys.add_subparsers(
+        title='Available subcommands',
+        description=textwrap.dedent("""\
+            prefill
+        """),
+        dest='subcommand',
+        help="Run `%(prog)s SUBCOMMAND --help` for details.",
+        metavar='SUBCOMMAND'
+    )
+
+    # KEYS PREFILL
+    # ------------
+    keys_prefill = keys_subparsers.add_parser(
+        'prefill',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=textwrap.dedent("""\
+            Generate keys in advance, until the local key pool holds the given number of
+            key pairs. Creating a project or an invite takes a key pair from the pool
+            instead of generating one, which makes it faster. A key pair is removed from
+            the pool when it’s taken, so it’s never used twice.
+
+            Output: the number of key pairs in the pool.
+        """)
+    )
+    keys_prefill.add_argument(
+        'size',
+        help='The number of key pairs that the pool should hold.',
+        action='store',
+        type=int,
+        metavar='N'
+    )
+    keys_prefill.add_argument(
+        '--background',
+        help="Keep the pool at this size from now on, by refilling it in the background "
+             "whenever it drops below half. Use a size of 0 to stop doing so.",
+        action='store_true',
+        dest='background'
+    )
+
+
 def add_project(subparsers):
     project = subparsers.add_parser(
         'project',
@@ -184,5 +305,106 @@ def add_project(subparsers):
     )
 
 
+def add_pseudonymize(subparsers):
+    pseudonymize = subparsers.add_parser(
+        'pseudonymize',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=textwrap.dedent("""\
+            Pseudonymize a CSV, Parquet or Arrow file.
+
+            The values in the given columns are replaced by a keyed hash, using a key
+            derived from the project’s secret keys. Equal values get equal pseudonyms,
+            so that files from different suppliers can still be linked. The first row
+            of the input must contain the column names.
+
+            The input is processed as a stream, so files of any size can be processed
+            in constant memory. The output has the same format as the input. Parquet
+            and Arrow support requires pyarrow.
+        """)
+    )
+    pseudonymize.add_argument(
+        'input',
+        help="The file to pseudonymize, or '-' for CSV on standard input.",
+        action='store',
+        metavar='input_file'
+    )
+    pseudonymize.add_argument(
+        '-c', '--column',
+        help="Name of a column to pseudonymize. Can be repeated.",
+        action='append',
+        required=True,
+        dest='columns',
+        metavar='column_name'
+    )
+    pseudonymize.add_argument(
+        '-o', '--output',
+        help="Where to write the pseudonymized file. Defaults to standard output.",
+        action='store',
+        default='-',
+        dest='output',
+        metavar='output_file'
+    )
+    pseudonymize.add_argument(
+        '-p', '--project',
+        help="Name of the project to use, instead of the default project.",
+        action='store',
+        dest='project',
+        metavar='project_name'
+    )
+    pseudonymize.add_argument(
+        '-f', '--format',
+        help="The file format. By default, this is derived from the file name "
+             "extension: .parquet or .pq for Parquet, .arrow or .feather for "
+             "Arrow IPC, and CSV otherwise.",
+        action='store',
+        choices=['csv', 'parquet', 'arrow'],
+        dest='format'
+    )
+    pseudonymize.add_argument(
+        '--delimiter',
+        help="The field delimiter. Defaults to ','.",
+        action='store',
+        default=',',
+        dest='delimiter'
+    )
+    pseudonymize.add_argument(
+        '--chunk-size',
+        help="Number of rows (or rows per record batch) to process at a time. "
+             "Defaults to %(default)s.",
+        action='store',
+        type=int,
+        default=10000,
+        dest='chunk_size',
+        metavar='rows'
+    )
+    pseudonymize.add_argument(
+        '--cache-size',
+        help="Number of distinct values per column whose pseudonyms are kept in "
+             "memory, or 0 to disable caching. Defaults to %(default)s.",
+        action='store',
+        type=int,
+        default=65536,
+        dest='cache_size',
+        metavar='values'
+    )
+    pseudonymize.add_argument(
+        '-j', '--jobs',
+        help="Number of worker processes, or 0 for one per CPU. Requires a regular "
+             "input file without newlines inside fields. Defaults to %(default)s.",
+        action='store',
+        type=int,
+        default=1,
+        dest='jobs',
+        metavar='N'
+    )
+    pseudonymize.add_argument(
+        '--mmap',
+        help="Map the input file into memory and parse it in place, which is "
+             "faster for very large CSV files. Requires a regular input file.",
+        action='store_true',
+        dest='mmap'
+    )
+
+
 if __name__ == '__main__':
     print(repr(main()))
@@ -0,0 +1,145 @@
+# language=rst
+"""
+The HTTP client through which the CLI talks to the Pseudomat service.
+
+One :class:`Client` is shared by all remote actions, see :func:`get_client`.
+It keeps connections alive between requests, retries requests that fail with
+a connection error or a ``5xx`` status, and logs the timing of every request
+at debug level. Every request that the CLI makes is idempotent, so retrying
+is safe.
+"""
+
+import gzip
+import logging
+import time
+import typing as T
+
+from yarl import URL
+
+from . import globals
+
+if T.TYPE_CHECKING:
+    import requests
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = (5.0, 30.0)
+"""Connect and read timeouts, in seconds."""
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+"""Seconds to wait before the second retry, doubling for every next one."""
+DEFAULT_POOL_SIZE = 8
+"""Number of keep-alive connections per host."""
+GZIP_MIN_LENGTH = 1024
+"""Request bodies smaller than this aren’t worth compressing."""
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class Client(object):
+    def __init__(
+        self,
+        base_url: T.Optional[URL] = None,
+        timeout: T.Union[float, T.Tuple[float, float]] = DEFAULT_TIMEOUT,
+        retries: int = DEFAULT_RETRIES,
+        backoff: float = DEFAULT_BACKOFF,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        gzip: bool = False
+    ):
+        # language=rst
+        """
+        Args:
+            base_url: the URL of the service. Defaults to
+                :data:`pseudomat.cli.globals.SERVER_URL` at the time of each
+                request.
+            gzip: whether to compress request bodies.
+        """
+        self.base_url = base_url
+        self.timeout = timeout
+        self.gzip = gzip
+        self.pool_size = pool_size
+        # Imported here, so that configure() doesn’t import them for commands
+        # that never talk to the service:
+        import requests
+        import requests.adapters
+        from urllib3.util.retry import Retry
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=backoff,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=None,  # All methods, since all are idempotent
+                raise_on_status=False,
+                respect_retry_after_header=True
+            )
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def url(self, *path: str) -> URL:
+        retval = self.base_url or globals.SERVER_URL
+        for segment in path:
+            retval = retval / segment
+        return retval
+
+    def request(self, method: str, url: T.Union[URL, str], data: T.Union[str, bytes, None] = None,
+                headers: T.Optional[T.Dict[str, str]] = None) -> 'requests.Response':
+        headers = dict(headers or {})
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if self.gzip and data is not None and len(data) >= GZIP_MIN_LENGTH:
+            data = gzip.compress(data)
+            headers['Content-Encoding'] = 'gzip'
+        start = time.perf_counter()
+        retval = self.session.request(
+            method, str(url), data=data, headers=headers, timeout=self.timeout, allow_redirects=False
+        )
+        _logger.debug("%s %s: %d in %.1f ms", method, url, retval.status_code,
+                      (time.perf_counter() - start) * 1000)
+        return retval
+
+    def get(self, url: T.Union[URL, str], **kwargs) -> 'requests.Response':
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: T.Union[URL, str], **kwargs) -> 'requests.Response':
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url: T.Union[URL, str], **kwargs) -> 'requests.Response':
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url: T.Union[URL, str], **kwargs) -> 'requests.Response':
+        return self.request('DELETE', url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_client: T.Optional[Client] = None
+_options: dict = {}
+
+
+def configure(**options) -> None:
+    # language=rst
+    """
+    Sets options for the shared client, as keyword arguments of
+    :class:`Client`. Replaces the shared client, if any.
+    """
+    global _client
+    _options.update(options)
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+def get_client() -> Client:
+    # language=rst
+    """
+    Returns:
+        The shared client, which is created on first use.
+    """
+    global _client
+    if _client is None:
+        _client = Client(**_options)
+    return _client
@@ -1,14 +1,33 @@
+# language=rst
+"""
+One function per CLI command, taking the parsed arguments.
+
+Actions are imported by the commands that use them, so that each command only
+pays for the modules it needs; the CLI is often called many times in a row
+from shell pipelines. Commands that don’t use the local database are marked
+with :func:`without_database`, so that :mod:`pseudomat.cli.__main__` doesn’t
+initialize it for them.
+"""
+
 import logging
 import sys
 
 from . import actions
 
-
 _logger = logging.getLogger(__name__)
 PROJECT_JWS = 'project.jws'
 PROJECT_JWKS = 'project.jwks'
 
 
+def without_database(command):
+    command.uses_database = False
+    return command
+
+
+def uses_database(command) -> bool:
+    return getattr(command, 'uses_database', True)
+
+
 def project_create(args):
     project = actions.project.create_local_project(args.email, args.name)
     try:
@@ -29,6 +48,7 @@ def project_delete(args):
         actions.project.set_default_project_id(None)
 
 
+@without_database
 def project_info(_args):
     sys.exit("Sorry, not implemented yet.")
 
@@ -39,10 +59,48 @@ def project_list(args):
 
 def invite_create(args):
     project = actions.project.get_current_project(args)
+    if (args.name is None) == (args.from_file is None):
+        sys.exit("Specify either an invitee name or --from-file.")
+    if args.from_file is not None:
+        names = actions.invite.read_invitees(args.from_file)
+        failed = 0
+        for name, token, error in actions.invite.create_invites(
+            project, names, jobs=args.jobs or None, connections=args.connections
+        ):
+            if error is None:
+                print(token, flush=True)
+            else:
+                _logger.error("%s: %s", name, error)
+                failed += 1
+        if failed:
+            sys.exit("%d of %d invites failed. Run the same command again to retry them." % (failed, len(names)))
+        return
     invite = actions.invite.create_local_invite(project, args.name)
     try:
         actions.invite.create_remote_invite(invite)
     except BaseException:
         actions.invite.delete_invite(invite)
         raise
-    print(invite.sjws)
+    print(invite['sjws'])
+
+
+def keys_prefill(args):
+    actions.keys.prefill(args.size)
+    if args.background:
+        actions.keys.set_background_size(args.size or None)
+    print(actions.keys.pool_size())
+
+
+def pseudonymize(args):
+    project = actions.project.get_current_project(args)
+    key = actions.pseudonymize.project_key(project)
+    summary = actions.pseudonymize.pseudonymize_file(
+        args.input, args.output, args.columns, key,
+        delimiter=args.delimiter,
+        chunk_size=args.chunk_size,
+        jobs=args.jobs,
+        cache_size=args.cache_size,
+        fmt=args.format,
+        use_mmap=args.mmap
+    )
+    actions.pseudonymize.log_summary(summary)
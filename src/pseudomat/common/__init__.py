@@ -1,15 +1,20 @@
 import base64
 import binascii
 import hashlib
+import hmac
 import json
 import logging
 import typing as T
 
 from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey, Ed25519PrivateKey
+from cryptography.hazmat.primitives.asymmetric.ed448 import Ed448PublicKey, Ed448PrivateKey
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PublicKey
+from cryptography.hazmat.primitives.asymmetric.x448 import X448PublicKey
 from cryptography.exceptions import InvalidSignature
-from jwcrypto import jwk, jws
 
-from . import exceptions, schemas
+# Schema validation pulls in jsonschema and werkzeug, which only the server and
+# the validate_*_jws() functions need, so .schemas is imported on first use:
+from . import cache, codec, exceptions, metrics
 
 _logger = logging.getLogger(__package__)
 VERSION = '0.1.0'
@@ -37,8 +42,10 @@ def b64decode(s: T.Union[str, bytes]) -> bytes:
     return base64.urlsafe_b64decode(s)
 
 
-def json_dumps(o: T.Union[str, list, dict]) -> str:
-    return json.dumps(o, separators=(',', ':'), sort_keys=True)
+json_dumps: T.Callable[[T.Union[str, list, dict]], str] = codec.dumps
+"""The canonical JSON encoding; see :mod:`pseudomat.common.codec`."""
+json_dumps_bytes: T.Callable[[T.Union[str, list, dict]], bytes] = codec.dumps_bytes
+"""Like :func:`json_dumps`, but UTF-8-encoded, which saves a copy."""
 
 
 json_loads = json.loads
@@ -46,8 +53,8 @@ json_loads = json.loads
 
 def fingerprint(o: T.Union[bytes, str, list, dict], rtype=str) -> T.Union[str, bytes]:
     if isinstance(o, list) or isinstance(o, dict):
-        o = json_dumps(o)
-    if isinstance(o, str):
+        o = json_dumps_bytes(o)
+    elif isinstance(o, str):
         o = o.encode('utf-8')
     return b64encode(
         hashlib.sha256(o).digest()[:24],
@@ -55,24 +62,98 @@ def fingerprint(o: T.Union[bytes, str, list, dict], rtype=str) -> T.Union[str, b
     )
 
 
-def validate_jws(data: str, typ: str) -> T.Tuple[jws.JWS, T.Dict[str, T.Any]]:
+def keyed_fingerprint(key: bytes, o: T.Union[bytes, str, list, dict], rtype=str) -> T.Union[str, bytes]:
+    # language=rst
+    """
+    Like :func:`fingerprint`, but with HMAC-SHA256 instead of plain SHA-256, so
+    that only holders of *key* can compute or verify it. This is the hash that
+    is used for pseudonymization.
+    """
+    if isinstance(o, list) or isinstance(o, dict):
+        o = json_dumps_bytes(o)
+    elif isinstance(o, str):
+        o = o.encode('utf-8')
+    return b64encode(hmac.digest(key, o, 'sha256')[:24], rtype=rtype)
+
+
+_VERIFYING_KEYS = (Ed25519PublicKey, Ed448PublicKey)
+_OKP_PUBLIC_KEY_TYPES = {
+    'Ed25519': Ed25519PublicKey,
+    'Ed448': Ed448PublicKey,
+    'X25519': X25519PublicKey,
+    'X448': X448PublicKey,
+}
+public_keys = cache.LRUCache(maxsize=1024)
+"""Public key objects by ``(crv, x)``. Parsing is much more expensive than a lookup.
+This is the only cache of parsed keys; the server sets its size."""
+
+
+def load_public_jwk(key: T.Union[str, dict]):
+    # language=rst
+    """
+    Parses the public part of an ``OKP`` JWK into a ``cryptography`` key object.
+
+    Args:
+        key: the JWK, as a dict or as a JSON string.
+
+    Returns:
+        One of ``Ed25519PublicKey``, ``Ed448PublicKey``, ``X25519PublicKey`` or
+        ``X448PublicKey``.
+
+    Raises:
+        ValueError: if *key* isn’t a valid ``OKP`` JWK.
+    """
+    if isinstance(key, str):
+        key = json_loads(key)
+    if not isinstance(key, dict) or key.get('kty') != 'OKP' or \
+            not isinstance(key.get('x'), str):
+        raise ValueError("Not an OKP key.")
+    cache_key = (key.get('crv'), key['x'])
+    retval = public_keys.get(cache_key)
+    if retval is None:
+        key_type = _OKP_PUBLIC_KEY_TYPES.get(cache_key[0])
+        if key_type is None:
+            raise ValueError("Unsupported curve: %s" % cache_key[0])
+        retval = key_type.from_public_bytes(b64decode(cache_key[1]))
+        public_keys.put(cache_key, retval)
+    return retval
+
+
+def validate_jws(data: str, typ: str) -> 'SignedObject':
     """
     Raises:
         pseudomat.common.exceptions.HTTPResponse: Bad Request; read the source for details.
     """
-    decoder = jws.JWS()
     try:
-        decoder.deserialize(data)
-    except jws.InvalidJWSObject:
+        decoder = SignedObject(data)
+    except ValueError:
         raise exceptions.HTTPResponse(400, "Syntax error in JWS.")
-    if decoder.jose_header.get('typ', None) != typ:
+    if decoder.header.get('typ', None) != typ:
         raise exceptions.HTTPResponse(400, "Invalid 'typ' claim.")
     try:
-        payload = json_loads(decoder.objects['payload'])
-    except json.JSONDecodeError:
+        decoder.payload
+    except ValueError:
         raise exceptions.HTTPResponse(400, "Payload isn’t valid JSON.")
 
-    return decoder, payload
+    return decoder
+
+
+def _validate_public_keys(payload: dict) -> None:
+    """
+    Raises:
+        AssertionError: if one of the keys contains private key material.
+        pseudomat.common.exceptions.HTTPResponse: ``422 Unprocessable Entity``
+    """
+    for claim in ('psig', 'penc'):
+        value = payload[claim]
+        assert 'd' not in value, "Private key found in keyset."
+        try:
+            load_public_jwk(value)
+        except ValueError:
+            raise exceptions.HTTPResponse(
+                422,  # Unprocessable Entity
+                "Claim '%s' doesn’t contain a valid JWK." % claim
+            )
 
 
 def validate_project_jws(data: str) -> dict:
@@ -84,39 +165,29 @@ def validate_project_jws(data: str) -> dict:
             other problems with the provided JWS.
     """
     # Raises 400 Bad Request:
-    decoder, payload = validate_jws(data, 'project')
+    with metrics.stage('jws'):
+        decoder = validate_jws(data, 'project')
+        payload = decoder.payload
 
+    from . import schemas
     # From here on, "Unprocessable Entity" must be raised on error:
     try:
-        schemas.validate_schema(payload, 'project')
-        assert (
-            payload['sub'] == payload['sub'].strip(' '),
-            "Claim 'sub' mustn’t start or end with whitespace."
-        )
-        assert (
-            payload['jti'] == fingerprint(payload['sub']),
-            "Claim 'jti' doesn’t correspond with claim 'sub'."
-        )
+        with metrics.stage('schema'):
+            schemas.validate_schema(payload, 'project')
+            assert payload['sub'] == payload['sub'].strip(' '), \
+                "Claim 'sub' mustn’t start or end with whitespace."
+            assert payload['jti'] == fingerprint(payload['sub']), \
+                "Claim 'jti' doesn’t correspond with claim 'sub'."
 
         # Extract and syntax-check the keys:
-        signing_key: T.Optional[jwk.JWK] = None
-        for claim in ('psig', 'penc'):
-            value = payload[claim]
-            try:
-                key = jwk.JWK.from_json(json_dumps(value))
-            except jwk.JWException:
-                raise exceptions.HTTPResponse(
-                    422,  # Unprocessable Entity
-                    "Claim '%s' doesn’t contain a valid JWK."
-                )
-            assert not key.has_private, "Private key found in keyset."
-            if claim == 'psig':
-                signing_key = key
+        with metrics.stage('jwk'):
+            _validate_public_keys(payload)
 
         # Validate the signature:
         try:
-            decoder.verify(signing_key, alg='EdDSA')
-        except jws.InvalidJWSSignature:
+            with metrics.stage('signature'):
+                decoder.validate(load_public_jwk(payload['psig']))
+        except InvalidSignature:
             raise exceptions.HTTPResponse(
                 422,  # Unprocessable Entity
                 "Signature validation failed."
@@ -128,42 +199,42 @@ def validate_project_jws(data: str) -> dict:
     return payload
 
 
-def validate_invite_jws(data: str, project_key: jwk.JWK) -> dict:
+def validate_invite_jws(data: str, project_key) -> dict:
     # language=rst
     """
+    Args:
+        project_key: the public signing key of the project, as returned by
+            :func:`load_public_jwk`.
+
     Raises:
-        ValueError: corresponds to ``400 Bad Request``
+        pseudomat.common.exceptions.HTTPResponse: ``400 Bad Request`` for JWS
+            syntax errors
+        pseudomat.common.exceptions.HTTPResponse: ``422 Unprocessable Entity`` for
+            other problems with the provided JWS.
     """
-    decoder, payload = validate_jws(data, 'pinvite')  # Raises ValueError
+    with metrics.stage('jws'):
+        decoder = validate_jws(data, 'pinvite')  # Raises 400 Bad Request
+        payload = decoder.payload
 
+    from . import schemas
     # From here on, "Unprocessable Entity" must be raised on error:
     try:
-        schemas.validate_schema(payload, 'pinvite')
-        assert (
-            payload['sub'] == payload['sub'].strip(' '),
-            "Claim 'sub' mustn’t start or end with whitespace."
-        )
-        assert (
-            payload['jti'] == fingerprint([payload['iss'], payload['sub']]),
-            "Claim 'jti' doesn’t compute."
-        )
+        with metrics.stage('schema'):
+            schemas.validate_schema(payload, 'pinvite')
+            assert payload['sub'] == payload['sub'].strip(' '), \
+                "Claim 'sub' mustn’t start or end with whitespace."
+            assert payload['jti'] == fingerprint([payload['iss'], payload['sub']]), \
+                "Claim 'jti' doesn’t compute."
 
         # Extract and syntax-check the keys:
-        for claim in ('psig', 'penc'):
-            value = payload[claim]
-            try:
-                key = jwk.JWK.from_json(json_dumps(value))
-            except jwk.JWException:
-                raise exceptions.HTTPResponse(
-                    422,  # Unprocessable Entity
-                    "Claim '%s' doesn’t contain a valid JWK."
-                )
-            assert not key.has_private, "Private key found in keyset."
+        with metrics.stage('jwk'):
+            _validate_public_keys(payload)
 
         # Validate the signature:
         try:
-            decoder.verify(project_key, alg='EdDSA')
-        except jws.InvalidJWSSignature:
+            with metrics.stage('signature'):
+                decoder.validate(project_key)
+        except InvalidSignature:
             raise exceptions.HTTPResponse(
                 422,  # Unprocessable Entity
                 "Signature validation failed."
@@ -179,6 +250,15 @@ def validate_invite_jws(data: str, project_key: jwk.JWK) -> dict:
 
 
 class SignedObject(object):
+    # language=rst
+    """
+    A JWS in compact serialization, parsed and verified directly with
+    ``cryptography`` instead of jwcrypto. Only ``EdDSA`` is supported, with
+    Ed25519 and Ed448 keys.
+
+    Raises:
+        ValueError: if *s* isn’t a syntactically valid compact JWS.
+    """
 
     def __init__(self, s: str):
         try:
@@ -186,25 +266,61 @@ class SignedObject(object):
             assert len(objects) == 3
             self.signee = '.'.join([objects[0], objects[1]]).encode('ascii')
             self.header = json_loads(b64decode(objects[0]).decode('utf-8'))
-            self.payload = json_loads(b64decode(objects[1]).decode('utf-8'))
+            assert isinstance(self.header, dict)
+            self.raw_payload = b64decode(objects[1])
             self.signature = b64decode(objects[2])
         except Exception as e:
             raise ValueError('Syntax error in signed object: %s' % s) from e
-
-    def validate(self, key: T.Optional[Ed25519PublicKey]):
-        assert self.header.get('alg', None) == SIGNING_ALGORITHM
+        self._payload = None
+
+    @property
+    def payload(self):
+        """
+        The payload, decoded as JSON.
+
+        Raises:
+            ValueError: if the payload isn’t valid JSON.
+        """
+        if self._payload is None:
+            self._payload = json_loads(self.raw_payload.decode('utf-8'))
+        return self._payload
+
+    def validate(self, key=None):
+        """
+        Args:
+            key: an ``Ed25519PublicKey`` or ``Ed448PublicKey``. If omitted, the
+                key is taken from the ``psig`` claim in the payload.
+
+        Raises:
+            cryptography.exceptions.InvalidSignature
+        """
+        # We don’t support any critical header parameters, nor unencoded
+        # payloads (RFC 7797):
+        if self.header.get('alg', None) != SIGNING_ALGORITHM or \
+                'crit' in self.header or 'b64' in self.header:
+            raise InvalidSignature()
         if key is None:
             try:
-                key = Ed25519PublicKey.from_public_bytes(b64decode(self.payload['psig']))
+                psig = self.payload['psig']
+                if isinstance(psig, dict):
+                    key = load_public_jwk(psig)
+                else:
+                    key = Ed25519PublicKey.from_public_bytes(b64decode(psig))
             except Exception:
                 raise InvalidSignature()
+        if not isinstance(key, _VERIFYING_KEYS):
+            raise InvalidSignature()
         key.verify(self.signature, self.signee)
 
     @staticmethod
-    def create(o: dict, k: Ed25519PrivateKey, typ: str) -> str:
-        header = b64encode(json_dumps({'typ': typ, 'alg': SIGNING_ALGORITHM}).encode('utf-8'))
-        payload = b64encode(json_dumps(o).encode('utf-8'))
-        signee = header + '.' + payload
+    def create(o: T.Union[dict, bytes], k: T.Union[Ed25519PrivateKey, Ed448PrivateKey], typ: T.Optional[str]) -> str:
+        header = {'alg': SIGNING_ALGORITHM}
+        if typ is not None:
+            header['typ'] = typ
+        header = b64encode(json_dumps_bytes(header))
+        if not isinstance(o, bytes):
+            o = json_dumps_bytes(o)
+        signee = header + '.' + b64encode(o)
         signature = k.sign(signee.encode('ascii'))
         return signee + '.' + b64encode(signature)
 
@@ -0,0 +1,140 @@
+# language=rst
+"""
+Incremental verification of the member chain of a project.
+
+Entries in ``member_jws`` point to their predecessor through ``prev_jti``, and
+the first entry points to the project itself, so the entries of a project form
+an append-only chain. A verified prefix of the chain is summarized by a
+:class:`Checkpoint`, which is stored in the ``config`` table, so that the
+next :func:`verify_chain` only verifies the entries appended since.
+
+The checkpoint holds a running digest over the JWSs in the prefix. A full
+verification recomputes it, and fails if it differs from the stored one,
+which means that verified history was rewritten. The checkpoint also holds the
+digest of the JWS of its last entry, and if that entry was removed or
+replaced, the next verification is a full one.
+"""
+
+import json
+import logging
+import typing as T
+
+from cryptography.exceptions import InvalidSignature
+from sqlalchemy.exc import IntegrityError
+
+from . import database, fingerprint, SignedObject
+
+_logger = logging.getLogger(__name__)
+
+
+class ChainError(ValueError):
+    pass
+
+
+class Checkpoint(T.NamedTuple):
+    jti: str
+    """The last verified entry, or the project id if the chain is empty."""
+    digest: str
+    """The fingerprint of the previous digest and the JWS of entry :attr:`jti`."""
+    length: int
+    """The number of verified entries."""
+    entry_digest: T.Optional[str] = None
+    """The fingerprint of the JWS of entry :attr:`jti` alone, to check that
+    it’s still on the chain, or ``None`` for the start of the chain."""
+
+    @classmethod
+    def start(cls, project_id: str) -> 'Checkpoint':
+        return cls(project_id, fingerprint(project_id), 0)
+
+    def advance(self, jti: str, jws: str) -> 'Checkpoint':
+        return Checkpoint(jti, fingerprint([self.digest, jws]), self.length + 1, fingerprint(jws))
+
+    def is_on_chain(self) -> bool:
+        # language=rst
+        """
+        Whether entry :attr:`jti` is still in the database, with the same JWS.
+        """
+        if self.length == 0:
+            return True
+        if self.entry_digest is None:
+            return False  # Stored by an earlier version
+        jws = database.get_member_jws(self.jti)
+        return jws is not None and fingerprint(jws) == self.entry_digest
+
+
+def load_checkpoint(project_id: str) -> T.Optional[Checkpoint]:
+    value = database.get_config(database.chain_checkpoint_key(project_id))
+    return None if value is None else Checkpoint(*json.loads(value))
+
+
+def store_checkpoint(project_id: str, checkpoint: Checkpoint) -> None:
+    try:
+        database.set_config(database.chain_checkpoint_key(project_id), json.dumps(checkpoint))
+    except IntegrityError:
+        # A concurrent verifier stored its checkpoint first, which is as good:
+        _logger.debug("Concurrent checkpoint of project %s", project_id)
+
+
+def verify_entry(project_id: str, jti: str, jws: str, project_key) -> None:
+    # language=rst
+    """
+    Verifies that *jws* is an invite to the project with id *jti*, signed
+    with *project_key*.
+
+    Raises:
+        ChainError: if it isn’t.
+    """
+    try:
+        decoder = SignedObject(jws)
+        decoder.validate(project_key)
+        payload = decoder.payload
+    except (ValueError, InvalidSignature) as e:
+        raise ChainError("Entry %s of project %s has an invalid signature: %s" % (jti, project_id, e))
+    if payload.get('iss') != project_id or payload.get('jti') != jti:
+        raise ChainError("Entry %s of project %s has wrong 'iss' or 'jti' claims." % (jti, project_id))
+
+
+def verify_chain(project_id: str, full: bool = False) -> Checkpoint:
+    # language=rst
+    """
+    Verifies the entries in the member chain of the project since the stored
+    checkpoint, and stores the new checkpoint. All entries are verified if
+    *full* is true, if there is no checkpoint, or if the entry of the
+    checkpoint isn’t on the chain with the same JWS anymore. The cost is
+    proportional to the number of new entries, plus counting the members of
+    the project.
+
+    Raises:
+        ChainError: if the project doesn’t exist, an entry doesn’t verify, the
+            checkpoint doesn’t match the chain, or not all members are on
+            the chain.
+    Returns:
+        the new checkpoint.
+    """
+    project_key = database.get_project_key(project_id)
+    if project_key is None:
+        raise ChainError("Project %s not found." % project_id)
+    stored = load_checkpoint(project_id)
+    checkpoint = Checkpoint.start(project_id)
+    if stored is not None and not full:
+        if stored.is_on_chain():
+            checkpoint = stored
+        else:
+            # Verifying from a checkpoint that is no longer on the chain would
+            # verify nothing:
+            _logger.warning("Checkpoint of project %s isn’t on its chain; verifying all entries.", project_id)
+    for entry in database.iter_member_chain(project_id, after=checkpoint.jti):
+        verify_entry(project_id, entry['jti'], entry['jws'], project_key)
+        checkpoint = checkpoint.advance(entry['jti'], entry['jws'])
+        if stored is not None and checkpoint.length == stored.length and checkpoint.digest != stored.digest:
+            raise ChainError("Project %s doesn’t match its checkpoint at entry %d." % (project_id, stored.length))
+    if stored is not None and checkpoint.length < stored.length:
+        raise ChainError("Project %s is shorter than its checkpoint." % project_id)
+    members = database.count_members(project_id)
+    if members != checkpoint.length:
+        raise ChainError("Project %s has %d members, of which %d on its chain." % (
+            project_id, members, checkpoint.length
+        ))
+    if checkpoint != stored:
+        store_checkpoint(project_id, checkpoint)
+    return checkpoint
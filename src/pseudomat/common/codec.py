@@ -0,0 +1,120 @@
+# language=rst
+"""
+The canonical JSON encoding: sorted keys, no whitespace, and only ASCII, with
+other characters escaped. This is what :func:`pseudomat.common.fingerprint`
+hashes and what :meth:`pseudomat.common.SignedObject.create` signs, so it
+must never change, whichever backend produces it.
+
+Two backends produce byte-identical output:
+
+``json``
+    The reference: :func:`json.dumps` from the standard library.
+``orjson``
+    Several times faster, if `orjson <https://github.com/ijl/orjson>`_ is
+    installed (``pip install pseudomat[fast]``). It handles the values that
+    canonical data consists of: dicts with string keys, lists, tuples,
+    strings, integers of up to 64 bits, booleans and ``None``. Anything else,
+    such as a float, whose text orjson formats differently, is handed to the
+    reference backend.
+
+The fastest available backend is used by default. Use the codec through
+:func:`pseudomat.common.json_dumps`, or :func:`dumps_bytes` for the
+UTF-8-encoded form.
+"""
+
+import json
+import re
+import typing as T
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _dumps_json(o) -> bytes:
+    return json.dumps(o, separators=(',', ':'), sort_keys=True).encode('ascii')
+
+
+_SCALARS = frozenset((str, int, bool, type(None)))
+
+
+def _is_canonical_subset(o) -> bool:
+    # language=rst
+    """
+    Whether *o* consists of values for which orjson’s output equals that of
+    the reference. Exact types, because orjson serializes some subclasses,
+    such as enums, that the reference rejects or encodes differently.
+    """
+    t = type(o)
+    if t is dict:
+        for k, v in o.items():
+            if type(k) is not str or type(v) not in _SCALARS and not _is_canonical_subset(v):
+                return False
+        return True
+    if t is list or t is tuple:
+        for v in o:
+            if type(v) not in _SCALARS and not _is_canonical_subset(v):
+                return False
+        return True
+    return t in _SCALARS
+
+
+# Everything that json.dumps() escapes with ensure_ascii, besides what both
+# backends escape alike ('"', '\\' and control characters):
+_NON_ASCII = re.compile('[\x7f-\U0010ffff]')
+
+
+def _escape(match: T.Match) -> str:
+    n = ord(match.group(0))
+    if n < 0x10000:
+        return '\\u%04x' % n
+    n -= 0x10000
+    return '\\u%04x\\u%04x' % (0xd800 | (n >> 10), 0xdc00 | (n & 0x3ff))
+
+
+def _dumps_orjson(o) -> bytes:
+    try:
+        if not _is_canonical_subset(o):
+            return _dumps_json(o)
+        retval = orjson.dumps(o, option=orjson.OPT_SORT_KEYS)
+    except (RecursionError, orjson.JSONEncodeError):
+        # Too deeply nested, integers that don’t fit in 64 bits, or lone
+        # surrogates, which the reference does encode:
+        return _dumps_json(o)
+    if retval.isascii() and b'\x7f' not in retval:
+        return retval
+    # Non-ASCII characters can only occur inside strings:
+    return _NON_ASCII.sub(_escape, retval.decode('utf-8')).encode('ascii')
+
+
+BACKENDS: T.Dict[str, T.Callable[[T.Any], bytes]] = {'json': _dumps_json}
+if orjson is not None:
+    BACKENDS['orjson'] = _dumps_orjson
+
+_backend = BACKENDS['orjson' if orjson is not None else 'json']
+
+
+def set_backend(name: T.Optional[str] = None) -> None:
+    # language=rst
+    """
+    Selects the backend by name, or the fastest available one if *name* is
+    ``None``.
+
+    Raises:
+        KeyError: if the backend isn’t available.
+    """
+    global _backend
+    _backend = BACKENDS[name or ('orjson' if orjson is not None else 'json')]
+
+
+def backend() -> str:
+    return next(name for name, f in BACKENDS.items() if f is _backend)
+
+
+def dumps_bytes(o) -> bytes:
+    return _backend(o)
+
+
+def dumps(o) -> str:
+    return _backend(o).decode('ascii')
@@ -1,16 +1,69 @@
+import contextlib
+import functools
 from functools import lru_cache
 import logging
+import time
 import typing as T
 
-from sqlalchemy.dialects import sqlite
 import sqlalchemy.event
 from sqlalchemy.exc import DBAPIError, IntegrityError
+import sqlalchemy.pool
 import sqlalchemy as sa
 
 _logger = logging.getLogger(__name__)
 _engine: T.Optional[sa.engine.Engine] = None
 
-_DDL = """
+COMPILED_CACHE_SIZE = 100
+
+
+class StorageProfile(T.NamedTuple):
+    # language=rst
+    """
+    How SQLite is tuned, per connection, and how connections are pooled.
+    ``None`` leaves SQLite’s own default in place.
+    """
+    journal_mode: T.Optional[str] = None
+    """``PRAGMA journal_mode``; ``'wal'`` lets readers and a writer proceed concurrently."""
+    synchronous: T.Optional[str] = None
+    """``PRAGMA synchronous``; ``'normal'`` is safe in WAL mode."""
+    mmap_size: T.Optional[int] = None
+    """``PRAGMA mmap_size``, in bytes."""
+    busy_timeout: T.Optional[int] = None
+    """``PRAGMA busy_timeout``, in milliseconds."""
+    cache_size: T.Optional[int] = None
+    """``PRAGMA cache_size``; in pages if positive, in KiB if negative."""
+    pool_size: int = 0
+    """Number of connections that are kept open, or 0 for a new connection per use."""
+    max_overflow: int = 0
+    """Number of connections that may be opened on top of *pool_size* under load."""
+    pool_timeout: float = 30
+    """Seconds to wait for a pooled connection before giving up."""
+    immediate: bool = False
+    """Whether transactions take the write lock when they begin, instead of at
+    their first write. A deferred transaction that has to upgrade its lock while
+    another connection writes fails at once, whatever the busy timeout."""
+
+
+STORAGE_PROFILES = {
+    'default': StorageProfile(),
+    'concurrent': StorageProfile(
+        journal_mode='wal',
+        synchronous='normal',
+        mmap_size=256 * 1024 * 1024,
+        busy_timeout=5000,
+        cache_size=-16 * 1024,
+        pool_size=8,
+        max_overflow=24,
+        immediate=True,
+    ),
+    'postgresql': StorageProfile(
+        pool_size=8,
+        max_overflow=24,
+    ),
+}
+"""Named storage profiles, for the ``STORAGE_PROFILE`` setting of the server."""
+
+_DDL_SQLITE = """
 create table config
 (
     key varchar not null
@@ -42,7 +95,9 @@ create table project
     penc text not null,
     ssig text,
     senc text,
-    jws text not null
+    jws text not null,
+    chain_tail char(32),
+    modified integer
 );;
 
 create table member
@@ -71,6 +126,9 @@ create table member
 create unique index member_name_uindex
     on member (project_jti, invite_sub);;
 
+create unique index member_project_uindex
+    on member (project_jti, invite_jti);;
+
 CREATE TRIGGER after_member_delete after delete on member
 begin
     delete from member_jws where jti = old.invite_jti;
@@ -78,26 +136,201 @@ begin
     delete from member_jws where jti = old.revoke_jti;
 end;;
 
-insert into config (key, value) VALUES ('schema', '1')
+insert into config (key, value) VALUES ('schema', '2')
+"""
+
+# Same schema as _DDL_SQLITE. Case-insensitive uniqueness, which SQLite gets
+# from NOCASE, is an index on lower(). Everything is idempotent, and the
+# advisory lock serializes replicas that initialize the same database:
+_DDL_POSTGRESQL = """
+select pg_advisory_xact_lock(hashtext('pseudomat schema'));;
+
+create table if not exists config
+(
+    key varchar not null
+        constraint config_pk
+            primary key,
+    value text
+);;
+
+create table if not exists member_jws
+(
+    jti char(32) not null
+        constraint member_jws_pk
+            primary key,
+    jws text not null,
+    prev_jti char(32) not null
+        constraint member_jws_prev_jti_uindex
+            unique
+);;
+
+create table if not exists project
+(
+    jti char(32) not null
+        constraint project_pk
+            primary key,
+    sub varchar(80) not null,
+    iss varchar(255) not null,
+    psig text not null,
+    penc text not null,
+    ssig text,
+    senc text,
+    jws text not null,
+    chain_tail char(32),
+    modified integer
+);;
+
+create table if not exists member
+(
+    project_jti char(32) not null
+        references project
+            on update cascade on delete cascade,
+    invite_jti char(32) not null
+        constraint member_pk
+            primary key
+        references member_jws
+            on update cascade on delete set null,
+    invite_sub varchar(80) not null,
+    invite_sig text not null,
+    invite_enc text not null,
+    member_jti char(32)
+        references member_jws
+            on update cascade on delete set null,
+    member_sig text,
+    member_enc text,
+    revoke_jti char(32)
+        references member_jws
+            on update cascade on delete set null
+);;
+
+create unique index if not exists member_name_uindex
+    on member (project_jti, lower(invite_sub));;
+
+create unique index if not exists member_project_uindex
+    on member (project_jti, invite_jti);;
+
+create or replace function after_member_delete() returns trigger as $$
+begin
+    delete from member_jws where jti = old.invite_jti;
+    delete from member_jws where jti = old.member_jti;
+    delete from member_jws where jti = old.revoke_jti;
+    return null;
+end;
+$$ language plpgsql;;
+
+drop trigger if exists after_member_delete on member;;
+
+create trigger after_member_delete after delete on member
+    for each row execute function after_member_delete();;
+
+insert into config (key, value) values ('schema', '2') on conflict do nothing
+"""
+
+
+SCHEMA_VERSION = '2'
+
+# From schema 1, in which the tail of a member chain was found with an
+# anti-join over all members of the project. Same SQL for both dialects.
+# Existing projects count as modified at the time of the upgrade:
+_UPGRADE_1 = """
+alter table project add column chain_tail char(32);;
+
+alter table project add column modified integer;;
+
+update project set modified = {now};;
+
+update project set chain_tail = (
+    select member_jws.jti
+    from member_jws join member on member.invite_jti = member_jws.jti
+    where member.project_jti = project.jti
+        and not exists (select 1 from member_jws successor where successor.prev_jti = member_jws.jti)
+);;
+
+update config set value = '2' where key = 'schema'
 """
 
 
-def initialize_database(filepath):
+def _upgrade_schema() -> None:
+    with _engine.begin() as c:
+        if c.dialect.name == 'postgresql':
+            # Serializes replicas that upgrade the same database:
+            c.execute("select pg_advisory_xact_lock(hashtext('pseudomat schema'))")
+        schema = c.execute(statements().get_config, config_key='schema').scalar()
+        if schema == '1':
+            _logger.info("Upgrading the database schema from version 1 to 2.")
+            for stmt in _UPGRADE_1.format(now=int(time.time())).split(';;'):
+                c.execute(stmt)
+            schema = '2'
+        assert schema == SCHEMA_VERSION, "Unknown database schema version: %s" % schema
+
+
+def _is_postgresql(database) -> bool:
+    return str(database).startswith(('postgresql:', 'postgresql+'))
+
+
+def initialize_database(database, profile: T.Union[str, StorageProfile, None] = None):
+    # language=rst
+    """
+    Args:
+        database: the path of an SQLite database file, or the URL of a
+            PostgreSQL database, such as ``postgresql://user:pw@host/dbname``.
+        profile: the storage profile. Defaults to ``'postgresql'`` for
+            PostgreSQL and ``'default'`` for SQLite. The SQLite pragmas in the
+            profile are ignored for PostgreSQL.
+    """
     teardown_database()
-    _logger.debug("Connecting to sqlite database: %s", filepath)
+    postgresql = _is_postgresql(database)
+    if profile is None:
+        profile = 'postgresql' if postgresql else 'default'
+    if isinstance(profile, str):
+        profile = STORAGE_PROFILES[profile]
+    _logger.debug("Connecting to database: %s (%r)", database, profile)
+    # Compiled forms of the statements() and of any other statement objects
+    # that are executed more than once:
+    options = dict(execution_options={'compiled_cache': sa.util.LRUCache(COMPILED_CACHE_SIZE)})
+    if profile.pool_size > 0:
+        pool_options = dict(
+            poolclass=sa.pool.QueuePool,
+            pool_size=profile.pool_size,
+            max_overflow=profile.max_overflow,
+            pool_timeout=profile.pool_timeout,
+        )
+    else:
+        pool_options = dict(poolclass=sa.pool.NullPool)
     global _engine
-    _engine = sa.create_engine(
-        'sqlite:///%s' % filepath,
-        # This is the default, but the sqlalchemy documentation recommends specifying it anyway:
-        isolation_level='SERIALIZABLE'
-    )
+    if postgresql:
+        _engine = sa.create_engine(
+            str(database),
+            # Replicas may close idle connections, or restart the server:
+            pool_pre_ping=True,
+            **options,
+            **pool_options
+        )
+        ddl = _DDL_POSTGRESQL
+    else:
+        if profile.pool_size > 0:
+            # Pooled connections are handed from thread to thread:
+            pool_options['connect_args'] = {'check_same_thread': False}
+        _engine = sa.create_engine(
+            'sqlite:///%s' % database,
+            # This is the default, but the sqlalchemy documentation recommends specifying it anyway:
+            isolation_level='SERIALIZABLE',
+            **options,
+            **pool_options
+        )
+        sa.event.listen(_engine, 'connect', functools.partial(_configure_connection, profile))
+        if profile.immediate:
+            sa.event.listen(_engine, 'begin', _begin_immediate)
+        ddl = _DDL_SQLITE
     try:
         _schema = get_config('schema')
-        assert _schema == '1'
     except DBAPIError:
-        with _engine.connect() as connection:
-            for stmt in _DDL.split(';;'):
+        with _engine.begin() as connection:
+            for stmt in ddl.split(';;'):
                 connection.execute(stmt)
+    else:
+        if _schema != SCHEMA_VERSION:
+            _upgrade_schema()
 
 
 def teardown_database(_exc=None):
@@ -105,60 +338,204 @@ def teardown_database(_exc=None):
         _engine.dispose()
 
 
-@sa.event.listens_for(sa.engine.Engine, "connect")
-def set_sqlite_pragma(dbapi_connection, _connection_record):
-    _logger.debug("Executing PRAGMA foreign_keys=ON")
+def _configure_connection(profile: StorageProfile, dbapi_connection, _connection_record):
+    pragmas = [('foreign_keys', 'ON')]
+    for pragma in ('journal_mode', 'synchronous', 'mmap_size', 'busy_timeout', 'cache_size'):
+        value = getattr(profile, pragma)
+        if value is not None:
+            pragmas.append((pragma, value))
+    if profile.immediate:
+        # Keep pysqlite from emitting BEGIN itself; see _begin_immediate():
+        dbapi_connection.isolation_level = None
     cursor = dbapi_connection.cursor()
-    cursor.execute("PRAGMA foreign_keys=ON")
+    for pragma, value in pragmas:
+        _logger.debug("Executing PRAGMA %s=%s", pragma, value)
+        cursor.execute("PRAGMA %s=%s" % (pragma, value))
     cursor.close()
 
 
+def _begin_immediate(conn: sa.engine.Connection):
+    conn.execute("BEGIN IMMEDIATE")
+
+
 @lru_cache()
 def metadata() -> sa.MetaData:
     retval = sa.MetaData()
 
     sa.Table(
         'config', retval,
-        sa.Column('key', sqlite.VARCHAR(80), primary_key=True),
-        sa.Column('value', sqlite.TEXT, nullable=False)
+        sa.Column('key', sa.VARCHAR(80), primary_key=True),
+        sa.Column('value', sa.TEXT, nullable=False)
     )
 
     sa.Table(
         'member', retval,
-        sa.Column('project_jti', sqlite.CHAR(length=32), sa.ForeignKey('project.jti'), nullable=False),
-        sa.Column('invite_jti', sqlite.CHAR(length=32), sa.ForeignKey('member_jws.jti'), nullable=False, primary_key=True),
-        sa.Column('invite_sub', sqlite.VARCHAR(length=80, collation='NOCASE'), nullable=True),
-        sa.Column('invite_sig', sqlite.TEXT(), nullable=False),
-        sa.Column('invite_enc', sqlite.TEXT(), nullable=False),
-        sa.Column('member_jti', sqlite.CHAR(length=32), sa.ForeignKey('member_jws.jti')),
-        sa.Column('member_sig', sqlite.TEXT(), nullable=False),
-        sa.Column('member_enc', sqlite.TEXT(), nullable=False),
-        sa.Column('revoke_jti', sqlite.CHAR(length=32), sa.ForeignKey('member_jws.jti')),
+        sa.Column('project_jti', sa.CHAR(length=32), sa.ForeignKey('project.jti'), nullable=False),
+        sa.Column('invite_jti', sa.CHAR(length=32), sa.ForeignKey('member_jws.jti'), nullable=False, primary_key=True),
+        sa.Column('invite_sub', sa.VARCHAR(length=80), nullable=True),
+        sa.Column('invite_sig', sa.TEXT(), nullable=False),
+        sa.Column('invite_enc', sa.TEXT(), nullable=False),
+        sa.Column('member_jti', sa.CHAR(length=32), sa.ForeignKey('member_jws.jti')),
+        sa.Column('member_sig', sa.TEXT(), nullable=False),
+        sa.Column('member_enc', sa.TEXT(), nullable=False),
+        sa.Column('revoke_jti', sa.CHAR(length=32), sa.ForeignKey('member_jws.jti')),
         sa.UniqueConstraint('project_jti', 'invite_sub')
     )
 
     sa.Table(
         'member_jws', retval,
-        sa.Column('jti', sqlite.CHAR(length=32), primary_key=True),
-        sa.Column('jws', sqlite.TEXT(), nullable=False),
-        sa.Column('prev_jti', sqlite.CHAR(length=32), nullable=False, unique=True)
+        sa.Column('jti', sa.CHAR(length=32), primary_key=True),
+        sa.Column('jws', sa.TEXT(), nullable=False),
+        sa.Column('prev_jti', sa.CHAR(length=32), nullable=False, unique=True)
+    )
+
+    sa.Table(
+        'key_pool', retval,
+        sa.Column('id', sa.INTEGER, primary_key=True),
+        sa.Column('ssig', sa.TEXT, nullable=False),
+        sa.Column('senc', sa.TEXT, nullable=False)
     )
 
     sa.Table(
         'project', retval,
-        sa.Column('jti', sqlite.CHAR(length=32), nullable=False, primary_key=True),
-        sa.Column('sub', sqlite.VARCHAR(length=80, collation='NOCASE'), nullable=False),
-        sa.Column('iss', sqlite.VARCHAR(length=255, collation='NOCASE'), nullable=False),
-        sa.Column('psig', sqlite.TEXT(), nullable=False, unique=True),
-        sa.Column('penc', sqlite.TEXT(), nullable=False, unique=True),
-        sa.Column('ssig', sqlite.TEXT()),
-        sa.Column('senc', sqlite.TEXT()),
-        sa.Column('jws', sqlite.TEXT(), nullable=False)
+        sa.Column('jti', sa.CHAR(length=32), nullable=False, primary_key=True),
+        sa.Column('sub', sa.VARCHAR(length=80), nullable=False),
+        sa.Column('iss', sa.VARCHAR(length=255), nullable=False),
+        sa.Column('psig', sa.TEXT(), nullable=False, unique=True),
+        sa.Column('penc', sa.TEXT(), nullable=False, unique=True),
+        sa.Column('ssig', sa.TEXT()),
+        sa.Column('senc', sa.TEXT()),
+        sa.Column('jws', sa.TEXT(), nullable=False),
+        # The last entry in the member chain of the project, if any:
+        sa.Column('chain_tail', sa.CHAR(length=32)),
+        # When the project or its member chain last changed, by the clock of
+        # the server, in seconds since the epoch:
+        sa.Column('modified', sa.INTEGER)
     )
 
     return retval
 
 
+class Statements(T.NamedTuple):
+    get_project: sa.sql.Select
+    get_project_psig: sa.sql.Select
+    get_project_jws: sa.sql.Select
+    delete_project: sa.sql.Delete
+    insert_project: sa.sql.Insert
+    lock_project: sa.sql.Select
+    get_chain_tail: sa.sql.Select
+    get_chain_tail_jws: sa.sql.Select
+    get_chain_state: sa.sql.Select
+    set_chain_tail: sa.sql.Update
+    get_members: sa.sql.Select
+    get_next_member_jws: sa.sql.Select
+    count_members: sa.sql.Select
+    get_member_jws: sa.sql.Select
+    insert_member_jws: sa.sql.Insert
+    delete_member_jws: sa.sql.Delete
+    insert_member: sa.sql.Insert
+    get_config: sa.sql.Select
+    insert_config: sa.sql.Insert
+    delete_config: sa.sql.Delete
+
+
+@lru_cache()
+def statements() -> Statements:
+    # language=rst
+    """
+    The statements on the hot paths, with bound parameters instead of values.
+    They’re built only once, so that the compiled cache of the engine (see
+    :func:`initialize_database`) finds them, and each is compiled only once
+    per dialect. Insert statements take a value for every column.
+    """
+    tables = metadata().tables
+    project, member, member_jws, config = (
+        tables['project'], tables['member'], tables['member_jws'], tables['config']
+    )
+    get_chain_tail = sa.select([project.c.chain_tail]).where(project.c.jti == sa.bindparam('project_id'))
+    invite_jws, member_jws_, revoke_jws = (
+        member_jws.alias('invite_jws'), member_jws.alias('member_jws_'), member_jws.alias('revoke_jws')
+    )
+    return Statements(
+        # Without the bookkeeping of the member chain, which has its own statements:
+        get_project=sa.select([c for c in project.c if c.name not in ('chain_tail', 'modified')])
+        .where(project.c.jti == sa.bindparam('project_id')),
+        get_project_psig=sa.select([project.c.psig]).where(project.c.jti == sa.bindparam('project_id')),
+        get_project_jws=sa.select([project.c.jws]).where(project.c.jti == sa.bindparam('project_id')),
+        delete_project=project.delete().where(project.c.jti == sa.bindparam('project_id')),
+        insert_project=project.insert(),
+        lock_project=get_chain_tail.with_for_update(),
+        get_chain_tail=get_chain_tail,
+        get_chain_tail_jws=sa.select([member_jws.c.jti, member_jws.c.jws])
+        .select_from(project.join(member_jws, member_jws.c.jti == project.c.chain_tail))
+        .where(project.c.jti == sa.bindparam('project_id')),
+        get_chain_state=sa.select([project.c.chain_tail, project.c.modified])
+        .where(project.c.jti == sa.bindparam('project_id')),
+        set_chain_tail=project.update().where(project.c.jti == sa.bindparam('project_id'))
+        .values(chain_tail=sa.bindparam('tail_jti'), modified=sa.bindparam('modified_at')),
+        # A range scan of member_project_uindex, which yields the rows in order:
+        get_members=sa.select([
+            member.c.invite_jti.label('jti'),
+            member.c.invite_sub.label('sub'),
+            invite_jws.c.jws.label('invite'),
+            member_jws_.c.jws.label('member'),
+            revoke_jws.c.jws.label('revoke'),
+        ])
+        .select_from(
+            member
+            .join(invite_jws, invite_jws.c.jti == member.c.invite_jti)
+            .outerjoin(member_jws_, member_jws_.c.jti == member.c.member_jti)
+            .outerjoin(revoke_jws, revoke_jws.c.jti == member.c.revoke_jti)
+        )
+        .where(member.c.project_jti == sa.bindparam('project_id'))
+        .where(member.c.invite_jti > sa.bindparam('after'))
+        .order_by(member.c.invite_jti)
+        .limit(sa.bindparam('limit')),
+        get_member_jws=sa.select([member_jws.c.jws])
+        .where(member_jws.c.jti == sa.bindparam('member_jws_jti')),
+        get_next_member_jws=sa.select([member_jws.c.jti, member_jws.c.jws])
+        .where(member_jws.c.prev_jti == sa.bindparam('member_jws_jti')),
+        count_members=sa.select([sa.func.count()]).select_from(member)
+        .where(member.c.project_jti == sa.bindparam('project_id')),
+        insert_member_jws=member_jws.insert(),
+        delete_member_jws=member_jws.delete().where(member_jws.c.jti == sa.bindparam('member_jws_jti')),
+        insert_member=member.insert(),
+        get_config=sa.select([config.c.value]).where(config.c.key == sa.bindparam('config_key')),
+        insert_config=config.insert(),
+        delete_config=config.delete().where(config.c.key == sa.bindparam('config_key')),
+    )
+
+
+@contextlib.contextmanager
+def transaction(conn: T.Optional[sa.engine.Connection] = None) -> T.Iterator[sa.engine.Connection]:
+    # language=rst
+    """
+    Yields a connection with an open transaction, which is committed when the
+    block exits normally. If *conn* is given, it is yielded as-is, so that the
+    caller’s transaction is joined instead.
+    """
+    if conn is not None:
+        yield conn
+        return
+    with _engine.begin() as c:
+        yield c
+
+
+@contextlib.contextmanager
+def _savepoint(conn: sa.engine.Connection) -> T.Iterator[None]:
+    # language=rst
+    """
+    Lets the statements in the block fail without aborting the surrounding
+    transaction, as PostgreSQL would. SQLite only rolls back the failing
+    statement anyway, and pysqlite doesn’t support savepoints reliably.
+    """
+    if conn.dialect.name == 'sqlite':
+        yield
+        return
+    with conn.begin_nested():
+        yield
+
+
 def create_project(
     jti: str,
     iss: str,
@@ -167,13 +544,14 @@ def create_project(
     penc: str,
     jws: str,
     ssig: T.Optional[str] = None,
-    senc: T.Optional[str] = None
+    senc: T.Optional[str] = None,
+    conn: T.Optional[sa.engine.Connection] = None
 ) -> bool:
-    project = metadata().tables['project']
-    with _engine.connect() as conn:
+    with transaction(conn) as c:
         try:
-            conn.execute(
-                project.insert().values(
+            with _savepoint(c):
+                c.execute(
+                    statements().insert_project,
                     jti=jti,
                     iss=iss,
                     sub=sub,
@@ -181,25 +559,42 @@ def create_project(
                     penc=penc,
                     ssig=ssig,
                     senc=senc,
-                    jws=jws
+                    jws=jws,
+                    chain_tail=None,
+                    modified=int(time.time())
                 )
-            )
         except IntegrityError:
-            p = get_project(jti)
-            return p['jws'] == jws
+            p = get_project(jti, conn=c)
+            return p is not None and p['jws'] == jws
     return True
 
 
-def get_project(project_id: str) -> T.Optional[dict]:
-    project = metadata().tables['project']
-    result_proxy = _engine.execute(
-        sa.select([project]).select_from(project)
-        .where(project.c.jti == project_id)
-    )
+def get_project(project_id: str, conn: T.Optional[sa.engine.Connection] = None) -> T.Optional[dict]:
+    result_proxy = (conn or _engine).execute(statements().get_project, project_id=project_id)
     result = result_proxy.first()
     return None if result is None else dict(result.items())
 
 
+def get_project_jws(project_id: str, conn: T.Optional[sa.engine.Connection] = None) -> T.Optional[str]:
+    return (conn or _engine).execute(statements().get_project_jws, project_id=project_id).scalar()
+
+
+def get_project_key(project_id: str, conn: T.Optional[sa.engine.Connection] = None):
+    # language=rst
+    """
+    Returns:
+        the public signing key of the project, as returned by
+        :func:`pseudomat.common.load_public_jwk`, or `None` if the project
+        doesn’t exist. The stored key is read on every call, and only its
+        parsed form is cached, by :func:`pseudomat.common.load_public_jwk`.
+        So a project that is deleted and created again with another key,
+        maybe by another process, never gets the old key.
+    """
+    from . import load_public_jwk
+    psig = (conn or _engine).execute(statements().get_project_psig, project_id=project_id).scalar()
+    return None if psig is None else load_public_jwk(psig)
+
+
 def get_projects() -> T.List[dict]:
     project = metadata().tables['project']
     result_proxy = _engine.execute(
@@ -211,22 +606,297 @@ def get_projects() -> T.List[dict]:
     return retval
 
 
-def delete_project(project_id: str) -> bool:
-    project = metadata().tables['project']
-    result: sa.engine.ResultProxy = _engine.execute(project.delete().where(project.c.jti == project_id))
+def get_member_chain_tail(project_id: str, conn: T.Optional[sa.engine.Connection] = None) -> T.Optional[dict]:
+    # language=rst
+    """
+    Returns:
+        the ``jti`` and ``jws`` of the last entry in the member chain of the
+        project, or `None` if the chain is empty.
+    """
+    result = (conn or _engine).execute(statements().get_chain_tail_jws, project_id=project_id).first()
+    return None if result is None else dict(result.items())
+
+
+def get_member_chain_state(project_id: str, conn: T.Optional[sa.engine.Connection] = None) -> T.Optional[dict]:
+    # language=rst
+    """
+    Returns:
+        the ``chain_tail``, the id of the last entry in the member chain of
+        the project or `None` if it’s empty, and ``modified``, the time of
+        the last change to the project or its chain, from the project row
+        alone; or `None` if the project doesn’t exist.
+    """
+    result = (conn or _engine).execute(statements().get_chain_state, project_id=project_id).first()
+    return None if result is None else dict(result.items())
+
+
+def iter_members(project_id: str, limit: int, after: T.Optional[str] = None) -> T.Iterator[dict]:
+    # language=rst
+    """
+    Generates the members of the project in order of their invite ids, each
+    as a dict with the ``jti`` and ``sub`` of the invite, and the ``invite``,
+    ``member`` and ``revoke`` JWSs, the latter two possibly `None`.
+
+    Rows are streamed from the database cursor, and the connection is held
+    until the generator is exhausted or closed.
+
+    Args:
+        limit: the maximum number of members.
+        after: only generate members with a greater invite id, for keyset
+            pagination.
+    """
+    with _engine.connect() as c:
+        result = c.execution_options(stream_results=True).execute(
+            statements().get_members, project_id=project_id, after=after or '', limit=limit
+        )
+        for row in result:
+            yield dict(row.items())
+
+
+def iter_member_chain(project_id: str, after: T.Optional[str] = None) -> T.Iterator[dict]:
+    # language=rst
+    """
+    Follows the member chain of the project from entry *after*, or from its
+    start, and generates the ``jti`` and ``jws`` of each later entry. Every
+    step is a lookup in ``member_jws_prev_jti_uindex``.
+    """
+    stmt = statements().get_next_member_jws
+    with _engine.connect() as c:
+        jti = after or project_id
+        while True:
+            row = c.execute(stmt, member_jws_jti=jti).first()
+            if row is None:
+                return
+            jti = row['jti']
+            yield dict(row.items())
+
+
+def count_members(project_id: str, conn: T.Optional[sa.engine.Connection] = None) -> int:
+    return (conn or _engine).execute(statements().count_members, project_id=project_id).scalar()
+
+
+def chain_checkpoint_key(project_id: str) -> str:
+    # language=rst
+    """
+    Returns:
+        the key in the ``config`` table of the checkpoint of the member
+        chain of the project; see :mod:`pseudomat.common.chain`.
+    """
+    return 'chain:' + project_id
+
+
+def delete_project(project_id: str, conn: T.Optional[sa.engine.Connection] = None) -> bool:
+    # language=rst
+    """
+    Deletes the project, its members and the checkpoint of its member chain.
+    """
+    stmts = statements()
+    with transaction(conn) as c:
+        result: sa.engine.ResultProxy = c.execute(stmts.delete_project, project_id=project_id)
+        c.execute(stmts.delete_config, config_key=chain_checkpoint_key(project_id))
     return result.rowcount > 0
 
 
-def set_config(key: str, value: T.Optional[str]):
-    config = metadata().tables['config']
+def create_invite(
+    jti: str,
+    iss: str,
+    sub: str,
+    psig: str,
+    penc: str,
+    jws: str,
+    conn: T.Optional[sa.engine.Connection] = None
+) -> bool:
+    # language=rst
+    """
+    Appends an invite to the member chain of project *iss*. The first entry in
+    a chain points to the project itself, and the project row points to the
+    last entry.
+
+    Returns:
+        `False` if a different invite with the same id or name already exists.
+    """
+    stmts = statements()
+    with transaction(conn) as c:
+        # Serializes concurrent invites to the same project, which would
+        # otherwise append to the same tail of the chain. SQLite doesn’t need
+        # this, and ignores it, because it has only one writer at a time:
+        prev_jti = c.execute(stmts.lock_project, project_id=iss).scalar()
+        while True:
+            try:
+                with _savepoint(c):
+                    c.execute(stmts.insert_member_jws, jti=jti, jws=jws, prev_jti=prev_jti or iss)
+                    try:
+                        with _savepoint(c):
+                            c.execute(
+                                stmts.insert_member,
+                                project_jti=iss,
+                                invite_jti=jti,
+                                invite_sub=sub,
+                                invite_sig=psig,
+                                invite_enc=penc
+                            )
+                    except IntegrityError:
+                        c.execute(stmts.delete_member_jws, member_jws_jti=jti)
+                        raise
+            except IntegrityError:
+                existing = c.execute(stmts.get_member_jws, member_jws_jti=jti).scalar()
+                if existing is None:
+                    # In a deferred SQLite transaction, the tail is read before
+                    # the write lock is taken, so another invite may have been
+                    # appended in between. The failed insert took the lock, so
+                    # the tail can’t move again:
+                    tail = c.execute(stmts.get_chain_tail, project_id=iss).scalar()
+                    if tail != prev_jti:
+                        prev_jti = tail
+                        continue
+                return existing == jws
+            break
+        c.execute(stmts.set_chain_tail, project_id=iss, tail_jti=jti, modified_at=int(time.time()))
+    return True
+
+
+def get_member_jws(jti: str, conn: T.Optional[sa.engine.Connection] = None) -> T.Optional[str]:
+    return (conn or _engine).execute(statements().get_member_jws, member_jws_jti=jti).scalar()
+
+
+def delete_invite(jti: str, conn: T.Optional[sa.engine.Connection] = None) -> bool:
+    # language=rst
+    """
+    Deletes the member with invite *jti*, whose trigger deletes its JWSs.
+    Only the last invite in a chain can be deleted without breaking it; the
+    tail of the chain then moves back to its predecessor.
+    """
+    tables = metadata().tables
+    member, member_jws = tables['member'], tables['member_jws']
+    with transaction(conn) as c:
+        entry = c.execute(
+            sa.select([member.c.project_jti, member_jws.c.prev_jti])
+            .select_from(member.join(member_jws, member_jws.c.jti == member.c.invite_jti))
+            .where(member.c.invite_jti == jti)
+        ).first()
+        result = c.execute(member.delete().where(member.c.invite_jti == jti))
+        if entry is not None:
+            project_id, prev_jti = entry['project_jti'], entry['prev_jti']
+            project = tables['project']
+            c.execute(
+                project.update()
+                .where(project.c.jti == project_id)
+                .where(project.c.chain_tail == jti)
+                .values(chain_tail=None if prev_jti == project_id else prev_jti, modified=int(time.time()))
+            )
+    return result.rowcount > 0
+
+
+# Only used in the database of the CLI, and created on first use, so that
+# existing databases get it too:
+_DDL_KEY_POOL = """
+create table if not exists key_pool
+(
+    id integer not null
+        constraint key_pool_pk
+            primary key autoincrement,
+    ssig text not null,
+    senc text not null
+)
+"""
+
+
+_key_pool_engine: T.Optional[sa.engine.Engine] = None
+
+
+def _key_pool(conn: sa.engine.Connection) -> sa.Table:
+    # Once per engine, because the DDL statement takes the write lock:
+    global _key_pool_engine
+    if _key_pool_engine is not _engine:
+        conn.execute(_DDL_KEY_POOL)
+        _key_pool_engine = _engine
+    return metadata().tables['key_pool']
+
+
+def add_key_pairs(pairs: T.Iterable[T.Tuple[str, str]]) -> int:
+    # language=rst
+    """
+    Adds ``(ssig, senc)`` pairs of secret keys to the key pool.
+
+    Returns:
+        the number of pairs that were added.
+    """
+    rows = [{'ssig': ssig, 'senc': senc} for ssig, senc in pairs]
+    with _engine.begin() as c:
+        key_pool = _key_pool(c)
+        if rows:
+            c.execute(key_pool.insert(), rows)
+    return len(rows)
+
+
+def take_key_pairs(n: int = 1, conn: T.Optional[sa.engine.Connection] = None) -> T.List[T.Tuple[str, str]]:
+    # language=rst
+    """
+    Removes up to *n* pairs of secret keys from the key pool, and returns
+    them. Every pair is returned at most once, also to concurrent callers in
+    other processes. Pass the *conn* of the transaction that stores what the
+    keys are used for, to save a commit.
+    """
+    retval = []
+    with transaction(conn) as c:
+        key_pool = _key_pool(c)
+        rows = c.execute(sa.select([key_pool]).order_by(key_pool.c.id).limit(n)).fetchall()
+        for row in rows:
+            # Rows that were selected before this transaction took the write
+            # lock may have been taken by someone else in the meantime:
+            if c.execute(key_pool.delete().where(key_pool.c.id == row['id'])).rowcount == 1:
+                retval.append((row['ssig'], row['senc']))
+    return retval
+
+
+def count_key_pairs() -> int:
     with _engine.begin() as c:
-        c.execute(config.delete().where(config.c.key == key))
+        key_pool = _key_pool(c)
+        return c.execute(sa.select([sa.func.count()]).select_from(key_pool)).scalar()
+
+
+def set_config(key: str, value: T.Optional[str], conn: T.Optional[sa.engine.Connection] = None):
+    stmts = statements()
+    with transaction(conn) as c:
+        c.execute(stmts.delete_config, config_key=key)
         if value is not None:
-            c.execute(config.insert().values(key=key, value=value))
+            c.execute(stmts.insert_config, key=key, value=value)
+
+
+def compare_and_set_config(key: str, expected: T.Optional[str], value: T.Optional[str],
+                           conn: T.Optional[sa.engine.Connection] = None) -> bool:
+    # language=rst
+    """
+    Sets *key* to *value*, or removes it if *value* is `None`, but only if its
+    current value is *expected*, where `None` means that it isn’t set. Of
+    concurrent callers, in any process, with the same *expected* value, only
+    one succeeds.
+
+    Returns:
+        whether the value was set.
+    """
+    stmts = statements()
+    config = metadata().tables['config']
+    with transaction(conn) as c:
+        if expected is not None:
+            result = c.execute(config.delete().where(config.c.key == key).where(config.c.value == expected))
+            if result.rowcount != 1:
+                return False
+            if value is not None:
+                c.execute(stmts.insert_config, key=key, value=value)
+            return True
+        if value is None:
+            return c.execute(stmts.get_config, config_key=key).first() is None
+        try:
+            # The primary key makes this atomic:
+            with _savepoint(c):
+                c.execute(stmts.insert_config, key=key, value=value)
+        except IntegrityError:
+            return False
+    return True
 
 
 def get_config(key: str) -> T.Optional[str]:
-    config = metadata().tables['config']
-    result = _engine.execute(sa.select([config.c.value]).where(config.c.key == key))
+    result = _engine.execute(statements().get_config, config_key=key)
     row = result.first()
     return None if row is None else row[0]
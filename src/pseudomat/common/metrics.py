@@ -0,0 +1,213 @@
+# language=rst
+"""
+Counters and histograms in the Prometheus text exposition format, without a
+dependency on ``prometheus_client``.
+
+Metrics live in the process-wide :data:`REGISTRY`. Recording a sample takes a
+lock and a few arithmetic operations, so it’s cheap enough to leave on in
+production. Every process has its own registry: with several server processes,
+each one is scraped separately, and samples recorded in batch worker processes
+aren’t exposed at all.
+
+The stages of request handling are timed with :func:`stage`::
+
+    with metrics.stage('signature'):
+        decoder.validate(key)
+"""
+
+import bisect
+import threading
+import time
+import typing as T
+
+from .cache import LRUCache
+
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+"""Upper bounds of histogram buckets, in seconds. Signature verification takes
+a fraction of a millisecond, so the buckets start small."""
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: T.Sequence[str], values: T.Sequence[str], extra: str = '') -> str:
+    pairs = ['%s="%s"' % (name, _escape(value)) for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{%s}' % ','.join(pairs) if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(object):
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: T.Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _header(self) -> T.List[str]:
+        return [
+            '# HELP %s %s' % (self.name, self.documentation.replace('\\', '\\\\').replace('\n', '\\n')),
+            '# TYPE %s %s' % (self.name, self.type),
+        ]
+
+    def render(self) -> T.List[str]:
+        raise NotImplementedError()
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: T.Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: T.Dict[T.Tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def render(self) -> T.List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self._header() + [
+            '%s%s %s' % (self.name, _labels(self.labelnames, labelvalues), _number(value))
+            for labelvalues, value in values
+        ]
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: T.Sequence[str] = (),
+                 buckets: T.Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label values: the count of each bucket (not cumulative, with one
+        # extra bucket for +Inf), and the sum of the samples:
+        self._values: T.Dict[T.Tuple[str, ...], T.Tuple[T.List[int], T.List[float]]] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(labelvalues) or \
+                self._values.setdefault(labelvalues, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[i] += 1
+            total[0] += value
+
+    def time(self, *labelvalues: str) -> '_Timer':
+        # language=rst
+        """
+        Returns:
+            a context manager that observes the time spent in its block.
+        """
+        return _Timer(self, labelvalues)
+
+    def count(self, *labelvalues: str) -> int:
+        values = self._values.get(labelvalues)
+        return sum(values[0]) if values else 0
+
+    def render(self) -> T.List[str]:
+        with self._lock:
+            values = sorted(
+                (labelvalues, (list(counts), total[0])) for labelvalues, (counts, total) in self._values.items()
+            )
+        retval = self._header()
+        for labelvalues, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                retval.append('%s_bucket%s %d' % (
+                    self.name, _labels(self.labelnames, labelvalues, 'le="%s"' % _number(bound)), cumulative
+                ))
+            retval.append('%s_sum%s %s' % (self.name, _labels(self.labelnames, labelvalues), _number(total)))
+            retval.append('%s_count%s %d' % (self.name, _labels(self.labelnames, labelvalues), cumulative))
+        return retval
+
+
+class _Timer(object):
+    # A class rather than a @contextmanager, which is slower to enter and exit:
+    __slots__ = ('histogram', 'labelvalues', 'start')
+
+    def __init__(self, histogram: Histogram, labelvalues: T.Tuple[str, ...]):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *_exc_info) -> None:
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+
+
+class CacheCollector(_Metric):
+    # language=rst
+    """
+    Exposes the hits, misses and size of :class:`~pseudomat.common.cache.LRUCache`
+    instances, read when the registry is rendered.
+    """
+
+    def __init__(self, name: str, documentation: str, caches: T.Dict[str, LRUCache]):
+        super().__init__(name, documentation, ('cache',))
+        self.caches = caches
+
+    def render(self) -> T.List[str]:
+        retval = []
+        stats = sorted((name, cache.stats()) for name, cache in self.caches.items())
+        for suffix, key, type_ in (('hits_total', 'hits', 'counter'), ('misses_total', 'misses', 'counter'),
+                                   ('size', 'size', 'gauge')):
+            name = '%s_%s' % (self.name, suffix)
+            retval.append('# HELP %s %s, by cache.' % (name, self.documentation))
+            retval.append('# TYPE %s %s' % (name, type_))
+            retval.extend('%s{cache="%s"} %d' % (name, cache_name, s[key]) for cache_name, s in stats)
+        return retval
+
+
+class Registry(object):
+    def __init__(self):
+        self._metrics: T.Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'pseudomat_stage_duration_seconds',
+    "Time spent in each stage of handling a request.",
+    ('stage',)
+))
+
+
+def stage(name: str) -> T.ContextManager[None]:
+    # language=rst
+    """
+    Times the block as stage *name* in :data:`STAGE_SECONDS`, whether or not it
+    raises.
+    """
+    return STAGE_SECONDS.time(name)
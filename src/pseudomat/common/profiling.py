@@ -0,0 +1,79 @@
+# language=rst
+"""
+Profiles of single requests or commands, written as ``pstats`` files to a
+directory that keeps only the most recent ones. Read them with
+``python -m pstats <file>``, or with a viewer such as snakeviz.
+
+A :class:`cProfile.Profile` only profiles the thread that enabled it, so
+requests that are handled concurrently in other threads don’t end up in each
+other’s profiles.
+"""
+
+import cProfile
+import logging
+import os
+import pathlib
+import re
+import time
+import typing as T
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_FILES = 100
+
+
+def start() -> T.Optional[cProfile.Profile]:
+    # language=rst
+    """
+    Returns:
+        an enabled profiler, or ``None`` if another profiler is already active
+        in this thread.
+    """
+    retval = cProfile.Profile()
+    try:
+        retval.enable()
+    except ValueError:
+        _logger.debug("Not profiling: another profiler is active.")
+        return None
+    return retval
+
+
+def _slug(tag: str) -> str:
+    return re.sub(r'[^-\w]+', '_', tag).strip('_') or '_'
+
+
+def dump(profile: cProfile.Profile, directory: T.Union[str, pathlib.Path], tags: T.Iterable[str],
+         max_files: int = DEFAULT_MAX_FILES) -> pathlib.Path:
+    # language=rst
+    """
+    Writes *profile* to a file in *directory*, which is created if needed,
+    and then removes the oldest profiles until at most *max_files* remain.
+
+    Args:
+        tags: strings that end up in the file name, such as the route and the
+            project id.
+
+    Returns:
+        the path of the written file.
+
+    Raises:
+        ValueError: if *max_files* is less than 1.
+    """
+    if max_files < 1:
+        raise ValueError("max_files must be at least 1, not %r." % max_files)
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    now = time.time()
+    name = '%s.%06d-%d-%s.prof' % (
+        time.strftime('%Y%m%dT%H%M%S', time.gmtime(now)), now % 1 * 1000000, os.getpid(),
+        '-'.join(_slug(tag) for tag in tags)
+    )
+    retval = directory / name
+    profile.dump_stats(str(retval))
+    # The timestamp prefix makes names sort by age:
+    for old in sorted(directory.glob('*.prof'))[:-max_files]:
+        try:
+            old.unlink()
+        except FileNotFoundError:
+            pass  # Removed by a concurrent dump
+    return retval
@@ -10,6 +10,31 @@ import jsonschema
 _logger = logging.getLogger(__package__)
 SCHEMAS = {'project', 'pinvite', 'sinvite'}
 
+# Keywords that don’t constrain the instance, as far as the jsonschema library
+# is concerned. Note that ``regex`` isn’t a JSON Schema keyword at all, and that
+# ``format`` is only asserted if a format checker is passed, which we don’t.
+_IGNORED_KEYWORDS = {'$schema', '$comment', 'definitions', 'description', 'format', 'regex', 'title'}
+_SUPPORTED_KEYWORDS = {
+    '$ref', 'additionalProperties', 'allOf', 'const', 'maxLength', 'minLength',
+    'properties', 'required', 'type'
+}
+_TYPE_CHECKS = {
+    'object': "isinstance({0}, dict)",
+    'string': "isinstance({0}, str)",
+    'integer': "(isinstance({0}, int) and not isinstance({0}, bool)"
+               " or isinstance({0}, float) and {0}.is_integer())",
+}
+
+
+class CompiledSchema(T.NamedTuple):
+    validator: T.Any
+    """A jsonschema validator instance. Its verdict is authoritative."""
+    fast: T.Optional[T.Callable[[T.Any], bool]]
+    """A generated validator, or `None` if the schema couldn’t be compiled."""
+
+
+_validators: T.Dict[str, CompiledSchema] = {}
+
 
 @functools.lru_cache()
 def _load_schema(path: pathlib.Path) -> T.Union[T.Dict, T.List]:
@@ -19,19 +44,161 @@ def _load_schema(path: pathlib.Path) -> T.Union[T.Dict, T.List]:
         return yaml.full_load(f)
 
 
+class _Unsupported(Exception):
+    pass
+
+
+class _CodeGenerator(object):
+    # language=rst
+    """
+    Generates the source of a function that accepts exactly the instances the
+    jsonschema library accepts for a given schema.
+
+    Only the small subset of JSON Schema used by our own ``schema_*.yaml`` files
+    is supported. Anything else raises :exc:`_Unsupported`.
+    """
+
+    def __init__(self, root: dict):
+        self.root = root
+        self.lines = ['def validate(v0):']
+        self.variables = 0
+
+    def source(self) -> str:
+        self.emit(self.root, 'v0', 1, ())
+        self.line(1, 'return True')
+        return '\n'.join(self.lines)
+
+    def line(self, indent: int, s: str):
+        self.lines.append('    ' * indent + s)
+
+    def reject_unless(self, indent: int, condition: str):
+        self.line(indent, 'if not (%s):' % condition)
+        self.line(indent + 1, 'return False')
+
+    def resolve(self, ref: str, refs: T.Tuple[str, ...]) -> dict:
+        if not ref.startswith('#/') or ref in refs:
+            raise _Unsupported(ref)
+        retval = self.root
+        for part in ref[2:].split('/'):
+            if not isinstance(retval, dict) or part not in retval:
+                raise _Unsupported(ref)
+            retval = retval[part]
+        return retval
+
+    def emit(self, schema: dict, var: str, indent: int, refs: T.Tuple[str, ...]):
+        if not isinstance(schema, dict):
+            raise _Unsupported(schema)
+        keywords = set(schema) - _IGNORED_KEYWORDS
+        if not keywords <= _SUPPORTED_KEYWORDS:
+            raise _Unsupported(keywords - _SUPPORTED_KEYWORDS)
+        if '$ref' in keywords:
+            if len(keywords) > 1:
+                raise _Unsupported(schema)
+            ref = schema['$ref']
+            self.emit(self.resolve(ref, refs), var, indent, refs + (ref,))
+            return
+        self.line(indent, 'pass')
+        if 'type' in schema:
+            if schema['type'] not in _TYPE_CHECKS:
+                raise _Unsupported(schema['type'])
+            self.reject_unless(indent, _TYPE_CHECKS[schema['type']].format(var))
+        if 'const' in schema:
+            if not isinstance(schema['const'], str):
+                raise _Unsupported(schema['const'])
+            self.reject_unless(indent, 'isinstance(%s, str) and %s == %r' % (var, var, schema['const']))
+        if 'minLength' in schema or 'maxLength' in schema:
+            self.line(indent, 'if isinstance(%s, str):' % var)
+            self.line(indent + 1, 'n = len(%s)' % var)
+            if 'minLength' in schema:
+                self.reject_unless(indent + 1, 'n >= %d' % schema['minLength'])
+            if 'maxLength' in schema:
+                self.reject_unless(indent + 1, 'n <= %d' % schema['maxLength'])
+        for subschema in schema.get('allOf', []):
+            self.emit(subschema, var, indent, refs)
+        if keywords & {'additionalProperties', 'properties', 'required'}:
+            self.line(indent, 'if isinstance(%s, dict):' % var)
+            self.emit_object(schema, var, indent + 1, refs)
+
+    def emit_object(self, schema: dict, var: str, indent: int, refs: T.Tuple[str, ...]):
+        properties = schema.get('properties', {})
+        self.line(indent, 'pass')
+        for name in schema.get('required', []):
+            self.reject_unless(indent, '%r in %s' % (name, var))
+        additional = schema.get('additionalProperties', True)
+        if additional is False:
+            self.reject_unless(indent, '%s.keys() <= %r' % (var, frozenset(properties)))
+        elif additional is not True:
+            raise _Unsupported(additional)
+        for name, subschema in properties.items():
+            self.variables += 1
+            subvar = 'v%d' % self.variables
+            self.line(indent, 'if %r in %s:' % (name, var))
+            self.line(indent + 1, '%s = %s[%r]' % (subvar, var, name))
+            self.emit(subschema, subvar, indent + 1, refs)
+
+
+def generate_validator(schema: dict) -> T.Optional[T.Callable[[T.Any], bool]]:
+    # language=rst
+    """
+    Returns:
+        A function that returns `True` iff the given instance is valid, or
+        `None` if the schema uses features the generator doesn’t support.
+    """
+    try:
+        source = _CodeGenerator(schema).source()
+    except _Unsupported as e:
+        _logger.info("Can’t generate a fast validator (unsupported: %s)", e)
+        return None
+    namespace = {}
+    exec(compile(source, '<schema validator>', 'exec'), namespace)
+    return namespace['validate']
+
+
+def compile_schema(schema: dict, fast_path: bool = True) -> CompiledSchema:
+    # language=rst
+    """
+    Raises:
+        jsonschema.exceptions.SchemaError: if the schema itself is invalid.
+    """
+    cls = jsonschema.validators.validator_for(schema)
+    cls.check_schema(schema)
+    return CompiledSchema(
+        validator=cls(schema),
+        fast=generate_validator(schema) if fast_path else None
+    )
+
+
+def initialize_validators(fast_path: bool = True) -> None:
+    # language=rst
+    """
+    Compiles all our schemas once, so that :func:`validate_schema` doesn’t have
+    to check the schema and build a validator on each call. Call this at
+    application startup.
+
+    Raises:
+        jsonschema.exceptions.SchemaError: if one of our schemas is invalid.
+    """
+    for jws_type in SCHEMAS:
+        schema_file = 'schema_%s.yaml' % jws_type
+        s = _load_schema(pathlib.Path(__file__).parent / schema_file)
+        _validators[jws_type] = compile_schema(s, fast_path)
+
+
 def validate_schema(p: dict, jws_type: str) -> None:
     if jws_type not in SCHEMAS:
         raise exc.UnprocessableEntity(
             "JWS validation failed: Unknown 'typ': %s" % jws_type
         )
-    schema_file = 'schema_%s.yaml' % jws_type
-    s = _load_schema(pathlib.Path(__file__).parent / schema_file)
-    try:
-        jsonschema.validate(p, s)
-    except jsonschema.exceptions.SchemaError as e:
-        _logger.exception(e)
-        raise exc.InternalServerError('Schema error for type %s' % jws_type)
-    except jsonschema.exceptions.ValidationError as e:
+    if jws_type not in _validators:
+        # Only if the application didn’t call initialize_validators():
+        initialize_validators()
+    compiled = _validators[jws_type]
+    if compiled.fast is not None and compiled.fast(p):
+        return
+    # Either there’s no fast path, or the instance is invalid. In the latter
+    # case, the jsonschema validator provides the error message:
+    error = jsonschema.exceptions.best_match(compiled.validator.iter_errors(p))
+    if error is not None:
         raise exc.UnprocessableEntity(
-            "JWS validation failed: %s" % e
+            "JWS validation failed: %s" % error
         )
@@ -2,6 +2,7 @@ import logging
 import pathlib
 import typing as T
 
+import click
 from flask import Flask, make_response
 
 from ..common import exceptions
@@ -19,7 +20,37 @@ def create_app(test_config: T.Optional[dict] = None):
 
     app.config.from_mapping(
         # SECRET_KEY='dev',
+        # The path of an SQLite file, or a postgresql:// URL:
         DATABASE=instance_path / 'pseudomatd.sqlite',
+        SCHEMA_FAST_PATH=True,
+        # Number of worker processes for the batch endpoint, started by the
+        # first batch; `None` means one per CPU, and 0 means verifying in the
+        # request thread:
+        BATCH_WORKERS=None,
+        BATCH_MAX_LENGTH=16 * 1024 * 1024,
+        BATCH_MAX_OPERATIONS=1000,
+        KEY_CACHE_SIZE=1024,
+        RESPONSE_CACHE_SIZE=1024,
+        # Seconds that clients may cache a project; its JWS never changes:
+        PROJECT_MAX_AGE=24 * 60 * 60,
+        # Default and maximum number of members per page of GET /<project_id>/members:
+        MEMBERS_PAGE_SIZE=100,
+        MEMBERS_MAX_PAGE_SIZE=1000,
+        # A name from pseudomat.common.database.STORAGE_PROFILES, a
+        # StorageProfile, or `None` for the default of the database:
+        STORAGE_PROFILE=None,
+        # Whether to serve GET /metrics, and to time requests and database
+        # statements for it:
+        METRICS=True,
+        # A directory to write request profiles to, or `None` to disable
+        # profiling; see pseudomat.srv.profiling:
+        PROFILE_DIR=None,
+        # The fraction of requests to profile:
+        PROFILE_SAMPLE_RATE=0.0,
+        # Seconds after which a request is always profiled, or `None`:
+        PROFILE_THRESHOLD=None,
+        # The number of most recent profiles to keep; at least 1:
+        PROFILE_MAX_FILES=100,
     )
 
     if test_config is None:
@@ -29,15 +60,52 @@ def create_app(test_config: T.Optional[dict] = None):
         # load the test config if passed in
         app.config.from_mapping(test_config)
 
-    from ..common.database import initialize_database, teardown_database
-    initialize_database(app.config['DATABASE'])
-    app.teardown_appcontext(teardown_database)
+    from ..common.schemas import initialize_validators
+    initialize_validators(fast_path=app.config['SCHEMA_FAST_PATH'])
 
-    from . import project
+    from ..common import public_keys
+    from ..common.database import initialize_database
+    # The engine lives as long as the app, so that pooled connections are
+    # reused between requests:
+    initialize_database(app.config['DATABASE'], app.config['STORAGE_PROFILE'])
+    public_keys.maxsize = app.config['KEY_CACHE_SIZE']
+
+    from . import batch, metrics, profiling, project
+    project.responses.maxsize = app.config['RESPONSE_CACHE_SIZE']
     app.register_blueprint(project.bp)
+    app.register_blueprint(batch.bp)
+    batch.init_app(app)
+    metrics.init_app(app)
+    profiling.init_app(app)
 
     @app.errorhandler(exceptions.HTTPResponse)
     def handle_httperror(e: exceptions.HTTPResponse):
         return e.rv
 
+    app.cli.add_command(verify_chain_command)
+
     return app
+
+
+@click.command('verify-chain')
+@click.argument('project_ids', nargs=-1)
+@click.option('--full', is_flag=True, help="Verify from the start instead of from the checkpoints.")
+def verify_chain_command(project_ids, full):
+    # language=rst
+    """
+    Verifies the member chains of the given projects, or of all projects.
+    """
+    from ..common import chain, database
+    if not project_ids:
+        project_ids = [p['jti'] for p in database.get_projects()]
+    failed = 0
+    for project_id in project_ids:
+        try:
+            checkpoint = chain.verify_chain(project_id, full=full)
+        except chain.ChainError as e:
+            click.echo(str(e), err=True)
+            failed += 1
+        else:
+            click.echo("%s: %d entries, digest %s" % (project_id, checkpoint.length, checkpoint.digest))
+    if failed:
+        raise click.ClickException("%d of %d chains failed verification." % (failed, len(project_ids)))
@@ -0,0 +1,4 @@
+from .aio import main
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+# language=rst
+"""
+Asynchronous implementation of the routes in :mod:`pseudomat.srv.project`, on
+aiohttp.
+
+Request bodies are read without blocking, so slow clients only cost a
+coroutine instead of a thread. Signatures are verified on a process pool, and
+database calls run on the event loop’s default thread pool. Status codes and
+error bodies are the same as those of the Flask app.
+"""
+
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor
+import functools
+import logging
+import multiprocessing
+import pathlib
+import re
+import typing as T
+
+from aiohttp import web
+from flask import Config
+
+from ..common import database
+from ..common.exceptions import *
+from . import conditional, project
+
+_logger = logging.getLogger(__name__)
+
+CONFIG = web.AppKey('config', Config)
+EXECUTOR = web.AppKey('executor', T.Optional[Executor])
+
+_ID = r'[-\w]{32}'
+
+
+def create_app(test_config: T.Optional[dict] = None) -> web.Application:
+    config = Config(pathlib.Path('.').absolute())
+    config.from_mapping(
+        DATABASE=pathlib.Path(config.root_path) / 'pseudomatd.sqlite',
+        SCHEMA_FAST_PATH=True,
+        # Number of worker processes that verify signatures; `None` means one
+        # per CPU, and 0 means verifying on the event loop:
+        VERIFY_WORKERS=None,
+        KEY_CACHE_SIZE=1024,
+        RESPONSE_CACHE_SIZE=1024,
+        PROJECT_MAX_AGE=24 * 60 * 60,
+        MEMBERS_PAGE_SIZE=100,
+        MEMBERS_MAX_PAGE_SIZE=1000,
+        STORAGE_PROFILE=None,
+        BIND_PORT=8080,
+    )
+    if test_config is None:
+        config.from_pyfile('config.py', silent=False)
+    else:
+        config.from_mapping(test_config)
+
+    from ..common.schemas import initialize_validators
+    initialize_validators(fast_path=config['SCHEMA_FAST_PATH'])
+
+    from ..common import public_keys
+    from ..common.database import initialize_database, teardown_database
+    initialize_database(config['DATABASE'], config['STORAGE_PROFILE'])
+    public_keys.maxsize = config['KEY_CACHE_SIZE']
+    project.responses.maxsize = config['RESPONSE_CACHE_SIZE']
+
+    # Request bodies are decompressed by project.decode_content(), which limits
+    # their decompressed size:
+    app = web.Application(middlewares=[_handle_httperror], handler_args={'auto_decompress': False})
+    app[CONFIG] = config
+    if config['VERIFY_WORKERS'] == 0:
+        app[EXECUTOR] = None
+    else:
+        # Same as in batch._Workers: don’t fork a process with threads.
+        app[EXECUTOR] = ProcessPoolExecutor(
+            config['VERIFY_WORKERS'], mp_context=multiprocessing.get_context('spawn')
+        )
+
+    async def cleanup(app: web.Application):
+        if app[EXECUTOR] is not None:
+            app[EXECUTOR].shutdown()
+        teardown_database()
+    app.on_cleanup.append(cleanup)
+
+    app.router.add_get('/', _get_root, allow_head=False)
+    app.router.add_post('/', _post_project)
+    app.router.add_get('/{project_id}', _get_project, allow_head=False)
+    app.router.add_delete('/{project_id}', _delete_project)
+    app.router.add_put('/{project_id}/invites/{invite_id}', _put_invite)
+    app.router.add_get('/{project_id}/members', _get_members, allow_head=False)
+    return app
+
+
+def _response(e: HTTPResponse) -> web.Response:
+    response, status, headers = e.rv
+    if status == 204:
+        return web.Response(status=status)
+    if isinstance(response, str):
+        response = response.encode('utf-8')
+    return web.Response(body=response, status=status, headers=headers)
+
+
+@web.middleware
+async def _handle_httperror(request: web.Request, handler):
+    try:
+        return await handler(request)
+    except HTTPResponse as e:
+        return _response(e)
+
+
+def _created(request: web.Request, path: str) -> web.Response:
+    # Like Flask, we send a relative URL in the body, and an absolute one in
+    # the Location header:
+    response = _response(HTTPLocation(201, path))
+    response.headers['Location'] = str(request.url.with_path(path))
+    return response
+
+
+async def _run_in_thread(f, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(
+        None, functools.partial(f, *args, **kwargs)
+    )
+
+
+async def _verify(request: web.Request, method: str, args: tuple, body: str,
+                  psig: T.Optional[str] = None) -> T.Optional[dict]:
+    # language=rst
+    """
+    :raises HTTPResponse: if :func:`pseudomat.srv.project.verify_operation` fails
+    :returns: the verified payload
+    """
+    executor = request.app[EXECUTOR]
+    if executor is None:
+        status, value = project.verify_operation(method, args, body, psig)
+    else:
+        status, value = await asyncio.get_running_loop().run_in_executor(
+            executor, project.verify_operation, method, args, body, psig
+        )
+    if status != 0:
+        raise HTTPResponse(status, value)
+    return value
+
+
+async def _read_jose_upload(request: web.Request) -> str:
+    project.check_jose_headers(request.content_length, request.headers.get('Content-Type'))
+    return project.decode_jose(project.decode_content(
+        await request.read(), request.headers.get('Content-Encoding'), project.JOSE_MAX_LENGTH
+    ))
+
+
+async def _get_psig(project_id: str) -> T.Optional[str]:
+    stored = await _run_in_thread(database.get_project, project_id)
+    return None if stored is None else stored['psig']
+
+
+async def _get_root(_request: web.Request):
+    raise HTTPMethodNotAllowed(['OPTIONS', 'POST'])
+
+
+async def _post_project(request: web.Request):
+    body = await _read_jose_upload(request)
+    payload = await _verify(request, 'POST', (), body)
+    await _run_in_thread(project.insert_project, body, payload)
+    return _created(request, '/' + payload['jti'])
+
+
+async def _get_project(request: web.Request):
+    project_id = request.match_info['project_id']
+    cached = await _run_in_thread(project.project_response, project_id)
+    if cached is None:
+        raise HTTPResponse(404)  # Not Found
+    body, status, headers = conditional.conditional_get(
+        cached, request.headers.get('If-None-Match'), request.app[CONFIG]['PROJECT_MAX_AGE']
+    )
+    return web.Response(body=body, status=status, headers=headers)
+
+
+async def _delete_project(request: web.Request):
+    project_id = request.match_info['project_id']
+    if not re.fullmatch(_ID, project_id):
+        raise HTTPResponse(404, "Invalid project id.")  # Not Found
+    token = project.bearer_token(request.headers.get('Authorization'))
+    psig = await _get_psig(project_id)
+    if psig is None:
+        raise HTTPResponse(404, "Project not found.")  # Not Found
+    await _verify(request, 'DELETE', (project_id,), token, psig)
+    await _run_in_thread(project.delete_project, project_id)
+    return _response(HTTPResponse(204))
+
+
+async def _put_invite(request: web.Request):
+    project_id, invite_id = request.match_info['project_id'], request.match_info['invite_id']
+    if not re.fullmatch(_ID, project_id) or not re.fullmatch(_ID, invite_id):
+        raise HTTPResponse(404)  # Not Found
+
+    body = await _read_jose_upload(request)
+
+    psig = await _get_psig(project_id)
+    if psig is None:
+        raise HTTPResponse(404)  # Not Found
+
+    payload = await _verify(request, 'PUT', (project_id, invite_id), body, psig)
+    await _run_in_thread(project.insert_invite, body, payload)
+    return _created(request, '/%s/invites/%s' % (project_id, invite_id))
+
+
+async def _get_members(request: web.Request):
+    project_id = request.match_info['project_id']
+    config = request.app[CONFIG]
+    after, limit = project.members_page(
+        request.query.get('after'), request.query.get('limit'),
+        config['MEMBERS_PAGE_SIZE'], config['MEMBERS_MAX_PAGE_SIZE']
+    )
+    validators = await _run_in_thread(project.members_validators, project_id, after, limit)
+    if validators is None:
+        raise HTTPResponse(404)  # Not Found
+    headers = project.members_headers(*validators)
+    if conditional.not_modified(
+        request.headers.get('If-None-Match'), request.headers.get('If-Modified-Since'), *validators
+    ):
+        return web.Response(status=304, headers=headers)
+    # The generator holds a database connection, which mustn’t change threads,
+    # so a page is rendered in one go. Its size is bounded by MEMBERS_MAX_PAGE_SIZE:
+    body = await _run_in_thread(lambda: b''.join(project.members_body(project_id, after, limit)))
+    headers['Content-Type'] = project.MEMBERS_CONTENT_TYPE
+    return web.Response(body=body, headers=headers)
+
+
+def main():
+    app = create_app()
+    web.run_app(app, port=app[CONFIG]['BIND_PORT'])
@@ -0,0 +1,244 @@
+# language=rst
+"""
+Batch endpoint.
+
+Accepts a JSON array of operations, each of which would otherwise be a separate
+request to one of the routes in :mod:`pseudomat.srv.project`::
+
+    [
+        {"method": "POST", "path": "/", "body": "<project JWS>"},
+        {"method": "PUT", "path": "/<project_id>/invites/<invite_id>", "body": "<invite JWS>"},
+        {"method": "DELETE", "path": "/<project_id>", "authorization": "Bearer <token>"}
+    ]
+
+Signatures are verified in parallel on a process pool. All accepted operations
+are then applied, in order, in a single database transaction. The response is a
+JSON array with one ``{"status": ..., "message"|"location": ...}`` object per
+operation.
+
+Invites and deletes are verified with the key of the stored project, or, if
+there is none yet, with that of a ``POST`` of the project earlier in the same
+batch. Either way, they are only applied if the project has that key in the
+transaction, so a ``POST`` that fails can’t authorize anything.
+"""
+
+import atexit
+from concurrent.futures import Executor, ProcessPoolExecutor
+import logging
+import multiprocessing
+import re
+import threading
+import typing as T
+
+from flask import Blueprint, current_app, request
+
+from ..common import database
+from ..common.exceptions import *
+from .. import common
+from . import project
+
+_logger = logging.getLogger(__name__)
+
+bp = Blueprint('batch', __name__)
+
+_PATHS = [
+    ('POST', re.compile(r'^/$')),
+    ('PUT', re.compile(r'^/([-\w]{32})/invites/([-\w]{32})$')),
+    ('DELETE', re.compile(r'^/([-\w]{32})$')),
+]
+
+
+class _Workers(object):
+    # language=rst
+    """
+    The process pool of an app, started by the first batch that has something
+    to verify, so that apps that never see a batch don’t start any processes.
+    """
+
+    def __init__(self, workers: T.Optional[int]):
+        self.workers = workers
+        self._executor: T.Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    def executor(self) -> T.Optional[Executor]:
+        if self.workers == 0:
+            return None
+        with self._lock:
+            if self._executor is None:
+                # Forking a (possibly multi-threaded) web server is asking for trouble:
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                atexit.register(self.shutdown)
+            return self._executor
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+                atexit.unregister(self.shutdown)
+
+
+def init_app(app) -> None:
+    app.extensions['pseudomat.batch'] = _Workers(app.config['BATCH_WORKERS'])
+
+
+def shutdown(app) -> None:
+    # language=rst
+    """
+    Stops the worker processes of *app*, if any. A later batch starts new ones.
+    This also happens at exit.
+    """
+    app.extensions['pseudomat.batch'].shutdown()
+
+
+def _check_batch_upload() -> list:
+    req = request
+    if req.content_length is None:
+        raise HTTPResponse(411)  # Length Required
+    if req.content_length > current_app.config['BATCH_MAX_LENGTH']:
+        raise HTTPResponse(
+            413,  # Request Entity Too Large
+            "%d bytes seems a bit large for a batch." % req.content_length
+        )
+    if req.mimetype != 'application/json':
+        raise HTTPResponse(
+            415,  # Unsupported Media Type
+            response="Use application/json instead of %s." % req.content_type,
+        )
+    try:
+        data = project.decode_content(
+            req.get_data(), req.headers.get('Content-Encoding'), current_app.config['BATCH_MAX_LENGTH']
+        )
+        operations = common.json_loads(data.decode('utf-8'))
+    except ValueError:
+        raise HTTPResponse(400, "Request entity isn’t valid JSON.")  # Bad Request
+    if not isinstance(operations, list) or \
+            not all(isinstance(o, dict) for o in operations):
+        raise HTTPResponse(400, "Request entity must be an array of objects.")  # Bad Request
+    if len(operations) > current_app.config['BATCH_MAX_OPERATIONS']:
+        raise HTTPResponse(
+            413,  # Request Entity Too Large
+            "Too many operations in one batch: %d" % len(operations)
+        )
+    return operations
+
+
+def _parse_operation(operation: dict) -> T.Tuple[str, tuple, str]:
+    # language=rst
+    """
+    :raises HTTPResponse: ``400 Bad Request``, ``401 Unauthorized``, ``404 Not Found``
+        or ``405 Method Not Allowed``
+    :returns: a tuple ``(method, path_args, body)``, where *body* is the Bearer
+        token for ``DELETE`` operations.
+    """
+    method, path = operation.get('method'), operation.get('path')
+    if not isinstance(path, str):
+        raise HTTPResponse(400, "Missing or invalid 'path'.")  # Bad Request
+    for m, regex in _PATHS:
+        match = regex.fullmatch(path)
+        if match is None:
+            continue
+        if m != method:
+            raise HTTPResponse(405)  # Method Not Allowed
+        if method == 'DELETE':
+            body = project.bearer_token(operation.get('authorization'))
+        else:
+            body = operation.get('body')
+            try:
+                body.encode('ascii')
+            except (AttributeError, UnicodeEncodeError):
+                raise HTTPResponse(400, "Missing or invalid 'body'.")  # Bad Request
+        return method, match.groups(), body
+    raise HTTPResponse(404)  # Not Found
+
+
+def _check_project_key(project_id: str, psig: str, conn) -> None:
+    # language=rst
+    """
+    :raises HTTPResponse: ``404 Not Found`` if the project doesn’t exist, or
+        ``403 Forbidden`` if its signing key isn’t *psig*
+    """
+    stored = database.get_project(project_id, conn=conn)
+    if stored is None:
+        raise HTTPResponse(404, "Project not found.")  # Not Found
+    if stored['psig'] != psig:
+        raise HTTPResponse(403, "Not signed with the key of the project.")  # Forbidden
+
+
+@bp.route('/batch', methods=['POST'])
+def _post_batch():
+    operations = _check_batch_upload()
+    workers: _Workers = current_app.extensions['pseudomat.batch']
+
+    # One entry per operation; `None` until the operation fails or is applied:
+    results: T.List[T.Optional[dict]] = [None] * len(operations)
+    parsed: T.Dict[int, T.Tuple[str, tuple, str]] = {}
+    for i, operation in enumerate(operations):
+        try:
+            parsed[i] = _parse_operation(operation)
+        except HTTPResponse as e:
+            results[i] = {'status': e.rv[1], 'message': e.rv[0]}
+
+    def verify_all(indices: T.Dict[int, T.Optional[str]]) -> T.Dict[int, T.Any]:
+        jobs = {i: (*parsed[i], psig) for i, psig in indices.items()}
+        executor = workers.executor() if jobs else None
+        if executor is None:
+            outcomes = {i: project.verify_operation(*job) for i, job in jobs.items()}
+        else:
+            futures = {i: executor.submit(project.verify_operation, *job) for i, job in jobs.items()}
+            outcomes = {i: f.result() for i, f in futures.items()}
+        retval = {}
+        for i, (status, value) in outcomes.items():
+            if status == 0:
+                retval[i] = value
+            else:
+                results[i] = {'status': status, 'message': value}
+        return retval
+
+    # Projects first, because invites and deletes may refer to a project that
+    # is created earlier in the same batch:
+    verified = verify_all({i: None for i, p in parsed.items() if p[0] == 'POST'})
+    psigs = {
+        payload['jti']: common.json_dumps(payload['psig'])
+        for payload in verified.values()
+    }
+    # The key that each invite or delete is verified with. A stored project
+    # always takes precedence, because anyone can sign a POST for its id:
+    keys: T.Dict[int, str] = {}
+    for i, (method, args, _body) in parsed.items():
+        if method == 'POST':
+            continue
+        stored = database.get_project(args[0])
+        psig = psigs.get(args[0]) if stored is None else stored['psig']
+        if psig is None:
+            results[i] = {'status': 404, 'message': "Project not found."}
+            continue
+        keys[i] = psig
+    verified.update(verify_all(keys))
+
+    with database.transaction() as conn:
+        for i in sorted(verified):
+            method, args, body = parsed[i]
+            payload = verified[i]
+            try:
+                if method != 'POST':
+                    # Only the project as it is now, in this transaction, may
+                    # authorize the operation: a POST earlier in the batch may
+                    # have failed, or the project may have been replaced since
+                    # it was read:
+                    _check_project_key(args[0], keys[i], conn)
+                if method == 'POST':
+                    results[i] = {'status': 201, 'location': project.store_project(body, payload, conn)}
+                elif method == 'PUT':
+                    results[i] = {'status': 201, 'location': project.store_invite(body, payload, conn)}
+                elif project.delete_project(args[0], conn=conn):
+                    results[i] = {'status': 204}
+                else:
+                    results[i] = {'status': 404, 'message': "Project not found."}
+            except HTTPResponse as e:
+                results[i] = {'status': e.rv[1], 'message': e.rv[0]}
+    return (
+        common.json_dumps(results),
+        200,
+        {'Content-Type': 'application/json'}
+    )
@@ -0,0 +1,113 @@
+# language=rst
+"""
+Validators and conditional requests (:rfc:`7232`), for resources whose
+representations are served from memory, and for those that are streamed and
+only have their validators computed up front.
+"""
+
+import email.utils
+import typing as T
+
+from .. import common
+
+
+class CachedResponse(T.NamedTuple):
+    # language=rst
+    """
+    A serialized ``200 OK`` response with a strong validator.
+    """
+    body: bytes
+    content_type: str
+    etag: str
+
+    @classmethod
+    def create(cls, body: bytes, content_type: str) -> 'CachedResponse':
+        return cls(body, content_type, strong_etag(body))
+
+
+def strong_etag(body: bytes) -> str:
+    # language=rst
+    """
+    Returns:
+        A quoted entity tag that changes whenever *body* does.
+    """
+    return '"%s"' % common.fingerprint(body)
+
+
+def _opaque_tag(etag: str) -> str:
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def if_none_match(header: T.Optional[str], etag: str) -> bool:
+    # language=rst
+    """
+    Returns:
+        Whether the ``If-None-Match`` *header* matches *etag*, using the weak
+        comparison that :rfc:`7232#section-3.2` prescribes for this header.
+    """
+    if header is None:
+        return False
+    header = header.strip()
+    if header == '*':
+        return True
+    etag = _opaque_tag(etag)
+    return any(_opaque_tag(candidate.strip()) == etag for candidate in header.split(','))
+
+
+def http_date(timestamp: float) -> str:
+    # language=rst
+    """
+    Returns:
+        *timestamp* in the format of the ``Last-Modified`` header.
+    """
+    return email.utils.formatdate(timestamp, usegmt=True)
+
+
+def if_modified_since(header: T.Optional[str], last_modified: float) -> bool:
+    # language=rst
+    """
+    Returns:
+        Whether the ``If-Modified-Since`` *header* is missing, invalid or
+        older than *last_modified*, a timestamp.
+    """
+    if header is None:
+        return True
+    try:
+        since = email.utils.parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return True
+    return int(last_modified) > since.timestamp()
+
+
+def not_modified(if_none_match_header: T.Optional[str], if_modified_since_header: T.Optional[str],
+                 etag: str, last_modified: float) -> bool:
+    # language=rst
+    """
+    Returns:
+        Whether a ``GET`` request with these headers should get ``304 Not
+        Modified``. As :rfc:`7232#section-6` prescribes, ``If-Modified-Since``
+        is ignored when ``If-None-Match`` is present.
+    """
+    if if_none_match_header is not None:
+        return if_none_match(if_none_match_header, etag)
+    return not if_modified_since(if_modified_since_header, last_modified)
+
+
+def conditional_get(cached: CachedResponse, if_none_match_header: T.Optional[str], max_age: int) \
+        -> T.Tuple[bytes, int, T.Dict[str, str]]:
+    # language=rst
+    """
+    Returns:
+        A ``(body, status, headers)`` tuple, as in
+        :attr:`pseudomat.common.exceptions.HTTPResponse.rv`: ``304 Not
+        Modified`` if the client’s copy is still valid, or else ``200 OK``.
+        Both carry the validator and the ``Cache-Control`` header.
+    """
+    headers = {
+        'ETag': cached.etag,
+        'Cache-Control': 'public, max-age=%d' % max_age,
+    }
+    if if_none_match(if_none_match_header, cached.etag):
+        return b'', 304, headers
+    headers['Content-Type'] = cached.content_type
+    return cached.body, 200, headers
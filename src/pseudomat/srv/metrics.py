@@ -0,0 +1,111 @@
+# language=rst
+"""
+The ``GET /metrics`` endpoint, in the Prometheus text format, and the hooks
+that feed it:
+
+* the latency of every request and the number of responses, by route and
+  status code;
+* the time spent in each stage of handling a request, see
+  :func:`pseudomat.common.metrics.stage`;
+* the number and latency of database statements, by kind of statement;
+* the hits and misses of the server’s caches.
+
+The latency of a streamed response, such as a page of members, covers the time
+until the response headers are sent.
+"""
+
+import time
+
+from flask import Blueprint, Response, g, request
+import sqlalchemy as sa
+
+from .. import common
+from ..common import metrics
+from . import project
+
+bp = Blueprint('metrics', __name__)
+
+REQUEST_SECONDS = metrics.REGISTRY.register(metrics.Histogram(
+    'pseudomat_http_request_duration_seconds',
+    "Time spent handling HTTP requests.",
+    ('method', 'route')
+))
+RESPONSES = metrics.REGISTRY.register(metrics.Counter(
+    'pseudomat_http_responses_total',
+    "Number of HTTP responses.",
+    ('method', 'route', 'status')
+))
+DB_SECONDS = metrics.REGISTRY.register(metrics.Histogram(
+    'pseudomat_db_statement_duration_seconds',
+    "Time spent executing database statements.",
+    ('statement',)
+))
+DB_ERRORS = metrics.REGISTRY.register(metrics.Counter(
+    'pseudomat_db_errors_total',
+    "Number of database statements that raised an error.",
+    ('statement',)
+))
+metrics.REGISTRY.register(metrics.CacheCollector(
+    'pseudomat_cache',
+    "Lookups and entries",
+    {
+        'responses': project.responses,
+        'public_keys': common.public_keys,
+    }
+))
+
+
+def init_app(app) -> None:
+    if not app.config['METRICS']:
+        return
+    app.register_blueprint(bp)
+    app.before_request(_start_timer)
+    app.after_request(_record_status)
+    app.teardown_request(_observe_request)
+    if not sa.event.contains(sa.engine.Engine, 'before_cursor_execute', _before_cursor_execute):
+        sa.event.listen(sa.engine.Engine, 'before_cursor_execute', _before_cursor_execute)
+        sa.event.listen(sa.engine.Engine, 'after_cursor_execute', _after_cursor_execute)
+        sa.event.listen(sa.engine.Engine, 'handle_error', _handle_error)
+
+
+def _start_timer():
+    g.metrics_start = time.perf_counter()
+
+
+def _record_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _observe_request(_exc=None):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return
+    route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+    REQUEST_SECONDS.observe(time.perf_counter() - start, request.method, route)
+    # No status means that an exception escaped the error handlers:
+    RESPONSES.inc(request.method, route, str(g.pop('metrics_status', 500)))
+
+
+def _statement_kind(statement: str) -> str:
+    return statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ''
+
+
+def _before_cursor_execute(conn, _cursor, _statement, _parameters, _context, _executemany):
+    conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, _cursor, statement, _parameters, _context, _executemany):
+    DB_SECONDS.observe(time.perf_counter() - conn.info['metrics_start'].pop(), _statement_kind(statement))
+
+
+def _handle_error(context):
+    starts = context.connection.info.get('metrics_start') if context.connection is not None else None
+    if starts:
+        starts.pop()
+    DB_ERRORS.inc(_statement_kind(context.statement or ''))
+
+
+@bp.route('/metrics', methods=['GET'])
+def _get_metrics():
+    return Response(metrics.REGISTRY.render(), 200, content_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,58 @@
+# language=rst
+"""
+Opt-in profiling of requests. With ``PROFILE_DIR`` set, a profile is written
+for a random fraction ``PROFILE_SAMPLE_RATE`` of the requests, and for every
+request that takes longer than ``PROFILE_THRESHOLD`` seconds. Profiles are
+tagged with the method, the route and the project id, and only the
+``PROFILE_MAX_FILES`` most recent ones are kept. See
+:mod:`pseudomat.common.profiling`.
+
+With a threshold, every request runs under the profiler, which makes it
+several times slower; prefer a sample rate in production. Without
+``PROFILE_DIR``, no hooks are installed at all.
+"""
+
+import random
+import time
+
+from flask import g, request
+
+from ..common import profiling
+
+
+def init_app(app) -> None:
+    directory = app.config['PROFILE_DIR']
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    threshold = app.config['PROFILE_THRESHOLD']
+    if directory is None or not rate and threshold is None:
+        return
+    max_files = app.config['PROFILE_MAX_FILES']
+    if max_files < 1:
+        # Each dump would remove itself:
+        raise ValueError("PROFILE_MAX_FILES must be at least 1, not %r." % max_files)
+
+    @app.before_request
+    def _start_profile():
+        sampled = random.random() < rate
+        if not sampled and threshold is None:
+            return
+        profile = profiling.start()
+        if profile is not None:
+            g.profile = profile, sampled, time.perf_counter()
+
+    @app.teardown_request
+    def _dump_profile(_exc=None):
+        if 'profile' not in g:
+            return
+        profile, sampled, start = g.pop('profile')
+        profile.disable()
+        seconds = time.perf_counter() - start
+        if not sampled and seconds < threshold:
+            return
+        route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        tags = [request.method, route]
+        if request.view_args and 'project_id' in request.view_args:
+            tags.append(request.view_args['project_id'])
+        tags.append('%dms' % (seconds * 1000))
+        path = profiling.dump(profile, directory, tags, max_files)
+        app.logger.info("Profiled %s %s in %s", request.method, request.path, path)
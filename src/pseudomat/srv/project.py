@@ -1,18 +1,31 @@
 import logging
 import re
+import typing as T
+import urllib.parse
+import zlib
 
-from flask import Blueprint, request, url_for
+from cryptography.exceptions import InvalidSignature
+from flask import Blueprint, Response, current_app, request, url_for
+import werkzeug.exceptions
 
-from ..common import database
+from ..common import database, metrics
+from ..common.cache import LRUCache
 from ..common.exceptions import *
 from .. import common
+from . import conditional
 
 _logger = logging.getLogger(__name__)
 
 bp = Blueprint('pseudomat', __name__)
 
+responses = LRUCache(maxsize=1024)
+"""Serialized ``GET /<project_id>`` responses, by project JWS. Every request
+reads the JWS from the database, so an entry can’t outlive its project, also
+when another process deletes or replaces it; the cache only saves computing
+the response. See :func:`project_response`."""
 
-def _check_jose_upload() -> str:
+
+def check_jose_headers(content_length: T.Optional[int], content_type: T.Optional[str]) -> None:
     # language=rst
     """
     :raises HTTPResponse: with the following status codes:
@@ -20,25 +33,29 @@ def _check_jose_upload() -> str:
         * ``411 Length Required``
         * ``413 Request Entity Too Large``
         * ``415 Unsupported Media Type`` if the ``Content-Type`` isn’t ``application/jose``
-        * ``400 Bad Request`` if the request body contains non-ascii characters
-
-    :returns: the request payload
     """
-    req = request
-    if req.content_length is None:
+    if content_length is None:
         raise HTTPResponse(411)  # Length Required
-    if req.content_length > 65535:
+    if content_length > JOSE_MAX_LENGTH:
         raise HTTPResponse(
             413,  # Request Entity Too Large
-            "%d bytes seems a bit large for a jws." % req.content_length
+            "%d bytes seems a bit large for a jws." % content_length
         )
-    if req.content_type != 'application/jose':
+    if content_type != 'application/jose':
         raise HTTPResponse(
             415,  # Unsupported Media Type
-            response="Use application/jose instead of %s." % req.content_type,
+            response="Use application/jose instead of %s." % content_type,
         )
+
+
+def decode_jose(data: bytes) -> str:
+    # language=rst
+    """
+    :raises HTTPResponse: ``400 Bad Request`` if the request body contains
+        non-ascii characters
+    """
     try:
-        return req.get_data().decode('ascii')
+        return data.decode('ascii')
     except UnicodeDecodeError:
         raise HTTPResponse(
             400,  # Bad Request
@@ -46,23 +63,78 @@ def _check_jose_upload() -> str:
         )
 
 
+JOSE_MAX_LENGTH = 65535
+
+
+def decode_content(data: bytes, content_encoding: T.Optional[str], max_length: int) -> bytes:
+    # language=rst
+    """
+    Decompresses a request body with ``Content-Encoding: gzip``, without
+    inflating more than *max_length* bytes.
+
+    :raises HTTPResponse: ``415 Unsupported Media Type`` for other encodings,
+        ``400 Bad Request`` for corrupt data, or ``413 Request Entity Too
+        Large``
+    """
+    if content_encoding is None or content_encoding == 'identity':
+        return data
+    if content_encoding != 'gzip':
+        raise HTTPResponse(415, "Unsupported Content-Encoding: %s" % content_encoding)  # Unsupported Media Type
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        retval = decompressor.decompress(data, max_length + 1)
+    except zlib.error:
+        raise HTTPResponse(400, "Request entity isn’t valid gzip.")  # Bad Request
+    if len(retval) > max_length:
+        raise HTTPResponse(413, "Request entity is too large when decompressed.")  # Request Entity Too Large
+    if not decompressor.eof:
+        raise HTTPResponse(400, "Request entity isn’t valid gzip.")  # Bad Request
+    return retval
+
+
+def _check_jose_upload() -> str:
+    # language=rst
+    """
+    :raises HTTPResponse: see :func:`check_jose_headers`, :func:`decode_content`
+        and :func:`decode_jose`
+    :returns: the request payload
+    """
+    check_jose_headers(request.content_length, request.content_type)
+    with metrics.stage('upload'):
+        return decode_jose(decode_content(
+            request.get_data(), request.headers.get('Content-Encoding'), JOSE_MAX_LENGTH
+        ))
+
+
 @bp.route('/', methods=['GET'])
 def _get_root():
     raise HTTPMethodNotAllowed(['OPTIONS', 'POST'])
 
 
-@bp.route('/', methods=['POST'])
-def _post_project():
-    body = _check_jose_upload()
-    payload = common.validate_project_jws(body)
-    created = database.create_project(
-        jti=payload['jti'],
-        iss=payload['iss'],
-        sub=payload['sub'],
-        psig=common.json_dumps(payload['psig']),
-        penc=common.json_dumps(payload['penc']),
-        jws=body
-    )
+def verify_project(body: str) -> dict:
+    # language=rst
+    """
+    :raises HTTPResponse: ``400 Bad Request`` or ``422 Unprocessable Entity``
+    :returns: the verified payload
+    """
+    return common.validate_project_jws(body)
+
+
+def insert_project(body: str, payload: dict, conn=None) -> None:
+    # language=rst
+    """
+    :raises HTTPResponse: ``409 Conflict``
+    """
+    with metrics.stage('store'):
+        created = database.create_project(
+            jti=payload['jti'],
+            iss=payload['iss'],
+            sub=payload['sub'],
+            psig=common.json_dumps(payload['psig']),
+            penc=common.json_dumps(payload['penc']),
+            jws=body,
+            conn=conn
+        )
     # sendgrid.send_confirmation_mail(
     #     request.app, payload['iss'], payload['sub'], project_id
     # )
@@ -71,21 +143,260 @@ def _post_project():
             409,  # Conflict
             "A project with that name already exists."
         )
-    created_url = url_for('pseudomat._get_project', project_id=payload['jti'])
+
+
+def store_project(body: str, payload: dict, conn=None) -> str:
+    # language=rst
+    """
+    :raises HTTPResponse: ``409 Conflict``
+    :returns: the URL of the created project
+    """
+    insert_project(body, payload, conn)
+    return url_for('pseudomat._get_project', project_id=payload['jti'])
+
+
+def bearer_token(authorization: T.Optional[str]) -> str:
+    # language=rst
+    """
+    :raises HTTPResponse: ``401 Unauthorized`` or ``400 Bad Request``
+    """
+    if authorization is None:
+        raise HTTPResponse(401)  # Unauthorized
+    match = re.fullmatch(r'^Bearer ([-\w.]+)$', authorization)
+    if match is None:
+        raise HTTPResponse(400, "Illegal Authorization header format.")
+    return match.group(1)
+
+
+def verify_delete_token(project_id: str, token: str, project_key) -> None:
+    # language=rst
+    """
+    :param project_key: the public signing key of the project, as returned by
+        :func:`pseudomat.common.load_public_jwk`.
+    :raises HTTPResponse: ``400 Bad Request`` or ``401 Unauthorized``
+    """
+    try:
+        decoder = common.SignedObject(token)
+    except ValueError:
+        raise HTTPResponse(400, "Couldn’t deserialize Bearer token.")  # Bad Request
+    try:
+        decoder.validate(project_key)
+    except InvalidSignature:
+        raise HTTPResponse(401, "Invalid signature on Bearer token.")  # Unauthorized
+    if decoder.raw_payload != common.fingerprint({'method': 'DELETE',
+                                                  'path': '/' + project_id}).encode('ascii'):
+        raise HTTPResponse(401, "Invalid payload in Bearer token: '%s'" % decoder.raw_payload)  # Unauthorized
+
+
+def verify_invite(project_id: str, invite_id: str, body: str, project_key) -> dict:
+    # language=rst
+    """
+    :param project_key: the public signing key of the project, as returned by
+        :func:`pseudomat.common.load_public_jwk`.
+    :raises HTTPResponse: ``400 Bad Request``, ``403 Forbidden`` or ``422 Unprocessable Entity``
+    :returns: the verified payload
+    """
+    payload = common.validate_invite_jws(body, project_key)
+
+    if project_id != payload['iss'] or invite_id != payload['jti']:
+        raise HTTPResponse(
+            403,  # Forbidden
+            "Claims 'iss' and 'jti' don’t correspond with request URI."
+        )
+    return payload
+
+
+def verify_operation(method: str, args: tuple, body: T.Optional[str], psig: T.Optional[str]) \
+        -> T.Tuple[int, T.Union[str, dict, None]]:
+    # language=rst
+    """
+    Verifies a ``POST /``, ``PUT /<project_id>/invites/<invite_id>`` or
+    ``DELETE /<project_id>`` request, with *args* the path arguments and *body*
+    the Bearer token for ``DELETE``.
+
+    May run in a worker process, so it mustn’t touch the database or the
+    request, and it must return something picklable.
+
+    :param psig: the public signing key of the project, as stored in the
+        database, or ``None`` for ``POST``.
+    :returns: ``(0, payload)`` on success, or ``(status, message)`` on failure.
+    """
+    try:
+        if method == 'POST':
+            return 0, verify_project(body)
+        # Cached in the worker process by load_public_jwk():
+        project_key = common.load_public_jwk(psig)
+        if method == 'PUT':
+            return 0, verify_invite(args[0], args[1], body, project_key)
+        verify_delete_token(args[0], body, project_key)
+        return 0, None
+    except HTTPResponse as e:
+        response, status, _headers = e.rv
+        return status, response
+    except werkzeug.exceptions.HTTPException as e:
+        return e.code, e.description
+
+
+def insert_invite(body: str, payload: dict, conn=None) -> None:
+    # language=rst
+    """
+    :raises HTTPResponse: ``409 Conflict``
+    """
+    with metrics.stage('store'):
+        created = database.create_invite(
+            jti=payload['jti'],
+            iss=payload['iss'],
+            sub=payload['sub'],
+            psig=common.json_dumps(payload['psig']),
+            penc=common.json_dumps(payload['penc']),
+            jws=body,
+            conn=conn
+        )
+    if not created:
+        raise HTTPResponse(
+            409,  # Conflict
+            "An invite with that name already exists."
+        )
+
+
+def store_invite(body: str, payload: dict, conn=None) -> str:
+    # language=rst
+    """
+    :raises HTTPResponse: ``409 Conflict``
+    :returns: the URL of the created invite
+    """
+    insert_invite(body, payload, conn)
+    return url_for('pseudomat._put_invite', project_id=payload['iss'], invite_id=payload['jti'])
+
+
+def project_response(project_id: str) -> T.Optional[conditional.CachedResponse]:
+    # language=rst
+    """
+    Reads the project JWS from the database, and returns its response from
+    :data:`responses`, or computes and caches it.
+
+    Clients and shared caches may still serve a deleted or replaced project
+    for up to ``PROJECT_MAX_AGE`` seconds; see the ``Cache-Control`` header.
+
+    :returns: the response, or ``None`` if the project doesn’t exist.
+    """
+    jws = database.get_project_jws(project_id)
+    if jws is None:
+        return None
+    retval = responses.get(jws)
+    if retval is None:
+        retval = conditional.CachedResponse.create(jws.encode('ascii'), 'application/jose')
+        responses.put(jws, retval)
+    return retval
+
+
+MEMBERS_CONTENT_TYPE = 'application/hal+json'
+
+
+def members_page(after: T.Optional[str], limit: T.Optional[str], default_limit: int, max_limit: int) \
+        -> T.Tuple[T.Optional[str], int]:
+    # language=rst
+    """
+    Parses the ``after`` and ``limit`` query parameters of ``GET
+    /<project_id>/members``.
+
+    :raises HTTPResponse: ``400 Bad Request``
+    :returns: the invite id after which the page starts, if any, and the page size
+    """
+    if after is not None and not re.fullmatch(r'^[-\w]{32}$', after):
+        raise HTTPResponse(400, "Invalid value for 'after'.")  # Bad Request
+    if limit is None:
+        return after, default_limit
+    if not re.fullmatch(r'^[0-9]+$', limit) or not 0 < int(limit) <= max_limit:
+        raise HTTPResponse(400, "'limit' must be between 1 and %d." % max_limit)  # Bad Request
+    return after, int(limit)
+
+
+def members_validators(project_id: str, after: T.Optional[str], limit: int) \
+        -> T.Optional[T.Tuple[str, int]]:
+    # language=rst
+    """
+    Validators of a page of the members of a project, from the tail of the
+    member chain and the time of its last change, which are both on the
+    project row, so that a client that re-polls an unchanged project costs a
+    single indexed lookup.
+
+    Members are only ever appended to the chain, so its tail changes whenever
+    any page does. The time is taken from the clock of the server, because
+    the ``iat`` claims are the clients’. The validators may be older than a
+    page that is rendered after a concurrent change, which only makes the
+    client fetch it again.
+
+    :returns: the ``(etag, last_modified)`` pair, or ``None`` if the project
+        doesn’t exist.
+    """
+    state = database.get_member_chain_state(project_id)
+    if state is None:
+        return None
+    # An empty chain starts at the project itself:
+    etag = '"%s"' % common.fingerprint([state['chain_tail'] or project_id, state['modified'], after, limit])
+    return etag, state['modified']
+
+
+def members_headers(etag: str, last_modified: int) -> T.Dict[str, str]:
+    return {
+        'ETag': etag,
+        'Last-Modified': conditional.http_date(last_modified),
+        # The list changes, so clients must revalidate before each use:
+        'Cache-Control': 'no-cache',
+    }
+
+
+def members_url(project_id: str, after: T.Optional[str], limit: int) -> str:
+    query = {'limit': limit} if after is None else {'after': after, 'limit': limit}
+    return '/%s/members?%s' % (project_id, urllib.parse.urlencode(query))
+
+
+def members_body(project_id: str, after: T.Optional[str], limit: int) -> T.Iterator[bytes]:
+    # language=rst
+    """
+    Generates a page of the members of a project as a HAL document, one member
+    at a time, as the rows come in from the database. One row more than
+    *limit* is read, to find out whether there’s a next page.
+    """
+    yield b'{"_embedded":{"members":['
+    last = None
+    has_next = False
+    for i, member in enumerate(database.iter_members(project_id, limit + 1, after)):
+        if i == limit:
+            has_next = True
+            break
+        yield (b',' if i else b'') + common.json_dumps_bytes(member)
+        last = member['jti']
+    links = {'self': {'href': members_url(project_id, after, limit)}}
+    if has_next:
+        links['next'] = {'href': members_url(project_id, last, limit)}
+    yield b']},"_links":' + common.json_dumps_bytes(links) + b'}'
+
+
+def delete_project(project_id: str, conn=None) -> bool:
+    # language=rst
+    """
+    :returns: whether the project existed
+    """
+    return database.delete_project(project_id, conn=conn)
+
+
+@bp.route('/', methods=['POST'])
+def _post_project():
+    body = _check_jose_upload()
+    payload = verify_project(body)
+    created_url = store_project(body, payload)
     return HTTPLocation(201, created_url).response
 
 
 @bp.route('/<project_id>', methods=['GET'])
 def _get_project(project_id):
-    project = database.get_project(project_id)
-    if project is None:
+    cached = project_response(project_id)
+    if cached is None:
         raise HTTPResponse(404)  # Not Found
-    return (
-        project['jws'].encode('ascii'),
-        200,
-        {
-            'Content-Type': 'application/jose'
-        }
+    return conditional.conditional_get(
+        cached, request.headers.get('If-None-Match'), current_app.config['PROJECT_MAX_AGE']
     )
 
 
@@ -93,27 +404,12 @@ def _get_project(project_id):
 def _delete_project(project_id):
     if not re.fullmatch(r'^[-\w]{32}$', project_id):
         raise HTTPResponse(404, "Invalid project id.")  # Not Found
-    if 'Authorization' not in request.headers:
-        raise HTTPResponse(401)  # Unauthorized
-    authorization = re.fullmatch(r'^Bearer ([-\w.]+)$', request.headers['Authorization'])
-    if authorization is None:
-        raise HTTPResponse(400, "Illegal Authorization header format.")
-    token = authorization.group(1)
-    project = database.get_project(project_id)
-    if project is None:
+    token = bearer_token(request.headers.get('Authorization'))
+    project_key = database.get_project_key(project_id)
+    if project_key is None:
         raise HTTPResponse(404, "Project not found.")  # Not Found
-    from jwcrypto import jwk, jws
-    try:
-        decoder = jws.JWS()
-        decoder.deserialize(token, jwk.JWK.from_json(project['psig']), alg='EdDSA')
-    except jws.InvalidJWSObject:
-        raise HTTPResponse(400, "Couldn’t deserialize Bearer token.")  # Bad Request
-    except jws.InvalidJWSSignature:
-        raise HTTPResponse(401, "Invalid signature on Bearer token.")  # Unauthorized
-    if decoder.payload != common.fingerprint({'method': 'DELETE',
-                                              'path': '/' + project_id}).encode('ascii'):
-        raise HTTPResponse(401, "Invalid payload in Bearer token: '%s'" % decoder.payload)  # Unauthorized
-    database.delete_project(project_id)
+    verify_delete_token(project_id, token, project_key)
+    delete_project(project_id)
     return HTTPResponse(204).response
 
 
@@ -124,29 +420,27 @@ def _put_invite(project_id, invite_id):
 
     body = _check_jose_upload()
 
-    project = database.get_project(project_id)
-    if project is None:
+    project_key = database.get_project_key(project_id)
+    if project_key is None:
         raise HTTPResponse(404)  # Not Found
 
-    from jwcrypto.jwk import JWK
-    project_key = JWK.from_json(project['psig'])
-    payload = common.validate_invite_jws(body, project_key)
+    payload = verify_invite(project_id, invite_id, body, project_key)
+    created_url = store_invite(body, payload)
+    return HTTPLocation(201, created_url).response
 
-    if project_id != payload['iss'] or invite_id != payload['jti']:
-        raise HTTPResponse(
-            403,  # Forbidden
-            "Claims 'iss' and 'jti' don’t correspond with request URI."
-        )
 
-    created = database.create_invite(
-        jti=payload['jti'],
-        iss=payload['iss'],
-        sub=payload['sub'],
-        iat=payload['iat'],
-        psig=common.json_dumps(payload['psig']),
-        penc=common.json_dumps(payload['penc']),
-        jws=body
+@bp.route('/<project_id>/members', methods=['GET'])
+def _get_members(project_id):
+    after, limit = members_page(
+        request.args.get('after'), request.args.get('limit'),
+        current_app.config['MEMBERS_PAGE_SIZE'], current_app.config['MEMBERS_MAX_PAGE_SIZE']
     )
-    if not created:
-        raise HTTPResponse(200, "Project already exists.")
-    return HTTPLocation(201, request.url)
+    validators = members_validators(project_id, after, limit)
+    if validators is None:
+        raise HTTPResponse(404)  # Not Found
+    headers = members_headers(*validators)
+    if conditional.not_modified(
+        request.headers.get('If-None-Match'), request.headers.get('If-Modified-Since'), *validators
+    ):
+        return b'', 304, headers
+    return Response(members_body(project_id, after, limit), 200, headers, content_type=MEMBERS_CONTENT_TYPE)
@@ -0,0 +1,67 @@
+import time
+import typing as T
+
+from jwcrypto import jwk, jws, jwt
+import pytest
+
+from pseudomat import common
+
+
+class Jose(object):
+    # language=rst
+    """
+    Makes the JWSs that clients send, with jwcrypto, independently of the
+    signing code under test: projects, invites and delete tokens.
+    """
+
+    @staticmethod
+    def sign(claims: dict, typ: str, key: jwk.JWK) -> str:
+        t = jwt.JWT(claims=claims, header={'alg': 'EdDSA', 'typ': typ})
+        t.make_signed_token(key)
+        return t.serialize()
+
+    @staticmethod
+    def claims(**claims) -> T.Tuple[jwk.JWK, dict]:
+        # language=rst
+        """
+        Returns:
+            a new signing key, and *claims* with the public keys of that key
+            and of a new encryption key, and an ``iat``.
+        """
+        sigkey = jwk.JWK.generate(kty='OKP', crv='Ed448', use='sig')
+        enckey = jwk.JWK.generate(kty='OKP', crv='X448', use='enc')
+        claims.update(
+            psig=common.json_loads(sigkey.export_public()),
+            penc=common.json_loads(enckey.export_public()),
+            iat=int(time.time())
+        )
+        return sigkey, claims
+
+    def project(self, sub: str, iss: str = 'owner@example.com') -> T.Tuple[jwk.JWK, str, str]:
+        # language=rst
+        """
+        Returns:
+            the signing key, the id and the JWS of a new project.
+        """
+        sigkey, claims = self.claims(jti=common.fingerprint(sub), iss=iss, sub=sub)
+        return sigkey, claims['jti'], self.sign(claims, 'project', sigkey)
+
+    def invite(self, project_key: jwk.JWK, project_id: str, sub: str) -> T.Tuple[str, str]:
+        # language=rst
+        """
+        Returns:
+            the id and the JWS of a new invite, signed with *project_key*.
+        """
+        _sigkey, claims = self.claims(jti=common.fingerprint([project_id, sub]), iss=project_id, sub=sub)
+        return claims['jti'], self.sign(claims, 'pinvite', project_key)
+
+    @staticmethod
+    def delete_token(project_key: jwk.JWK, project_id: str) -> str:
+        token = jws.JWS(payload=common.fingerprint({'method': 'DELETE', 'path': '/' + project_id}))
+        token.add_signature(project_key, protected={'alg': 'EdDSA'})
+        return token.serialize(compact=True)
+
+
+@pytest.fixture(scope='session')
+def jose() -> Jose:
+    return Jose()
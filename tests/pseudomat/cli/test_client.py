@@ -0,0 +1,68 @@
+import gzip
+import http.server
+import logging
+import threading
+
+import pytest
+from yarl import URL
+
+from pseudomat.cli.client import Client
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_PUT(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        server.requests.append((self.client_address, self.headers.get('Content-Encoding'), body))
+        status = server.statuses.pop(0) if server.statuses else 201
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    retval = http.server.ThreadingHTTPServer(('localhost', 0), _Handler)
+    retval.requests = []
+    retval.statuses = []
+    thread = threading.Thread(target=retval.serve_forever, daemon=True)
+    thread.start()
+    yield retval
+    retval.shutdown()
+    retval.server_close()
+
+
+def test_keep_alive(server, caplog):
+    client = Client(URL('http://localhost:%d/' % server.server_port))
+    with caplog.at_level(logging.DEBUG, logger='pseudomat.cli.client'):
+        for _ in range(5):
+            assert client.put(client.url('a', 'b'), data='x').status_code == 201
+    assert len({address for address, _encoding, _body in server.requests}) == 1
+    assert 'PUT http://localhost:%d/a/b: 201 in' % server.server_port in caplog.text
+    client.close()
+
+
+def test_retries(server):
+    client = Client(URL('http://localhost:%d/' % server.server_port), retries=2, backoff=0)
+    server.statuses = [503, 502]
+    assert client.put(client.url(), data='x').status_code == 201
+    assert len(server.requests) == 3
+    server.statuses = [503, 503, 503]
+    assert client.put(client.url(), data='x').status_code == 503
+    client.close()
+
+
+def test_gzip(server):
+    client = Client(URL('http://localhost:%d/' % server.server_port), gzip=True)
+    body = 'eyJhbGciOiJFZERTQSJ9.' * 100
+    client.put(client.url(), data=body)
+    client.put(client.url(), data='small')
+    (_address, encoding, data), (_address2, encoding2, data2) = server.requests
+    assert encoding == 'gzip' and gzip.decompress(data).decode() == body
+    assert encoding2 is None and data2 == b'small'
+    client.close()
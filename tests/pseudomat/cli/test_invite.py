@@ -0,0 +1,82 @@
+import json
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+import requests
+from yarl import URL
+
+from pseudomat import common
+from pseudomat.cli import globals
+from pseudomat.cli.actions import invite, project
+from pseudomat.common import database
+
+SERVER = """
+import sys
+from pseudomat.srv import create_app
+create_app({'DATABASE': sys.argv[2], 'BATCH_WORKERS': 0}).run(port=int(sys.argv[1]), threaded=True)
+"""
+
+
+@pytest.fixture(scope='module')
+def server_url(tmp_path_factory):
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen([
+        sys.executable, '-c', SERVER, str(port), str(tmp_path_factory.mktemp('server') / 'pseudomatd.sqlite')
+    ])
+    url = URL('http://localhost:%d/' % port)
+    for _ in range(100):
+        try:
+            requests.get(str(url))
+            break
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    yield url
+    process.terminate()
+    process.wait()
+
+
+@pytest.fixture
+def local_project(server_url, tmp_path, monkeypatch):
+    monkeypatch.setattr(globals, 'SERVER_URL', server_url)
+    database.initialize_database(tmp_path / 'pseudomat.sqlite')
+    retval = project.create_local_project('owner@example.com', 'Invite project %s' % tmp_path.name)
+    project.create_remote_project(retval)
+    yield retval
+    database.teardown_database()
+
+
+def test_create_invite(local_project):
+    created = invite.create_local_invite(local_project, 'Supplier')
+    invite.create_remote_invite(created)
+    # Idempotent:
+    assert invite.create_local_invite(local_project, ' Supplier ')['sjws'] == created['sjws']
+    invite.create_remote_invite(invite.create_local_invite(local_project, 'Supplier'))
+    payload = common.SignedObject(created['sjws']).payload
+    assert payload['jti'] == created['jti'] and 'ssig' in payload and 'senc' in payload
+
+
+def test_create_invites(local_project, server_url):
+    names = ['Supplier %d' % i for i in range(20)]
+    results = list(invite.create_invites(local_project, names[:10], jobs=2, connections=4))
+    assert [name for name, _token, _error in results] == names[:10]
+    assert all(error is None for _name, _token, error in results)
+    tokens = [token for _name, token, _error in results]
+
+    # Resumes, and reuses the invites that are stored already:
+    results = list(invite.create_invites(local_project, names + names[:1], jobs=2, connections=4))
+    assert [name for name, _token, _error in results] == names
+    assert [token for _name, token, _error in results][:10] == tokens
+    assert all(error is None for _name, _token, error in results)
+
+    # A name that differs only in case is refused locally:
+    results = list(invite.create_invites(local_project, ['SUPPLIER 1'], jobs=1))
+    assert results == [('SUPPLIER 1', None, "An invite with that name already exists.")]
+
+    r = requests.get(str(server_url / local_project['jti'] / 'members'))
+    members = json.loads(r.content)['_embedded']['members']
+    assert sorted(m['sub'] for m in members) == sorted(names)
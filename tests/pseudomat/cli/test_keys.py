@@ -0,0 +1,90 @@
+import subprocess
+import time
+
+import pytest
+
+from pseudomat.cli.actions import keys, project
+from pseudomat.common import database
+
+
+@pytest.fixture
+def local_database(tmp_path):
+    database.initialize_database(tmp_path / 'pseudomat.sqlite')
+    yield database
+    database.teardown_database()
+
+
+def test_key_pool(local_database):
+    assert keys.pool_size() == 0
+    assert keys.prefill(5) == 5
+    assert keys.prefill(3) == 0
+    assert keys.pool_size() == 5
+    taken = keys.take_key_pairs(2)
+    assert len(taken) == 2 and taken[0] != taken[1]
+    rest = keys.take_key_pairs(10)
+    assert len(rest) == 3
+    # Never handed out twice:
+    assert len(set(taken + rest)) == 5
+    assert keys.pool_size() == 0
+    # Generated on the spot when the pool is empty:
+    ssig, senc = keys.take_key_pair()
+    assert '"Ed448"' in ssig and '"X448"' in senc
+
+
+def test_project_from_pool(local_database):
+    keys.prefill(1)
+    (pooled,) = database.take_key_pairs(1)
+    database.add_key_pairs([pooled])
+    created = project.create_local_project('owner@example.com', 'Pooled project')
+    assert (created['ssig'], created['senc']) == pooled
+    assert keys.pool_size() == 0
+
+
+def test_refill_in_background(local_database, monkeypatch):
+    started = []
+    monkeypatch.setattr(subprocess, 'Popen', lambda args, **kwargs: started.append(args))
+    keys.prefill(8)
+    keys.take_key_pairs(2)
+    assert started == []  # No background size set
+    keys.set_background_size(8)
+    keys.take_key_pairs(3)
+    assert started[0][-3:] == ['keys', 'prefill', '8']
+    # Only one refill at a time:
+    keys.take_key_pairs(1)
+    keys.take_key_pairs(1)
+    assert len(started) == 1
+    # Until it’s done:
+    keys.prefill(2)
+    keys.take_key_pairs(1)
+    assert len(started) == 2
+    # Or presumed dead:
+    database.set_config(keys.KEY_POOL_REFILL, str(time.time() - keys.REFILL_TIMEOUT - 1))
+    keys.take_key_pairs(1)
+    assert len(started) == 3
+    keys.set_background_size(None)
+    keys.prefill(0)
+    keys.take_key_pairs(1)
+    assert len(started) == 3
+
+
+def test_keys_return_on_failure(local_database):
+    keys.prefill(2)
+    project.create_local_project('owner@example.com', 'Failing project')
+    assert keys.pool_size() == 1
+    with pytest.raises(SystemExit):
+        project.create_local_project('owner@example.com', 'Failing project')
+    assert keys.pool_size() == 1
+
+
+def test_refill_after_create(local_database, monkeypatch):
+    from pseudomat.cli.actions import invite
+    started = []
+    monkeypatch.setattr(subprocess, 'Popen', lambda args, **kwargs: started.append(args))
+    keys.prefill(4)
+    keys.set_background_size(10)
+    # The refill starts after the transaction that took the keys, which would
+    # otherwise hold the write lock that the refill needs:
+    created = project.create_local_project('owner@example.com', 'Refilled project')
+    assert len(started) == 1 and keys.pool_size() == 3
+    invite.create_local_invite(created, 'Invitee')
+    assert len(started) == 1 and keys.pool_size() == 2
@@ -0,0 +1,171 @@
+import io
+
+from jwcrypto import jwk
+import pytest
+
+from pseudomat import common
+from pseudomat.cli.actions import pseudonymize
+
+CSV = """id,name,bsn
+1,Alice,123456782
+2,Bob, 123456782
+3,Carol,
+4,Dave,987654321
+"""
+
+
+@pytest.fixture(scope='module')
+def project() -> dict:
+    return {
+        'jti': common.fingerprint('Test project'),
+        'sub': 'Test project',
+        'ssig': jwk.JWK.generate(kty='OKP', crv='Ed448', use='sig').export(),
+        'senc': jwk.JWK.generate(kty='OKP', crv='X448', use='enc').export(),
+    }
+
+
+def test_project_key(project):
+    key = pseudonymize.project_key(project)
+    assert len(key) == 32
+    assert key == pseudonymize.project_key(dict(project))
+    with pytest.raises(AssertionError):
+        pseudonymize.project_key(dict(project, ssig=None))
+
+
+def test_pseudonymize_csv(project):
+    key = pseudonymize.project_key(project)
+    outfile = io.StringIO()
+    summary = pseudonymize.pseudonymize_csv(io.StringIO(CSV), outfile, ['bsn'], key, chunk_size=3)
+    assert summary.rows == 4
+    assert summary.cache_stats == {'bsn': {'hits': 1, 'misses': 2}}
+    lines = [line.split(',') for line in outfile.getvalue().splitlines()]
+    assert lines[0] == ['id', 'name', 'bsn']
+    assert lines[1][:2] == ['1', 'Alice']
+    assert lines[1][2] == lines[2][2] == common.keyed_fingerprint(key, '123456782')
+    assert lines[3][2] == ''
+    assert lines[4][2] not in (lines[1][2], '987654321')
+
+
+def test_pseudonymize_csv_unknown_column(project):
+    key = pseudonymize.project_key(project)
+    with pytest.raises(AssertionError):
+        pseudonymize.pseudonymize_csv(io.StringIO(CSV), io.StringIO(), ['email'], key)
+
+
+def test_pseudonymize_parallel(project, tmp_path):
+    key = pseudonymize.project_key(project)
+    lines = ['id,name,bsn'] + ['%d,"Name, %d",%09d' % (i, i, i % 97) for i in range(2000)]
+    path = tmp_path / 'input.csv'
+    path.write_text('\r\n'.join(lines), encoding='utf-8')
+    expected = io.StringIO()
+    summary = pseudonymize.pseudonymize_csv(io.StringIO('\n'.join(lines)), expected, ['bsn', 'id'], key)
+    assert summary.rows == 2000
+    outfile = io.BytesIO()
+    summary = pseudonymize.pseudonymize_parallel(str(path), outfile, ['bsn', 'id'], key, jobs=2, range_size=1000)
+    assert summary.rows == 2000
+    assert sum(summary.cache_stats['bsn'].values()) == 2000
+    assert summary.cache_stats['id'] == {'misses': 2000}
+    assert outfile.getvalue() == expected.getvalue().encode('utf-8')
+
+
+def test_pseudonymize_parallel_quoted_newline(project, tmp_path):
+    key = pseudonymize.project_key(project)
+    path = tmp_path / 'input.csv'
+    path.write_text('id,bsn\n1,"12\n34"\n', encoding='utf-8')
+    with pytest.raises(AssertionError):
+        pseudonymize.pseudonymize_parallel(str(path), io.BytesIO(), ['bsn'], key, jobs=2, range_size=4)
+
+
+def test_column_pseudonymizer(project):
+    key = pseudonymize.project_key(project)
+    pseudonymizer = pseudonymize.ColumnPseudonymizer(key, cache_size=2)
+    for value in ['a', ' a', 'b', 'c', 'a', '']:
+        assert pseudonymizer(value) == pseudonymize.pseudonymize_value(key, value)
+    # 'a' was evicted by 'c', the empty value isn’t looked up:
+    assert pseudonymizer.cache_stats() == {'hits': 1, 'misses': 4}
+    assert pseudonymize.ColumnPseudonymizer(key, cache_size=0).cache_stats() == {}
+
+
+@pytest.mark.parametrize('extension', ['.parquet', '.arrow'])
+def test_pseudonymize_columnar(project, tmp_path, extension):
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.feather
+    import pyarrow.ipc
+    import pyarrow.parquet
+    key = pseudonymize.project_key(project)
+    table = pa.table({
+        'id': [1, 2, 3, 4],
+        'name': ['Alice', 'Bob', 'Carol', 'Dave'],
+        'bsn': ['123456782', ' 123456782', '', None],
+        'customer': [7, 7, 8, None],
+    })
+    source, target = tmp_path / ('input' + extension), tmp_path / ('output' + extension)
+    if extension == '.parquet':
+        pyarrow.parquet.write_table(table, source)
+    else:
+        pyarrow.feather.write_feather(table, source, compression='uncompressed')
+    summary = pseudonymize.pseudonymize_file(str(source), str(target), ['bsn', 'customer'], key, chunk_size=3)
+    assert summary.rows == 4
+    if extension == '.parquet':
+        result = pyarrow.parquet.read_table(target)
+    else:
+        result = pyarrow.ipc.open_stream(target).read_all()
+    assert pa.types.is_dictionary(result.schema.field('bsn').type)
+    assert result.column('name').to_pylist() == table.column('name').to_pylist()
+
+    # Pseudonyms are the same as in CSV files:
+    csv_out = io.StringIO()
+    pseudonymize.pseudonymize_csv(
+        io.StringIO('bsn,customer\n123456782,7\n 123456782,7\n,8\n,\n'), csv_out, ['bsn', 'customer'], key
+    )
+    rows = [line.split(',') for line in csv_out.getvalue().splitlines()[1:]]
+    assert result.column('bsn').to_pylist() == [rows[0][0], rows[1][0], '', None]
+    assert result.column('customer').to_pylist() == [rows[0][1], rows[1][1], rows[2][1], None]
+
+
+@pytest.mark.parametrize('cache_size', [0, 2])
+def test_pseudonymize_mmap(project, tmp_path, cache_size):
+    key = pseudonymize.project_key(project)
+    data = (
+        'id,name,bsn\r\n'
+        '1,Alice,123456782\r\n'
+        '2,"Bob, Jr.", 123456782 \n'
+        '\n'
+        '3,"Carol\r\nSmith","98765\n4321"\n'
+        '4,Dave\n'
+        '5,Eve,\t\n'
+        '6,Frank,"quoted ""value"""\r'
+        '7,Grace,123456782,extra\n'
+        '8,Heidi,Ünïcødé'
+    )
+    path = tmp_path / 'input.csv'
+    path.write_bytes(data.encode('utf-8'))
+    expected = io.StringIO(newline='')
+    with pseudonymize.open_input(str(path)) as infile:
+        expected_summary = pseudonymize.pseudonymize_csv(infile, expected, ['bsn', 'id'], key, cache_size=cache_size)
+    for block_size in (1, 4096):
+        outfile = io.BytesIO()
+        summary = pseudonymize.pseudonymize_mmap(
+            str(path), outfile, ['bsn', 'id'], key, cache_size=cache_size, block_size=block_size
+        )
+        assert outfile.getvalue() == expected.getvalue().encode('utf-8')
+    assert summary.rows == expected_summary.rows == 9
+    assert summary.cache_stats == expected_summary.cache_stats
+
+    # Without quotes, all records are split in the mapped file:
+    path.write_bytes(b'id,name,bsn\r\n1,Alice, 123456782\r\n\n2\n3,Bob,\t,x\n4,Carol,123456782')
+    expected = io.StringIO(newline='')
+    with pseudonymize.open_input(str(path)) as infile:
+        pseudonymize.pseudonymize_csv(infile, expected, ['bsn', 'id'], key)
+    outfile = io.BytesIO()
+    summary = pseudonymize.pseudonymize_mmap(str(path), outfile, ['bsn', 'id'], key, cache_size=cache_size)
+    assert outfile.getvalue() == expected.getvalue().encode('utf-8')
+    assert summary.rows == 5
+
+    # A single pseudonymized column, and an empty file:
+    path.write_bytes(b'bsn\n1\n \n"2"\n')
+    outfile = io.BytesIO()
+    pseudonymize.pseudonymize_mmap(str(path), outfile, ['bsn'], key)
+    assert outfile.getvalue().splitlines()[2] == b'""'
+    path.write_bytes(b'')
+    assert pseudonymize.pseudonymize_mmap(str(path), io.BytesIO(), ['bsn'], key) == (0, {})
@@ -0,0 +1,88 @@
+# language=rst
+"""
+Import-time budgets of the CLI, measured with ``python -X importtime``. The
+budgets are generous multiples of the actual import times, so that they only
+fail when a command starts importing something heavy; the lists of modules
+that mustn’t be imported at all are the more precise check.
+"""
+
+import os
+import pstats
+import subprocess
+import sys
+import typing as T
+
+import pytest
+
+HEAVY = {'sqlalchemy', 'jwcrypto', 'requests', 'jsonschema', 'werkzeug', 'cryptography', 'pyarrow'}
+
+COMMANDS = [
+    # (arguments, budget in milliseconds, modules that mustn’t be imported)
+    (['--help'], 100, HEAVY),
+    (['project', '--help'], 100, HEAVY),
+    (['invite', 'create', '--help'], 100, HEAVY),
+    (['pseudonymize', '--help'], 100, HEAVY),
+    (['keys', 'prefill', '--help'], 100, HEAVY),
+    (['project', 'create'], 100, HEAVY),  # An argument error
+    (['project', 'info'], 100, HEAVY),
+    (['project', 'list'], 500, HEAVY - {'sqlalchemy', 'cryptography'}),
+]
+
+
+def import_times(args: T.List[str], home: str) -> T.Tuple[float, T.Set[str]]:
+    # language=rst
+    """
+    Returns:
+        the time in milliseconds that the imports after interpreter startup
+        took, and the names of the top-level packages that were imported.
+    """
+    env = dict(os.environ, HOME=home)
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-m', 'pseudomat.cli'] + args,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env=env, universal_newlines=True
+    ).stderr
+    total = 0
+    packages = set()
+    started = False
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _self, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue  # The header
+        started = started or name.strip().startswith('pseudomat')
+        packages.add(name.strip().split('.')[0])
+        # Only outermost imports, whose times include those of nested ones:
+        if started and not name.startswith('  '):
+            total += int(cumulative)
+    return total / 1000, packages
+
+
+@pytest.mark.parametrize('args, budget, forbidden', COMMANDS, ids=[' '.join(c[0]) for c in COMMANDS])
+def test_import_time(args, budget, forbidden, tmp_path):
+    milliseconds, packages = import_times(args, str(tmp_path))
+    assert 'pseudomat' in packages
+    assert not packages & forbidden
+    assert milliseconds < budget
+
+
+def test_profile(tmp_path):
+    env = dict(os.environ, HOME=str(tmp_path))
+    path = tmp_path / 'keys.prof'
+    rv = subprocess.run(
+        [sys.executable, '-m', 'pseudomat.cli', '--profile-file', str(path), 'keys', 'prefill', '0'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, universal_newlines=True
+    )
+    assert rv.returncode == 0, rv.stderr
+    assert "Profile written to %s" % path in rv.stderr
+    assert any(function == 'keys_prefill' for _file, _line, function in pstats.Stats(str(path)).stats)
+
+    # Without a file, the flag mustn’t swallow the command:
+    rv = subprocess.run(
+        [sys.executable, '-m', 'pseudomat.cli', '--profile', 'keys', 'prefill', '0'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, universal_newlines=True
+    )
+    assert rv.returncode == 0, rv.stderr
+    path = rv.stderr.split("Profile written to ")[1].strip()
+    assert '-keys-prefill.prof' in path
+    assert any(function == 'keys_prefill' for _file, _line, function in pstats.Stats(path).stats)
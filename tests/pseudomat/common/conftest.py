@@ -1,13 +1,62 @@
+import contextlib
+import os
 import pathlib
+import uuid
 
 import pytest
+import sqlalchemy as sa
 
 from pseudomat.common import database
 
 
-@pytest.fixture(scope='module')
-def db() -> database:
-    DBNAME = 'pseudomat_tests.sqlite'
-    database.initialize_database(DBNAME)
-    yield database
-    pathlib.Path(DBNAME).unlink()
+@pytest.fixture(scope='session')
+def postgresql_url(tmp_path_factory) -> str:
+    # language=rst
+    """
+    The URL of a PostgreSQL server on which we may create databases: the one in
+    :envvar:`PSEUDOMAT_TEST_POSTGRESQL`, or else a throwaway server started
+    with ``pgserver``, if that’s installed.
+    """
+    url = os.environ.get('PSEUDOMAT_TEST_POSTGRESQL')
+    if url:
+        yield url
+        return
+    pgserver = pytest.importorskip('pgserver')
+    server = pgserver.get_server(tmp_path_factory.mktemp('pgdata'), cleanup_mode='stop')
+    yield server.get_uri()
+    server.cleanup()
+
+
+@contextlib.contextmanager
+def _postgresql_database(server_url: str):
+    url = sa.engine.url.make_url(server_url)
+    admin = sa.create_engine(url, isolation_level='AUTOCOMMIT')
+    dbname = 'pseudomat_tests_%s' % uuid.uuid4().hex
+    admin.execute('create database %s' % dbname)
+    url.database = dbname
+    database.initialize_database(str(url))
+    try:
+        yield database
+    finally:
+        database.teardown_database()
+        admin.execute('drop database %s' % dbname)
+        admin.dispose()
+
+
+@pytest.fixture(scope='module', params=['sqlite', 'postgresql'])
+def db(request) -> database:
+    if request.param == 'sqlite':
+        DBNAME = 'pseudomat_tests.sqlite'
+        database.initialize_database(DBNAME)
+        yield database
+        database.teardown_database()
+        pathlib.Path(DBNAME).unlink()
+        return
+    with _postgresql_database(request.getfixturevalue('postgresql_url')):
+        yield database
+
+
+@pytest.fixture
+def postgresql_db(postgresql_url) -> database:
+    with _postgresql_database(postgresql_url):
+        yield database
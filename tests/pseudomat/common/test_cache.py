@@ -0,0 +1,14 @@
+from pseudomat.common.cache import LRUCache
+
+
+def test_lru_cache():
+    cache = LRUCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)  # evicts 'b', the least recently used
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+    cache.invalidate('c')
+    assert cache.get('c', 'default') == 'default'
+    assert cache.stats() == {'hits': 2, 'misses': 2, 'size': 1, 'maxsize': 2}
@@ -0,0 +1,99 @@
+import time
+
+from jwcrypto import jwk
+import pytest
+
+from pseudomat.common import chain, fingerprint, json_dumps, json_loads
+
+
+def _add_invite(db, jose, project_key: jwk.JWK, project_id: str, sub: str) -> str:
+    jti = fingerprint([project_id, sub])
+    jws = jose.sign({'jti': jti, 'iss': project_id, 'sub': sub, 'iat': int(time.time())}, 'pinvite', project_key)
+    assert db.create_invite(jti, project_id, sub, 'isig', 'ienc', jws) is True
+    return jti
+
+
+def test_verify_chain(db, jose, monkeypatch):
+    project_key = jwk.JWK.generate(kty='OKP', crv='Ed448', use='sig')
+    project_id = fingerprint('ChainProject')
+    assert db.create_project(
+        jti=project_id, sub='ChainProject', iss='pieter@djinnit.com',
+        psig=json_dumps(json_loads(project_key.export_public())), penc='penc', jws='project'
+    ) is True
+    verified = []
+    verify_entry = chain.verify_entry
+    monkeypatch.setattr(chain, 'verify_entry', lambda *args: verified.append(args[1]) or verify_entry(*args))
+
+    assert chain.verify_chain(project_id) == chain.Checkpoint.start(project_id)
+    jtis = [_add_invite(db, jose, project_key, project_id, 'Invitee%d' % i) for i in range(3)]
+    checkpoint = chain.verify_chain(project_id)
+    assert checkpoint.jti == jtis[-1] and checkpoint.length == 3
+    assert chain.load_checkpoint(project_id) == checkpoint
+    assert verified == jtis
+
+    # Only new entries are verified:
+    verified.clear()
+    jtis.append(_add_invite(db, jose, project_key, project_id, 'Invitee3'))
+    assert chain.verify_chain(project_id).length == 4
+    assert verified == jtis[3:]
+    verified.clear()
+    assert chain.verify_chain(project_id).length == 4
+    assert verified == []
+    assert chain.verify_chain(project_id, full=True).length == 4
+    assert verified == jtis
+
+    # Rewriting verified history goes unnoticed until a full verification:
+    member_jws = db.metadata().tables['member_jws']
+    forged = jose.sign({'jti': jtis[1], 'iss': project_id, 'sub': 'Forged', 'iat': 0}, 'pinvite', project_key)
+    db._engine.execute(member_jws.update().where(member_jws.c.jti == jtis[1]).values(jws=forged))
+    assert chain.verify_chain(project_id).length == 4
+    with pytest.raises(chain.ChainError, match='checkpoint'):
+        chain.verify_chain(project_id, full=True)
+
+    # A bad signature on a new entry:
+    other_key = jwk.JWK.generate(kty='OKP', crv='Ed448', use='sig')
+    _add_invite(db, jose, other_key, project_id, 'Invitee4')
+    with pytest.raises(chain.ChainError, match='invalid signature'):
+        chain.verify_chain(project_id)
+
+    assert db.delete_project(project_id) is True
+    assert chain.load_checkpoint(project_id) is None
+    with pytest.raises(chain.ChainError, match='not found'):
+        chain.verify_chain(project_id)
+
+
+def test_verify_chain_replaced_checkpoint(db, jose, monkeypatch):
+    project_key = jwk.JWK.generate(kty='OKP', crv='Ed448', use='sig')
+    project_id = fingerprint('ReplacedChainProject')
+    assert db.create_project(
+        jti=project_id, sub='ReplacedChainProject', iss='pieter@djinnit.com',
+        psig=json_dumps(json_loads(project_key.export_public())), penc='penc', jws='project'
+    ) is True
+    jtis = [_add_invite(db, jose, project_key, project_id, 'Invitee%d' % i) for i in range(3)]
+    assert chain.verify_chain(project_id).length == 3
+
+    # The entry of the checkpoint is replaced by one with the same id:
+    assert db.delete_invite(jtis[-1]) is True
+    time.sleep(1)  # For another 'iat'
+    assert _add_invite(db, jose, project_key, project_id, 'Invitee2') == jtis[-1]
+    verified = []
+    verify_entry = chain.verify_entry
+    monkeypatch.setattr(chain, 'verify_entry', lambda *args: verified.append(args[1]) or verify_entry(*args))
+    with pytest.raises(chain.ChainError, match='checkpoint'):
+        chain.verify_chain(project_id)
+    assert verified == jtis
+
+    # A checkpoint without the digest of its entry, as stored by an earlier
+    # version, can’t be checked either:
+    assert db.delete_project(project_id) is True
+    assert db.create_project(
+        jti=project_id, sub='ReplacedChainProject', iss='pieter@djinnit.com',
+        psig=json_dumps(json_loads(project_key.export_public())), penc='penc', jws='project'
+    ) is True
+    jtis = [_add_invite(db, jose, project_key, project_id, 'Invitee%d' % i) for i in range(2)]
+    checkpoint = chain.verify_chain(project_id)
+    chain.store_checkpoint(project_id, checkpoint[:3])
+    verified.clear()
+    assert chain.verify_chain(project_id) == checkpoint
+    assert verified == jtis
+    assert db.delete_project(project_id) is True
@@ -0,0 +1,95 @@
+import enum
+import json
+import uuid
+
+import pytest
+
+from pseudomat import common
+from pseudomat.common import codec
+
+hypothesis = pytest.importorskip('hypothesis')
+from hypothesis import given, settings, strategies as st  # noqa: E402
+
+FAST_BACKENDS = sorted(set(codec.BACKENDS) - {'json'})
+if not FAST_BACKENDS:
+    pytest.skip("No fast backend installed.", allow_module_level=True)
+
+# Any character, including lone surrogates and the DEL character:
+TEXT = st.text(st.characters(blacklist_categories=()))
+SCALARS = st.none() | st.booleans() | st.integers() | st.floats() | TEXT
+JSON = st.recursive(
+    SCALARS,
+    lambda children: st.lists(children) | st.tuples(children, children) | st.dictionaries(TEXT, children),
+    max_leaves=50
+)
+
+
+def reference(o) -> bytes:
+    return json.dumps(o, separators=(',', ':'), sort_keys=True).encode('ascii')
+
+
+def outcome(dumps, o):
+    try:
+        return dumps(o)
+    except Exception as e:
+        return type(e)
+
+
+@pytest.mark.parametrize('backend', FAST_BACKENDS)
+@settings(max_examples=200, deadline=None)
+@given(o=JSON)
+def test_identical(backend, o):
+    assert codec.BACKENDS[backend](o) == reference(o)
+
+
+@pytest.mark.parametrize('backend', FAST_BACKENDS)
+@settings(deadline=None)
+@given(o=st.dictionaries(st.integers() | TEXT | st.booleans() | st.none(), st.integers()))
+def test_identical_keys(backend, o):
+    # Non-string keys, which the reference converts or refuses to sort:
+    assert outcome(codec.BACKENDS[backend], o) == outcome(reference, o)
+
+
+class Color(enum.Enum):
+    RED = 1
+
+
+class Number(enum.IntEnum):
+    ONE = 1
+
+
+@pytest.mark.parametrize('backend', FAST_BACKENDS)
+@pytest.mark.parametrize('o', [
+    {'a': Number.ONE},
+    [Color.RED],
+    {'id': uuid.UUID(int=0)},
+    [2 ** 64, -2 ** 63 - 1],
+    {'nan': float('nan'), 'inf': float('inf'), 'big': 1e16},
+    'Holá \x7f \U0001f600 \ud800',
+], ids=['intenum', 'enum', 'uuid', 'int64', 'floats', 'non-ascii'])
+def test_edge_cases(backend, o):
+    assert outcome(codec.BACKENDS[backend], o) == outcome(reference, o)
+
+
+def test_deeply_nested():
+    o = []
+    for _ in range(300):
+        o = [o]
+    for backend in FAST_BACKENDS:
+        assert codec.BACKENDS[backend](o) == reference(o)
+
+
+def test_set_backend():
+    payload = {'sub': 'Holá', 'iat': 1567792282, 'psig': {'kty': 'OKP', 'crv': 'Ed448'}}
+    try:
+        fingerprints = set()
+        for backend in codec.BACKENDS:
+            codec.set_backend(backend)
+            assert codec.backend() == backend
+            assert common.json_dumps(payload) == reference(payload).decode('ascii')
+            fingerprints.add(common.fingerprint(payload))
+        assert len(fingerprints) == 1
+        with pytest.raises(KeyError):
+            codec.set_backend('simplejson')
+    finally:
+        codec.set_backend()
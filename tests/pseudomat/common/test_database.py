@@ -1,4 +1,6 @@
-from pseudomat.common import fingerprint
+import sqlalchemy as sa
+
+from pseudomat.common import b64encode, fingerprint, public_keys
 
 
 def test_project(db):
@@ -52,3 +54,120 @@ def test_config(db):
     assert db.get_config('foo') == 'baz'
     db.set_config('foo', None)
     assert db.get_config('foo') is None
+
+
+def test_invite(db):
+    project_id = fingerprint("TestProject2")
+    assert db.create_project(
+        jti=project_id, sub="TestProject2", iss='pieter@djinnit.com',
+        psig='psig2', penc='penc2', jws='project'
+    ) is True
+    jti1 = fingerprint([project_id, 'Invitee1'])
+    jti2 = fingerprint([project_id, 'Invitee2'])
+    assert db.create_invite(jti1, project_id, 'Invitee1', 'isig1', 'ienc1', 'invite1') is True
+    assert db.create_invite(jti1, project_id, 'Invitee1', 'isig1', 'ienc1', 'invite1') is True
+    assert db.create_invite(jti1, project_id, 'Invitee1', 'isig1', 'ienc1', 'other') is False
+    assert db.create_invite(jti2, project_id, 'INVITEE1', 'isig2', 'ienc2', 'invite2') is False
+    assert db.create_invite(jti2, project_id, 'Invitee2', 'isig2', 'ienc2', 'invite2') is True
+    assert db.delete_project(project_id) is True
+
+
+def test_project_key(db):
+    from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+    from jwcrypto import jwk
+    key = jwk.JWK.generate(kty='OKP', crv='Ed448', use='sig')
+    project_id = fingerprint("TestProject3")
+    assert db.create_project(
+        jti=project_id, sub="TestProject3", iss='pieter@djinnit.com',
+        psig=key.export_public(), penc='penc3', jws='project'
+    ) is True
+    public_keys.clear()
+    x = db.get_project_key(project_id).public_bytes(Encoding.Raw, PublicFormat.Raw)
+    assert b64encode(x) == key['x']
+    assert db.get_project_key(project_id) is db.get_project_key(project_id)
+    assert public_keys.stats()['misses'] == 1
+    assert public_keys.stats()['hits'] == 2
+    assert db.delete_project(project_id) is True
+    assert db.get_project_key(project_id) is None
+
+    # Deleted and created again with another key, as by another process,
+    # without invalidating the cache:
+    other = jwk.JWK.generate(kty='OKP', crv='Ed448', use='sig')
+    assert db.create_project(
+        jti=project_id, sub="TestProject3", iss='pieter@djinnit.com',
+        psig=other.export_public(), penc='penc3', jws='project'
+    ) is True
+    x = db.get_project_key(project_id).public_bytes(Encoding.Raw, PublicFormat.Raw)
+    assert b64encode(x) == other['x']
+    assert db.delete_project(project_id) is True
+
+
+def test_member_deletion(db):
+    project_id = fingerprint("TestProject4")
+    assert db.create_project(
+        jti=project_id, sub="TestProject4", iss='pieter@djinnit.com',
+        psig='psig4', penc='penc4', jws='project'
+    ) is True
+    jti = fingerprint([project_id, 'Invitee1'])
+    assert db.create_invite(jti, project_id, 'Invitee1', 'isig4', 'ienc4', 'invite4') is True
+    member_jws = db.metadata().tables['member_jws']
+    count = sa.select([sa.func.count()]).select_from(member_jws).where(member_jws.c.jti == jti)
+    assert db._engine.execute(count).scalar() == 1
+    # Cascades to the member, whose trigger deletes the member’s JWSs:
+    assert db.delete_project(project_id) is True
+    assert db._engine.execute(count).scalar() == 0
+
+
+def test_compiled_cache(db):
+    cache = db._engine.get_execution_options()['compiled_cache']
+    db.get_project('Nonexistent project')
+    db.get_config('foo')
+    size = len(cache)
+    for _ in range(3):
+        db.get_project('Nonexistent project')
+        db.get_config('foo')
+    assert len(cache) == size
+
+
+def test_iter_members(db):
+    project_id = fingerprint("TestProject5")
+    assert db.create_project(
+        jti=project_id, sub="TestProject5", iss='pieter@djinnit.com',
+        psig='psig5', penc='penc5', jws='project5'
+    ) is True
+    assert db.get_member_chain_tail(project_id) is None
+    assert db.get_member_chain_state(project_id)['chain_tail'] is None
+    jtis = []
+    for i in range(5):
+        jti = fingerprint([project_id, 'Invitee%d' % i])
+        assert db.create_invite(jti, project_id, 'Invitee%d' % i, 'isig', 'ienc', 'invite%d' % i) is True
+        assert db.get_member_chain_tail(project_id) == {'jti': jti, 'jws': 'invite%d' % i}
+        assert db.get_member_chain_state(project_id)['chain_tail'] == jti
+        jtis.append(jti)
+    # Deleting the last invite moves the tail back:
+    jti = fingerprint([project_id, 'Invitee5'])
+    assert db.create_invite(jti, project_id, 'Invitee5', 'isig', 'ienc', 'invite5') is True
+    assert db.delete_invite(jti) is True
+    assert db.get_member_chain_tail(project_id) == {'jti': jtis[-1], 'jws': 'invite4'}
+    jtis.sort()
+    members = list(db.iter_members(project_id, 10))
+    assert [m['jti'] for m in members] == jtis
+    assert members[0]['invite'] == 'invite%d' % int(members[0]['sub'][-1])
+    assert members[0]['member'] is None and members[0]['revoke'] is None
+    assert [m['jti'] for m in db.iter_members(project_id, 2, after=jtis[1])] == jtis[2:4]
+    # Closing the generator early releases its connection:
+    members = db.iter_members(project_id, 10)
+    next(members)
+    members.close()
+    assert db.delete_project(project_id) is True
+
+
+def test_compare_and_set_config(db):
+    assert db.compare_and_set_config('lock', None, '1') is True
+    assert db.compare_and_set_config('lock', None, '2') is False
+    assert db.compare_and_set_config('lock', '2', '3') is False
+    assert db.compare_and_set_config('lock', '1', '3') is True
+    assert db.get_config('lock') == '3'
+    assert db.compare_and_set_config('lock', '3', None) is True
+    assert db.get_config('lock') is None
+
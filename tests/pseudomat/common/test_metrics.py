@@ -0,0 +1,34 @@
+import pytest
+
+from pseudomat.common import metrics
+
+
+def test_histogram():
+    histogram = metrics.Histogram('test_seconds', "A test.", ('stage',), buckets=(0.1, 1.0))
+    histogram.observe(0.05, 'a')
+    histogram.observe(0.1, 'a')
+    histogram.observe(5, 'a')
+    histogram.observe(0.5, 'b"\n')
+    assert histogram.render() == [
+        '# HELP test_seconds A test.',
+        '# TYPE test_seconds histogram',
+        'test_seconds_bucket{stage="a",le="0.1"} 2',
+        'test_seconds_bucket{stage="a",le="1.0"} 2',
+        'test_seconds_bucket{stage="a",le="+Inf"} 3',
+        'test_seconds_sum{stage="a"} 5.15',
+        'test_seconds_count{stage="a"} 3',
+        'test_seconds_bucket{stage="b\\"\\n",le="0.1"} 0',
+        'test_seconds_bucket{stage="b\\"\\n",le="1.0"} 1',
+        'test_seconds_bucket{stage="b\\"\\n",le="+Inf"} 1',
+        'test_seconds_sum{stage="b\\"\\n"} 0.5',
+        'test_seconds_count{stage="b\\"\\n"} 1',
+    ]
+
+
+def test_stage():
+    before = metrics.STAGE_SECONDS.count('test')
+    with pytest.raises(ZeroDivisionError):
+        with metrics.stage('test'):
+            1 / 0
+    assert metrics.STAGE_SECONDS.count('test') == before + 1
+    assert 'pseudomat_stage_duration_seconds_count{stage="test"}' in metrics.REGISTRY.render()
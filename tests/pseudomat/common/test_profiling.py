@@ -0,0 +1,26 @@
+import pstats
+
+import pytest
+
+from pseudomat.common import profiling
+
+
+def _work():
+    return sum(range(1000))
+
+
+def test_dump(tmp_path):
+    paths = []
+    for i in range(4):
+        profile = profiling.start()
+        _work()
+        profile.disable()
+        paths.append(profiling.dump(profile, tmp_path / 'profiles', ['GET', '/<project_id>', 'x' * i], max_files=3))
+    assert paths[-1].name.endswith('-GET-project_id-xxx.prof')
+    # Only the most recent ones are kept:
+    assert sorted(p.name for p in (tmp_path / 'profiles').iterdir()) == sorted(p.name for p in paths[1:])
+    stats = pstats.Stats(str(paths[-1]))
+    assert any(function == '_work' for _file, _line, function in stats.stats)
+
+    with pytest.raises(ValueError):
+        profiling.dump(profile, tmp_path / 'profiles', ['GET'], max_files=0)
@@ -0,0 +1,119 @@
+import copy
+
+import pytest
+import werkzeug.exceptions as exc
+
+from pseudomat.common import schemas
+
+PSIG = {'crv': 'Ed448', 'kty': 'OKP', 'use': 'sig', 'x': 'pzmndVb_xGVrDjh2WzsuBHGSVcnJSq5h15TFv3kb7rPu'}
+PENC = {'crv': 'X448', 'kty': 'OKP', 'use': 'enc', 'x': 'xC_JdcWExWa2_oefpOA5GIrs1OzX23Wq_vE5KNZz7z5e'}
+VALID = {
+    'jti': 'UeOOzJL1KvY_YtoZkG0lYabXERDXPl_1',
+    'iss': 'pieter@djinnit.com',
+    'sub': 'My Project',
+    'iat': 1567792282,
+    'psig': PSIG,
+    'penc': PENC,
+}
+INVITE = {
+    'jti': 'g7Vh2UyuD0oWyqKA8nIlUNA6Fv-1eV_j',
+    'iss': VALID['jti'],
+    'sub': 'Supplier',
+    'iat': 1567792290,
+    'psig': PSIG,
+    'penc': PENC,
+}
+SECRET_INVITE = dict(INVITE, ssig=dict(PSIG, d='secret'), senc=dict(PENC, d='secret'))
+
+
+def _variants(valid: dict):
+    yield valid
+    yield 'not an object'
+    yield []
+    yield {}
+    yield None
+    for claim in valid:
+        p = copy.deepcopy(valid)
+        del p[claim]
+        yield p
+    for claim, value in [
+        ('iat', True), ('iat', 1.0), ('iat', 1.5), ('iat', '1'), ('iat', -1), ('iat', 2 ** 64), ('iss', ''),
+        ('iss', 'x' * 81), ('iss', 'x' * 80), ('iss', 1), ('sub', 1), ('sub', ''), ('jti', None), ('jti', []),
+        ('psig', PENC), ('penc', PSIG), ('psig', 'key'), ('psig', [PSIG]), ('penc', None), ('foo', 'bar'),
+        ('ssig', 'key'), ('senc', PENC),
+    ]:
+        p = copy.deepcopy(valid)
+        p[claim] = value
+        yield p
+    for claim in ('psig', 'penc', 'ssig', 'senc'):
+        if claim not in valid:
+            continue
+        for key, value in [('kty', 'EC'), ('kty', 1), ('use', None), ('crv', 'P-256'), ('x', 1), ('d', 1),
+                           ('extra', 'allowed')]:
+            p = copy.deepcopy(valid)
+            p[claim][key] = value
+            yield p
+        for key in ('kty', 'crv', 'use', 'x', 'd'):
+            if key in valid[claim]:
+                p = copy.deepcopy(valid)
+                del p[claim][key]
+                yield p
+    p = copy.deepcopy(valid)
+    p['ssig'] = dict(PSIG, d='secret')
+    p['senc'] = dict(PENC, d='secret')
+    yield p
+
+
+@pytest.mark.parametrize('jws_type', sorted(schemas.SCHEMAS))
+@pytest.mark.parametrize('valid', [VALID, INVITE, SECRET_INVITE], ids=['project', 'invite', 'secret invite'])
+def test_fast_path_matches_jsonschema(jws_type, valid):
+    schemas.initialize_validators()
+    compiled = schemas._validators[jws_type]
+    assert compiled.fast is not None
+    for instance in _variants(valid):
+        expected = compiled.validator.is_valid(instance)
+        assert compiled.fast(instance) is expected, instance
+
+
+@pytest.mark.parametrize('jws_type, valid', [('project', VALID), ('pinvite', INVITE)])
+def test_fast_path_rejects(jws_type, valid):
+    schemas.initialize_validators()
+    compiled = schemas._validators[jws_type]
+    verdicts = [compiled.fast(instance) for instance in _variants(valid)]
+    assert verdicts[0] is True
+    # Missing and extra claims, and claims of the wrong type:
+    assert verdicts.count(False) > len(valid) + 10
+
+
+@pytest.mark.parametrize('jws_type', sorted(schemas.SCHEMAS))
+def test_validate_schema_fast_path(jws_type):
+    # validate_schema() raises the same errors with and without the fast path:
+    def errors(fast_path):
+        schemas.initialize_validators(fast_path=fast_path)
+        retval = []
+        for instance in _variants(INVITE):
+            try:
+                schemas.validate_schema(instance, jws_type)
+            except exc.UnprocessableEntity as e:
+                retval.append(e.description)
+            else:
+                retval.append(None)
+        return retval
+
+    try:
+        assert errors(True) == errors(False)
+    finally:
+        schemas.initialize_validators()
+
+
+def test_validate_schema():
+    schemas.initialize_validators()
+    schemas.validate_schema(VALID, 'project')
+    with pytest.raises(exc.UnprocessableEntity):
+        schemas.validate_schema(dict(VALID, iat='now'), 'project')
+    with pytest.raises(exc.UnprocessableEntity):
+        schemas.validate_schema(VALID, 'unknown')
+
+
+def test_generate_validator_unsupported():
+    assert schemas.generate_validator({'type': 'array', 'items': {'type': 'string'}}) is None
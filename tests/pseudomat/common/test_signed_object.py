@@ -0,0 +1,102 @@
+# language=rst
+"""
+Conformance of :class:`pseudomat.common.SignedObject` with jwcrypto, which is
+the reference implementation for everything the server verifies.
+"""
+
+from cryptography.exceptions import InvalidSignature
+from jwcrypto import jwk, jws
+import pytest
+
+from pseudomat import common
+
+CURVES = ['Ed25519', 'Ed448']
+
+
+def _jwcrypto_result(token: str, key: jwk.JWK) -> str:
+    try:
+        jws.JWS().deserialize(token, key, alg='EdDSA')
+    except jws.InvalidJWSObject:
+        return 'syntax'
+    except jws.InvalidJWSSignature:
+        return 'signature'
+    return 'valid'
+
+
+def _native_result(token: str, key: jwk.JWK) -> str:
+    try:
+        decoder = common.SignedObject(token)
+    except ValueError:
+        return 'syntax'
+    try:
+        decoder.validate(common.load_public_jwk(key.export_public()))
+    except InvalidSignature:
+        return 'signature'
+    return 'valid'
+
+
+def _sign(key: jwk.JWK, payload: bytes, header: dict) -> str:
+    token = jws.JWS(payload=payload)
+    token.add_signature(key, protected=common.json_dumps(header))
+    return token.serialize(compact=True)
+
+
+def _tamper(s: str) -> str:
+    return s[:-1] + ('A' if s[-1] != 'A' else 'B')
+
+
+def _variants(key: jwk.JWK, other_key: jwk.JWK):
+    payload = common.json_dumps({'sub': 'My Project', 'iat': 1567792282}).encode('utf-8')
+    header = {'alg': 'EdDSA', 'typ': 'project'}
+    token = _sign(key, payload, header)
+    h, p, s = token.split('.')
+    yield token
+    yield _sign(key, b'not json', header)
+    yield _sign(key, payload, {'alg': 'EdDSA'})
+    yield _sign(other_key, payload, header)
+    yield '.'.join([h, p, _tamper(s)])
+    yield '.'.join([h, _tamper(p), s])
+    yield '.'.join([h, p])
+    yield '.'.join([h, p, s, s])
+    yield '.'.join([h, p, s + '!'])
+    yield '.'.join([h, p, s[:-1]])
+    yield '.'.join([common.b64encode(b'not json'), p, s])
+    yield '.'.join([common.b64encode(b'[]'), p, s])
+    yield '.'.join([common.b64encode(b'{"alg":"none"}'), p, ''])
+    yield '.'.join([common.b64encode(b'{"alg":"ES256"}'), p, s])
+    yield common.SignedObject.create({'foo': 'bar'}, _private_key(key), 'project')
+    yield common.SignedObject.create(b'raw payload', _private_key(key), None)
+
+
+def _private_key(key: jwk.JWK):
+    # Convert a jwcrypto key into the corresponding `cryptography` key:
+    return key._get_private_key()
+
+
+@pytest.mark.parametrize('crv', CURVES)
+@pytest.mark.parametrize('other_crv', CURVES)
+def test_conformance(crv, other_crv):
+    key = jwk.JWK.generate(kty='OKP', crv=crv, use='sig')
+    other_key = jwk.JWK.generate(kty='OKP', crv=other_crv, use='sig')
+    for token in _variants(key, other_key):
+        assert _native_result(token, key) == _jwcrypto_result(token, key), token
+
+
+def test_missing_alg():
+    # jwcrypto accepts a missing "alg" header if the caller specifies the
+    # algorithm. RFC 7515 requires the header, and so do we.
+    key = jwk.JWK.generate(kty='OKP', crv='Ed448', use='sig')
+    signee = common.b64encode(b'{"typ":"project"}') + '.' + common.b64encode(b'payload')
+    token = signee + '.' + common.b64encode(_private_key(key).sign(signee.encode('ascii')))
+    assert _jwcrypto_result(token, key) == 'valid'
+    assert _native_result(token, key) == 'signature'
+
+
+def test_load_public_jwk():
+    for crv in ('Ed25519', 'Ed448', 'X25519', 'X448'):
+        key = jwk.JWK.generate(kty='OKP', crv=crv)
+        assert common.load_public_jwk(key.export_public()) is \
+            common.load_public_jwk(common.json_loads(key.export_public()))
+    for invalid in ('{}', '[]', '{"kty":"OKP","crv":"P-256","x":"AAAA"}', '{"kty":"OKP","crv":"Ed448","x":"AAAA"}'):
+        with pytest.raises(ValueError):
+            common.load_public_jwk(invalid)
@@ -0,0 +1,89 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import sqlalchemy as sa
+
+from pseudomat.common import database, fingerprint
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    database.initialize_database(tmp_path / 'concurrent.sqlite', 'concurrent')
+    yield database
+    database.teardown_database()
+
+
+@pytest.fixture(params=['sqlite_db', 'postgresql_db'])
+def concurrent_db(request):
+    return request.getfixturevalue(request.param)
+
+
+def test_pragmas(sqlite_db):
+    with database._engine.connect() as c:
+        assert c.execute("PRAGMA journal_mode").scalar() == 'wal'
+        assert c.execute("PRAGMA synchronous").scalar() == 1  # NORMAL
+        assert c.execute("PRAGMA busy_timeout").scalar() == 5000
+        assert c.execute("PRAGMA cache_size").scalar() == -16384
+        assert c.execute("PRAGMA foreign_keys").scalar() == 1
+
+
+def test_concurrent_writes(concurrent_db):
+    project_id = fingerprint('Concurrent project')
+    assert concurrent_db.create_project(
+        jti=project_id, iss='owner@example.com', sub='Concurrent project',
+        psig='psig', penc='penc', jws='jws'
+    )
+
+    def work(n: int):
+        # Reads, then writes, in a single transaction:
+        sub = 'Member %d' % n
+        assert concurrent_db.create_invite(
+            jti=fingerprint([project_id, sub]), iss=project_id, sub=sub,
+            psig='psig %d' % n, penc='penc %d' % n, jws='jws %d' % n
+        )
+        assert concurrent_db.get_project(project_id) is not None
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(work, range(64)))
+    member_jws = database.metadata().tables['member_jws']
+    with database._engine.connect() as c:
+        # The member chain is still a single chain:
+        assert c.execute(
+            sa.select([sa.func.count(sa.distinct(member_jws.c.prev_jti))])
+        ).scalar() == 64
+    assert concurrent_db.delete_project(project_id)
+
+
+def test_upgrade_schema_1(tmp_path):
+    path = tmp_path / 'schema1.sqlite'
+    ddl = database._DDL_SQLITE \
+        .replace('jws text not null,\n    chain_tail char(32),\n    modified integer\n', 'jws text not null\n') \
+        .replace("('schema', '2')", "('schema', '1')")
+    engine = sa.create_engine('sqlite:///%s' % path)
+    with engine.begin() as c:
+        for stmt in ddl.split(';;'):
+            c.execute(stmt)
+        project_ids = [fingerprint('Project %d' % i) for i in range(2)]
+        for i, project_id in enumerate(project_ids):
+            c.execute("insert into project (jti, sub, iss, psig, penc, jws) values (?, ?, 'iss', ?, ?, 'jws')",
+                      project_id, 'Project %d' % i, 'psig%d' % i, 'penc%d' % i)
+        prev_jti = project_ids[0]
+        for i in range(3):
+            jti = fingerprint([project_ids[0], 'Invitee%d' % i])
+            c.execute("insert into member_jws (jti, jws, prev_jti) values (?, 'jws', ?)", jti, prev_jti)
+            c.execute("insert into member (project_jti, invite_jti, invite_sub, invite_sig, invite_enc) "
+                      "values (?, ?, ?, 'isig', 'ienc')", project_ids[0], jti, 'Invitee%d' % i)
+            prev_jti = jti
+    engine.dispose()
+
+    database.initialize_database(path)
+    try:
+        assert database.get_config('schema') == database.SCHEMA_VERSION
+        assert database.get_member_chain_state(project_ids[0])['chain_tail'] == prev_jti
+        assert database.get_member_chain_state(project_ids[1])['chain_tail'] is None
+        assert database.get_member_chain_state(project_ids[1])['modified'] is not None
+        jti = fingerprint([project_ids[0], 'Invitee3'])
+        assert database.create_invite(jti, project_ids[0], 'Invitee3', 'isig', 'ienc', 'jws3') is True
+        assert [e['jti'] for e in database.iter_member_chain(project_ids[0])][-2:] == [prev_jti, jti]
+    finally:
+        database.teardown_database()
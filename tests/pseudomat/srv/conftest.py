@@ -1,20 +1,95 @@
+import asyncio
 import pathlib
+
 import pytest
+import werkzeug
+
+from pseudomat.srv import batch, create_app
 
-from pseudomat.srv import create_app
+BACKENDS = ['flask', 'aiohttp']
 
 
-@pytest.fixture(scope="session")
+@pytest.fixture(scope="module")
 def app():
     retval = create_app({
         'DATABASE': 'pseudomatd_test.sqlite'
     })
     yield retval
+    batch.shutdown(retval)
     pathlib.Path(retval.config['DATABASE']).unlink()
 
 
-@pytest.fixture(scope="session")
-def client(app):
+@pytest.fixture(scope="module")
+def flask_client(app):
     app.config['TESTING'] = True
     with app.test_client() as client:
         yield client
+
+
+class AioClient(object):
+    # language=rst
+    """
+    Just enough of Flask’s test client to run the same tests against the
+    aiohttp app. Responses are :class:`werkzeug.wrappers.Response` objects.
+    """
+
+    def __init__(self, app):
+        from aiohttp.test_utils import TestClient, TestServer
+        self._loop = asyncio.new_event_loop()
+
+        async def start():
+            client = TestClient(TestServer(app))
+            await client.start_server()
+            return client
+        self._client = self._loop.run_until_complete(start())
+
+    def open(self, path: str, method: str, data=None, content_type=None, headers=None):
+        headers = dict(headers or {}, Host='localhost')
+        if content_type is not None:
+            headers['Content-Type'] = content_type
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        # Flask’s test client doesn’t send a Content-Length without data:
+        chunked = True if data is None and method != 'GET' else None
+
+        async def request():
+            async with self._client.request(
+                method, path, data=data, headers=headers, chunked=chunked
+            ) as rv:
+                return werkzeug.wrappers.Response(await rv.read(), rv.status, list(rv.headers.items()))
+        return self._loop.run_until_complete(request())
+
+    def get(self, path: str, **kwargs):
+        return self.open(path, 'GET', **kwargs)
+
+    def post(self, path: str, **kwargs):
+        return self.open(path, 'POST', **kwargs)
+
+    def put(self, path: str, **kwargs):
+        return self.open(path, 'PUT', **kwargs)
+
+    def delete(self, path: str, **kwargs):
+        return self.open(path, 'DELETE', **kwargs)
+
+    def close(self):
+        self._loop.run_until_complete(self._client.close())
+        self._loop.close()
+
+
+@pytest.fixture(scope="module", params=BACKENDS)
+def client(request):
+    # language=rst
+    """
+    A client for each backend, each with its own database.
+    """
+    if request.param == 'flask':
+        yield request.getfixturevalue('flask_client')
+        return
+    pytest.importorskip('aiohttp')
+    from pseudomat.srv import aio
+    retval = AioClient(aio.create_app({
+        'DATABASE': 'pseudomatd_aio_test.sqlite'
+    }))
+    yield retval
+    retval.close()
+    pathlib.Path('pseudomatd_aio_test.sqlite').unlink()
@@ -0,0 +1,98 @@
+import json
+
+
+def _post_batch(flask_client, operations):
+    return flask_client.post(
+        path='/batch',
+        data=json.dumps(operations),
+        content_type='application/json'
+    )
+
+
+def test_batch_unsupported_media_type(flask_client):
+    rv = flask_client.post(path='/batch', data='[]', content_type='application/jose')
+    assert rv.status_code == 415
+
+
+def test_batch_not_an_array(flask_client):
+    rv = _post_batch(flask_client, {'method': 'POST'})
+    assert rv.status_code == 400
+
+
+def test_batch(flask_client, jose):
+    key, project_id, project_jws = jose.project('Batch project')
+    invites = [jose.invite(key, project_id, 'Supplier %d' % i) for i in range(3)]
+    operations = [{'method': 'POST', 'path': '/', 'body': project_jws}]
+    operations += [
+        {'method': 'PUT', 'path': '/%s/invites/%s' % (project_id, invite_id), 'body': invite_jws}
+        for invite_id, invite_jws in invites
+    ]
+    operations += [
+        {'method': 'PUT', 'path': '/%s/invites/%s' % (project_id, invites[1][0]), 'body': invites[0][1]},
+        {'method': 'GET', 'path': '/'},
+        {'method': 'POST', 'path': '/', 'body': project_jws[:-4] + 'AAAA'},
+        {'method': 'DELETE', 'path': '/%s' % project_id, 'authorization': 'Bearer foo.bar.baz'},
+    ]
+    rv = _post_batch(flask_client, operations)
+    assert rv.status_code == 200
+    results = rv.get_json()
+    assert [r['status'] for r in results] == [201, 201, 201, 201, 403, 405, 422, 400]
+    assert results[0]['location'] == '/' + project_id
+    assert results[1]['location'] == '/%s/invites/%s' % (project_id, invites[0][0])
+
+    # Idempotent, so the same operations can be retried:
+    rv = _post_batch(flask_client, operations[:4])
+    assert [r['status'] for r in rv.get_json()] == [201, 201, 201, 201]
+
+    # Cached from now on:
+    assert flask_client.get('/' + project_id).status_code == 200
+    rv = _post_batch(flask_client, [
+        {'method': 'DELETE', 'path': '/%s' % project_id, 'authorization': 'Bearer ' + jose.delete_token(key, project_id)},
+        {'method': 'DELETE', 'path': '/%s' % project_id, 'authorization': 'Bearer ' + jose.delete_token(key, project_id)},
+    ])
+    assert [r['status'] for r in rv.get_json()] == [204, 404]
+    assert flask_client.get('/' + project_id).status_code == 404
+
+
+def test_batch_cannot_take_over_project(flask_client, jose):
+    key, project_id, project_jws = jose.project('Victim project')
+    assert _post_batch(flask_client, [{'method': 'POST', 'path': '/', 'body': project_jws}]).get_json()[0]['status'] \
+        == 201
+
+    # Anyone can sign a project with the same name, and so the same id:
+    other_key, other_id, other_jws = jose.project('Victim project')
+    assert other_id == project_id
+    invite_id, invite_jws = jose.invite(other_key, project_id, 'Intruder')
+    rv = _post_batch(flask_client, [
+        {'method': 'POST', 'path': '/', 'body': other_jws},
+        {'method': 'PUT', 'path': '/%s/invites/%s' % (project_id, invite_id), 'body': invite_jws},
+        {'method': 'DELETE', 'path': '/%s' % project_id,
+         'authorization': 'Bearer ' + jose.delete_token(other_key, project_id)},
+    ])
+    statuses = [r['status'] for r in rv.get_json()]
+    assert statuses[0] == 409
+    assert statuses[1] not in (201, 204) and statuses[2] not in (201, 204)
+    assert flask_client.get('/' + project_id).get_data(as_text=True) == project_jws
+
+    # A project that doesn’t exist yet can’t be used before it’s created:
+    new_key, new_id, new_jws = jose.project('Later project')
+    invite_id, invite_jws = jose.invite(new_key, new_id, 'Early')
+    rv = _post_batch(flask_client, [
+        {'method': 'PUT', 'path': '/%s/invites/%s' % (new_id, invite_id), 'body': invite_jws},
+        {'method': 'POST', 'path': '/', 'body': new_jws},
+    ])
+    assert [r['status'] for r in rv.get_json()] == [404, 201]
+
+
+def test_batch_workers(app, flask_client, jose):
+    from pseudomat.srv import batch
+    workers = app.extensions['pseudomat.batch']
+    batch.shutdown(app)
+    # Only started when there is something to verify:
+    assert _post_batch(flask_client, [{'method': 'GET', 'path': '/'}]).status_code == 200
+    assert workers._executor is None
+    rv = _post_batch(flask_client, [{'method': 'POST', 'path': '/', 'body': jose.project('Workers project')[2]}])
+    assert rv.get_json()[0]['status'] == 201
+    assert workers._executor is not None
+    batch.shutdown(app)
+    assert workers._executor is None
@@ -0,0 +1,34 @@
+def _samples(text: str) -> dict:
+    return dict(
+        line.rsplit(' ', 1) for line in text.splitlines() if line and not line.startswith('#')
+    )
+
+
+def test_metrics(flask_client, jose):
+    # The metrics are process-wide, so other tests count as well:
+    before = _samples(flask_client.get('/metrics').get_data(as_text=True))
+    rv = flask_client.post(path='/', data=jose.project('Metrics project')[2], content_type='application/jose')
+    assert rv.status_code == 201
+    assert flask_client.get(rv.headers['Location']).status_code == 200
+    assert flask_client.get('/no/such/path').status_code == 404
+
+    rv = flask_client.get('/metrics')
+    assert rv.status_code == 200
+    assert rv.content_type == 'text/plain; version=0.0.4; charset=utf-8'
+    after = _samples(rv.get_data(as_text=True))
+
+    def increase(key: str) -> float:
+        return float(after[key]) - float(before.get(key, 0))
+
+    assert increase('pseudomat_http_responses_total{method="POST",route="/",status="201"}') == 1
+    assert increase('pseudomat_http_responses_total{method="GET",route="/<project_id>",status="200"}') == 1
+    assert increase('pseudomat_http_responses_total{method="GET",route="<unmatched>",status="404"}') == 1
+    assert increase('pseudomat_http_responses_total{method="GET",route="/metrics",status="200"}') == 1
+    assert increase('pseudomat_http_request_duration_seconds_count{method="POST",route="/"}') == 1
+    assert increase('pseudomat_http_request_duration_seconds_bucket{method="POST",route="/",le="+Inf"}') == 1
+    assert increase('pseudomat_http_request_duration_seconds_sum{method="POST",route="/"}') > 0
+    for stage in ('upload', 'jws', 'schema', 'jwk', 'signature', 'store'):
+        assert increase('pseudomat_stage_duration_seconds_count{stage="%s"}' % stage) == 1
+    assert increase('pseudomat_db_statement_duration_seconds_count{statement="insert"}') >= 1
+    assert increase('pseudomat_db_statement_duration_seconds_count{statement="select"}') >= 1
+    assert 'pseudomat_cache_hits_total{cache="responses"}' in after
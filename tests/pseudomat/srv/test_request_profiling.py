@@ -0,0 +1,48 @@
+import pytest
+
+from pseudomat.srv import create_app
+
+
+@pytest.fixture
+def make_client(tmp_path):
+    def make_client(**config):
+        app = create_app(dict(
+            config, DATABASE=str(tmp_path / 'pseudomatd.sqlite'), PROFILE_DIR=str(tmp_path / 'profiles')
+        ))
+        app.config['TESTING'] = True
+        return app.test_client()
+    return make_client
+
+
+def test_sample(make_client, tmp_path):
+    client = make_client(PROFILE_SAMPLE_RATE=1.0)
+    assert client.get('/AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA').status_code == 404
+    assert client.get('/').status_code == 405
+    names = sorted(p.name for p in (tmp_path / 'profiles').iterdir())
+    assert len(names) == 2
+    assert any('-GET-project_id-AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA-' in name for name in names)
+
+
+def test_threshold(make_client, tmp_path):
+    client = make_client(PROFILE_THRESHOLD=60.0)
+    assert client.get('/').status_code == 405
+    assert not (tmp_path / 'profiles').exists()
+    client = make_client(PROFILE_THRESHOLD=0.0)
+    assert client.get('/').status_code == 405
+    assert len(list((tmp_path / 'profiles').iterdir())) == 1
+
+
+def test_disabled(make_client, tmp_path):
+    # Neither a sample rate nor a threshold:
+    client = make_client()
+    assert client.get('/').status_code == 405
+    assert not (tmp_path / 'profiles').exists()
+
+
+def test_max_files(make_client, tmp_path):
+    with pytest.raises(ValueError):
+        make_client(PROFILE_SAMPLE_RATE=1.0, PROFILE_MAX_FILES=0)
+    client = make_client(PROFILE_SAMPLE_RATE=1.0, PROFILE_MAX_FILES=1)
+    for _ in range(3):
+        assert client.get('/').status_code == 405
+    assert len(list((tmp_path / 'profiles').iterdir())) == 1